@@ -45,7 +45,8 @@ resource "aws_iam_policy" "s3_access_policy" {
           "s3:DeleteObject",
           "s3:PutObject",
           "s3:GetObject",
-          "s3:ListBucket"
+          "s3:ListBucket",
+          "s3:AbortMultipartUpload"
         ]
         Resource = [
           "arn:aws:s3:::${module.data_s3.data_bucket_name}",
@@ -4,7 +4,12 @@ import os
 import logging
 import uuid
 import base64
+import struct
+import hashlib
 import mimetypes
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from mask_ingest import MASK_DERIVED_PREFIX, THUMBNAIL_FILE, derived_prefix
 
 logger = logging.getLogger()
 logger.setLevel("INFO")
@@ -14,48 +19,251 @@ MQTT_TOPIC = "user-requests"
 S3_DATA_BUCKET = "eoh-data-bucket"
 LOCAL_DOWNLOAD_PATH = "downloads/masks" 
 
+# Presigned uploads: clients PUT straight to S3 and then call the matching complete endpoint
+IMAGE_PREFIX = "images/"
+MASK_PREFIX = "masks/"
+PRESIGNED_URL_EXPIRES = 900  # seconds
+MULTIPART_THRESHOLD = 64 * 1024 * 1024  # files at least this large are uploaded in parts
+MULTIPART_PART_SIZE = 16 * 1024 * 1024  # S3 needs at least 5 MiB for every part but the last
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024 * 1024
+
+# Mask catalogue: a manifest object kept up to date by the mask upload paths
+CATALOGUE_KEY = "catalogue/masks.json"
+CATALOGUE_PAGE_SIZE = 1000
+CATALOGUE_MAX_PAGE_SIZE = 1000
+CATALOGUE_WRITE_ATTEMPTS = 5
+CATALOGUE_REBUILD_WORKERS = 16  # header reads in flight while the manifest is rebuilt
+CATALOGUE_WRITE_CONFLICTS = ("PreconditionFailed", "ConditionalRequestConflict")
+MASK_EXPIRATION_DAYS = 10  # same as the data bucket lifecycle rule in modules/data_s3/s3.tf
+IMAGE_HEADER_BYTES = 64 * 1024  # enough to find the dimensions of any supported image
+
+# Batches: operations that only build an MQTT message, with no side effects of their own, can be sent
+# many at a time. Image uploads write to S3 and go through the presigned endpoints one by one instead.
+BATCH_MAX_OPERATIONS = 100
+BATCH_OPERATIONS = (("POST", "feature"), ("GET", "user"))
+
+# Raised for requests that are malformed rather than failing, answered with 400 instead of 500
+class InvalidRequest(ValueError):
+    pass
+
+# The user and feature end up in MQTT payload keys the batch merge and the edge devices hash
+def _check_names(**values):
+    for name, value in values.items():
+        if not isinstance(value, str):
+            raise InvalidRequest(f"{name} must be a string")
+
 # Initialize AWS clients
 iot_client = boto3.client('iot-data', region_name=os.environ.get("AWS_REGION", "us-east-1"))
 s3_client = boto3.client("s3")
 
-def download_masks_folder(body, path_params):
+# Image width and height read from the first bytes of a PNG, JPEG, GIF, BMP or WebP file
+def _image_dimensions(data):
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:2] == b"BM" and len(data) >= 26:
+        width, height = struct.unpack("<ii", data[18:26])
+        return width, abs(height)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    if data[:2] == b"\xff\xd8":
+        # Walk the JPEG segments until a start-of-frame marker
+        position = 2
+        while position + 9 < len(data):
+            if data[position] != 0xFF:
+                position += 1
+                continue
+            marker = data[position + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                position += 2
+                continue
+            length = struct.unpack(">H", data[position + 2:position + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[position + 5:position + 9])
+                return width, height
+            position += 2 + length
+    return None, None
+
+def _read_header(key):
+    response = s3_client.get_object(Bucket=S3_DATA_BUCKET, Key=key, Range=f"bytes=0-{IMAGE_HEADER_BYTES - 1}")
+    return response["Body"].read()
+
+def _catalogue_entry(key, size, etag, last_modified, header):
+    width, height = _image_dimensions(header)
+    return {
+        "key": key,
+        "url": _public_url(key),
+        "size": size,
+        "etag": etag.strip('"'),
+        "lastModified": last_modified,
+        "width": width,
+        "height": height,
+        "thumbnailKey": None,
+        "alignmentKey": None,
+        "resolutions": {},
+    }
+
+# The bucket's lifecycle rule deletes masks this long after they were written
+def _expired(entry, now):
+    return now - datetime.fromisoformat(entry["lastModified"]) >= timedelta(days=MASK_EXPIRATION_DAYS)
+
+def _drop_expired(catalogue):
+    now = datetime.now(timezone.utc)
+    catalogue["masks"] = {key: entry for key, entry in catalogue["masks"].items() if not _expired(entry, now)}
+    return catalogue
+
+def _write_conflict(error):
+    return error.response["Error"]["Code"] in CATALOGUE_WRITE_CONFLICTS
+
+# Lists every mask (following continuation tokens) and writes a fresh manifest
+def _rebuild_catalogue():
+    items = []
+    derived = set()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_DATA_BUCKET, Prefix=MASK_PREFIX):
+        for item in page.get("Contents", []):
+            if item["Key"].startswith(MASK_DERIVED_PREFIX):
+                derived.add(item["Key"])
+            elif not item["Key"].endswith("/"):
+                items.append(item)
+    with ThreadPoolExecutor(CATALOGUE_REBUILD_WORKERS) as executor:
+        headers = executor.map(_read_header, [item["Key"] for item in items])
+        masks = {item["Key"]: _catalogue_entry(item["Key"], item["Size"], item["ETag"],
+                                               item["LastModified"].isoformat(), header)
+                 for item, header in zip(items, headers)}
+    # Masks ingested before the manifest existed keep their thumbnails
+    for key, entry in masks.items():
+        thumbnail_key = derived_prefix(key, entry["etag"]) + THUMBNAIL_FILE
+        if thumbnail_key in derived:
+            entry["thumbnailKey"] = thumbnail_key
+    return _save_catalogue({"masks": masks}, etag=None, create=True)
+
+# Returns (catalogue, manifest ETag), building the manifest the first time.
+# Masks the lifecycle rule has deleted are left out.
+def _load_catalogue():
+    try:
+        response = s3_client.get_object(Bucket=S3_DATA_BUCKET, Key=CATALOGUE_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        try:
+            catalogue, etag = _rebuild_catalogue()
+            return _drop_expired(catalogue), etag
+        except s3_client.exceptions.ClientError as e:
+            if not _write_conflict(e):
+                raise
+        # Another request built the manifest first, use theirs
+        response = s3_client.get_object(Bucket=S3_DATA_BUCKET, Key=CATALOGUE_KEY)
+    return _drop_expired(json.loads(response["Body"].read())), response["ETag"]
+
+# Conditional write so concurrent uploads cannot silently overwrite each other's entries
+def _save_catalogue(catalogue, etag, create=False):
+    conditions = {"IfNoneMatch": "*"} if create else {"IfMatch": etag}
+    response = s3_client.put_object(
+        Bucket=S3_DATA_BUCKET,
+        Key=CATALOGUE_KEY,
+        Body=json.dumps(catalogue, sort_keys=True).encode(),
+        ContentType="application/json",
+        **conditions
+    )
+    return catalogue, response["ETag"]
+
+# Adds or replaces one mask in the manifest, retrying if another upload got there first
+def _update_catalogue(key, header, head, assets):
+    entry = _catalogue_entry(key, head["ContentLength"], head["ETag"], head["LastModified"].isoformat(), header)
+    entry.update(assets)
+    for _ in range(CATALOGUE_WRITE_ATTEMPTS):
+        catalogue, etag = _load_catalogue()
+        catalogue["masks"][key] = entry
+        try:
+            return _save_catalogue(catalogue, etag)
+        except s3_client.exceptions.ClientError as e:
+            if not _write_conflict(e):
+                raise
+    raise ValueError(f"catalogue is busy, try again")
+
+def _check_mask_key(key):
+    if key.startswith(MASK_DERIVED_PREFIX) or ".." in key:
+        raise ValueError(f"invalid mask name")
+
+# Writes the normalized sizes, thumbnail and alignment of a stored mask and lists it
+def _ingest(key, header, image):
+    from mask_ingest import ingest_mask
+
+    head = s3_client.head_object(Bucket=S3_DATA_BUCKET, Key=key)
+    assets = ingest_mask(s3_client, S3_DATA_BUCKET, key, head["ETag"], image)
+    _update_catalogue(key, header, head, assets)
+    return head
+
+def _header(event, name):
+    for key, value in ((event or {}).get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except ValueError:
+        raise ValueError(f"invalid cursor")
+
+# GET /v1/mask?limit=100&cursor=... returns one page of the catalogue, 304 if unchanged
+def download_masks_folder(body, path_params, event=None):
 
     if (body != {}):
         raise ValueError(f"invalid body")   
-    
-    try:
-        # List all files in the /masks folder
-        response = s3_client.list_objects_v2(Bucket=S3_DATA_BUCKET, Prefix="masks/")
 
-        if "Contents" not in response:
-            payload = {
-                "statusCode": 200,
-                "body": json.dumps({
-                    "message": f"no mask files found",
-                })
-            }
-            return (payload, False)
-        
-        # Generate URLs for each mask file
-        mask_urls = [
-            f"https://{S3_DATA_BUCKET}.s3.amazonaws.com/{item['Key']}"
-            for item in response["Contents"]
-        ]
+    query = (event or {}).get("queryStringParameters") or {}
+    try:
+        limit = int(query.get("limit", CATALOGUE_PAGE_SIZE))
+    except ValueError:
+        raise ValueError(f"invalid limit")
+    limit = max(1, min(limit, CATALOGUE_MAX_PAGE_SIZE))
+    cursor = query.get("cursor")
+
+    catalogue, manifest_etag = _load_catalogue()
+    # The mask count changes the ETag when masks expire without the manifest being written
+    etag = hashlib.md5(f"{manifest_etag}:{len(catalogue['masks'])}:{cursor}:{limit}".encode()).hexdigest()
+    etag = '"' + etag + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _header(event, "if-none-match") == etag:
+        return ({"statusCode": 304, "headers": headers, "body": ""}, False)
+
+    keys = sorted(catalogue["masks"])
+    if cursor:
+        after = _decode_cursor(cursor)
+        keys = [key for key in keys if key > after]
+    page = [catalogue["masks"][key] for key in keys[:limit]]
+    for mask in page:
+        mask["thumbnailUrl"] = _public_url(mask["thumbnailKey"]) if mask.get("thumbnailKey") else None
+    next_cursor = _encode_cursor(page[-1]["key"]) if len(keys) > limit else None
+
+    payload = {
+        "statusCode": 200,
+        "headers": headers,
+        "body": json.dumps({
+            "message": "successful" if page else "no mask files found",
+            "masks": page,
+            "nextCursor": next_cursor,
+            "masksUrls": [mask["url"] for mask in page],
+        })
+    }
 
-        payload = {
-            "statusCode": 200,
-            "body": json.dumps({
-                "message": "successful",
-                "masksUrls" : mask_urls
-            })
-        }
+    return (payload, False)
 
-        return (payload, False)
-    
-    except Exception as e:
-        raise ValueError(f"Error getting files: {str(e)}")
+def upload_mask(body, path_params, event=None):
+    from mask_ingest import decode_mask
 
-def upload_mask(body, path_params):
     if "fileData" not in body:
         raise ValueError("Missing file data in request body")
     
@@ -75,6 +283,8 @@ def upload_mask(body, path_params):
 
         # Generate a unique file name (UUID)
         file_name = f"masks/{file_name}.{file_extension}"
+        _check_mask_key(file_name)
+        image = decode_mask(file_bytes)
 
         # Determine the content type (MIME type) based on the file extension
         content_type, _ = mimetypes.guess_type(file_name)
@@ -90,6 +300,7 @@ def upload_mask(body, path_params):
             Body=file_bytes,
             ContentType=content_type
         )
+        _ingest(file_name, file_bytes[:IMAGE_HEADER_BYTES], image)
 
         # Generate the URL of the uploaded file
         file_url = f"https://{S3_DATA_BUCKET}.s3.amazonaws.com/{file_name}"
@@ -108,7 +319,7 @@ def upload_mask(body, path_params):
         raise ValueError(f"Error uploading file: {str(e)}")
     
 
-def upload_image(body, path_params):
+def upload_image(body, path_params, event=None):
     if "userId" not in path_params:
         raise ValueError(f"missing path parameter")
     
@@ -140,13 +351,14 @@ def upload_image(body, path_params):
 
     return (mqtt_payload, True)
 
-def feature_change(body, path_params):
+def feature_change(body, path_params, event=None):
     if "userId" not in path_params:
         raise ValueError(f"missing path parameter")
     
     if ("feature" not in body or
         "featureParam" not in body):
         raise ValueError(f"missing body parameter")
+    _check_names(userId=path_params["userId"], feature=body["feature"])
 
     mqtt_payload = {
         "userId" : path_params["userId"],
@@ -159,12 +371,13 @@ def feature_change(body, path_params):
 
     return (mqtt_payload, True)
 
-def get_user_data(body, path_params):
+def get_user_data(body, path_params, event=None):
     if "userId" not in path_params:
         raise ValueError(f"missing path parameter")
     
     if (body != {}):
         raise ValueError(f"invalid body")
+    _check_names(userId=path_params["userId"])
 
     mqtt_payload = {
         "userId" : path_params["userId"],
@@ -174,12 +387,202 @@ def get_user_data(body, path_params):
     
     return (mqtt_payload, True)
 
+def _content_type(key, body):
+    content_type = body.get("contentType") or mimetypes.guess_type(key)[0]
+    return content_type or "application/octet-stream"
+
+def _public_url(key):
+    return f"https://{S3_DATA_BUCKET}.s3.amazonaws.com/{key}"
+
+# Presigned PUT for small files, presigned UploadPart URLs for large ones
+def _presign_upload(key, body):
+    size = body.get("fileSize", 0)
+    if not isinstance(size, int) or size < 0 or size > MAX_UPLOAD_SIZE:
+        raise ValueError(f"invalid file size")
+
+    content_type = _content_type(key, body)
+    if size < MULTIPART_THRESHOLD:
+        url = s3_client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": S3_DATA_BUCKET, "Key": key, "ContentType": content_type},
+            ExpiresIn=PRESIGNED_URL_EXPIRES
+        )
+        return {"key": key, "method": "PUT", "uploadUrl": url, "headers": {"Content-Type": content_type}}
+
+    upload = s3_client.create_multipart_upload(Bucket=S3_DATA_BUCKET, Key=key, ContentType=content_type)
+    part_count = (size + MULTIPART_PART_SIZE - 1) // MULTIPART_PART_SIZE
+    part_urls = [
+        s3_client.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": S3_DATA_BUCKET, "Key": key, "UploadId": upload["UploadId"], "PartNumber": number},
+            ExpiresIn=PRESIGNED_URL_EXPIRES
+        )
+        for number in range(1, part_count + 1)
+    ]
+    return {
+        "key": key,
+        "method": "PUT",
+        "uploadId": upload["UploadId"],
+        "partSize": MULTIPART_PART_SIZE,
+        "partUrls": part_urls,
+    }
+
+# Finishes a multipart upload if there is one and checks the object landed in S3
+def _complete_upload(body, prefix):
+    key = body.get("key", "")
+    if not key.startswith(prefix) or ".." in key:
+        raise ValueError(f"invalid upload key")
+
+    if "uploadId" in body:
+        parts = body.get("parts")
+        if not parts:
+            raise ValueError(f"missing upload parts")
+        s3_client.complete_multipart_upload(
+            Bucket=S3_DATA_BUCKET,
+            Key=key,
+            UploadId=body["uploadId"],
+            MultipartUpload={"Parts": [
+                {"PartNumber": int(part["partNumber"]), "ETag": part["etag"]}
+                for part in sorted(parts, key=lambda part: int(part["partNumber"]))
+            ]}
+        )
+
+    try:
+        head = s3_client.head_object(Bucket=S3_DATA_BUCKET, Key=key)
+    except s3_client.exceptions.ClientError:
+        raise ValueError(f"upload not found: {key}")
+    return head
+
+def request_image_upload(body, path_params, event=None):
+    if "userId" not in path_params:
+        raise ValueError(f"missing path parameter")
+
+    file_extension = body.get("fileExtension", "jpg")
+    key = f"{IMAGE_PREFIX}{uuid.uuid4()}.{file_extension}"
+    payload = {
+        "statusCode": 200,
+        "body": json.dumps(_presign_upload(key, body))
+    }
+    return (payload, False)
+
+def complete_image_upload(body, path_params, event=None):
+    if "userId" not in path_params:
+        raise ValueError(f"missing path parameter")
+
+    _complete_upload(body, IMAGE_PREFIX)
+
+    mqtt_payload = {
+        "userId" : path_params["userId"],
+        "requestType" : "upload-image",
+        "event" : {
+            "imageUrl" : _public_url(body["key"]),
+        }
+    }
+
+    return (mqtt_payload, True)
+
+def request_mask_upload(body, path_params, event=None):
+    if "fileExtension" not in body:
+        raise ValueError("Missing file extension in request body")
+
+    if "fileName" not in body:
+        raise ValueError("Missing file name in request body")
+
+    key = f"{MASK_PREFIX}{body['fileName']}.{body['fileExtension']}"
+    _check_mask_key(key)
+    payload = {
+        "statusCode": 200,
+        "body": json.dumps(_presign_upload(key, body))
+    }
+    return (payload, False)
+
+def complete_mask_upload(body, path_params, event=None):
+    _check_mask_key(body.get("key", ""))
+    head = _complete_upload(body, MASK_PREFIX)
+
+    from mask_ingest import decode_mask
+
+    data = s3_client.get_object(Bucket=S3_DATA_BUCKET, Key=body["key"])["Body"].read()
+    try:
+        image = decode_mask(data)
+    except ValueError:
+        # Nothing may keep pointing at an upload that is not an image
+        s3_client.delete_object(Bucket=S3_DATA_BUCKET, Key=body["key"])
+        raise
+    head = _ingest(body["key"], data[:IMAGE_HEADER_BYTES], image)
+
+    payload = {
+        "statusCode": 200,
+        "body": json.dumps({
+            "message": "File uploaded successfully",
+            "fileUrl" : _public_url(body["key"]),
+            "etag": head["ETag"].strip('"'),
+        })
+    }
+    return (payload, False)
+
+# Latest feature change per (user, feature) and one data request per user, otherwise in order
+def _merge_mqtt_payloads(payloads):
+    merged = {}
+    for position, payload in enumerate(payloads):
+        if payload["requestType"] == "feature-change":
+            key = (payload["userId"], "feature-change", payload["event"]["feature"])
+            merged.pop(key, None)
+        elif payload["requestType"] == "get-user-data":
+            key = (payload["userId"], "get-user-data")
+            merged.pop(key, None)
+        else:
+            key = position
+        merged[key] = payload
+    return list(merged.values())
+
+# POST /v1/batch {"operations": [{"method": "POST", "path": "feature", "pathParameters": {...}, "body": {...}}]}
+# Batched operations only build MQTT payloads, so a failing one rejects the batch before anything has
+# happened; otherwise one MQTT message carries them all. Edge devices apply the commands one by one,
+# so the batch is not atomic on their side.
+def batch_operations(body, path_params, event=None):
+    operations = body.get("operations")
+    if not isinstance(operations, list) or not operations:
+        raise ValueError(f"missing operations")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f"too many operations: {len(operations)} > {BATCH_MAX_OPERATIONS}")
+
+    calls = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise ValueError(f"operation {index}: invalid operation")
+        path = (operation.get("method", "POST"), operation.get("path"))
+        if path not in BATCH_OPERATIONS:
+            raise ValueError(f"operation {index}: cannot batch {path}")
+        calls.append((index, path, operation.get("body") or {}, operation.get("pathParameters") or {}))
+
+    payloads = []
+    for index, path, operation_body, operation_params in calls:
+        try:
+            payload, is_mqtt = v1_operations[path](operation_body, operation_params, event)
+        except InvalidRequest as e:
+            raise InvalidRequest(f"operation {index}: {e}")
+        except Exception as e:
+            raise ValueError(f"operation {index}: {e}")
+        payloads.append(payload)
+
+    commands = _merge_mqtt_payloads(payloads)
+    # A single command goes out unwrapped so edge devices that predate batches still understand it
+    if len(commands) == 1:
+        return (commands[0], True)
+    return ({"requestType": "batch", "commands": commands}, True)
+
 v1_operations = {
     ("POST", "image"): upload_image,
     ("POST", "feature") : feature_change,
     ("GET", "user") : get_user_data,
     ("GET", "mask") : download_masks_folder,
     ("POST", "mask") : upload_mask,
+    ("POST", "image-upload") : request_image_upload,
+    ("POST", "image-complete") : complete_image_upload,
+    ("POST", "mask-upload") : request_mask_upload,
+    ("POST", "mask-complete") : complete_mask_upload,
+    ("POST", "batch") : batch_operations,
 }
 
 def lambda_handler(event, context):
@@ -199,7 +602,7 @@ def lambda_handler(event, context):
         path = (method_type, resource_path[2])
         if resource_path[1] == "v1":
             if (method_type, resource_path[2]) in v1_operations:
-                payload, is_mqtt = v1_operations[path](body, path_params)
+                payload, is_mqtt = v1_operations[path](body, path_params, event)
             else:
                 raise ValueError(f"invalid v1 operation: {path}")
 
@@ -224,7 +627,14 @@ def lambda_handler(event, context):
             }
         
         return payload
-    
+
+    except InvalidRequest as e:
+        logger.info(f"invalid request: {e}")
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": str(e)})
+        }
+
     except Exception as e:
         logger.exception(e)
         return {
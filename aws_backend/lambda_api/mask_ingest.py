@@ -0,0 +1,119 @@
+"""Ingestion of uploaded masks: validate, normalize, thumbnail and pre-align.
+
+Runs once per upload so the gallery and the edge devices never decode the
+original. Everything derived from masks/<name> is written next to it under
+
+    masks/derived/<name>/<etag>/rgba-256.png     square RGBA, one per MASK_RESOLUTIONS entry
+    masks/derived/<name>/<etag>/thumbnail.png    fits in THUMBNAIL_SIZE, keeps the aspect ratio
+    masks/derived/<name>/<etag>/alignment.npy    (2, 3) float32 affine, see mask_alignment
+
+The ETag of the original is part of the path, so a device that knows the
+ETag from the listing can fetch the matching assets without another lookup
+(ml_backend/mask_cache.py does exactly that).
+
+Pillow and numpy come from the Lambda layer and are only imported when a mask
+is decoded or ingested, so the key helpers are safe to use from every route.
+"""
+import io
+
+MASK_PREFIX = "masks/"
+MASK_DERIVED_PREFIX = "masks/derived/"
+MASK_RESOLUTIONS = (256, 512, 1024)
+THUMBNAIL_SIZE = 128
+THUMBNAIL_FILE = "thumbnail.png"
+ALIGNMENT_FILE = "alignment.npy"
+ALLOWED_FORMATS = ("PNG", "JPEG", "WEBP", "BMP")
+MAX_MASK_PIXELS = 8192 * 8192
+
+# Bounding box (x0, y0, x1, y1) of the canonical face mesh UVs in face_landmarker.task
+CANONICAL_UV_BOUNDS = (0.007561, 0.10705, 0.99244, 0.954453)
+
+
+def derived_prefix(key, etag):
+    etag = etag.strip('"')
+    return f"{MASK_DERIVED_PREFIX}{key[len(MASK_PREFIX):]}/{etag}/"
+
+
+def resolution_file(size):
+    return f"rgba-{size}.png"
+
+
+# Decodes an upload into an RGBA image, or raises ValueError if it is not a usable mask
+def decode_mask(data):
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            if probe.format not in ALLOWED_FORMATS:
+                raise ValueError(f"unsupported mask format: {probe.format}")
+            if probe.width * probe.height > MAX_MASK_PIXELS:
+                raise ValueError(f"mask is too large: {probe.width}x{probe.height}")
+            probe.verify()
+        # verify() leaves the image unusable, so decode from a fresh handle
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"invalid mask image: {e}")
+    return ImageOps.exif_transpose(image).convert("RGBA")
+
+
+# Affine (2, 3) taking canonical UV coordinates to normalized mask coordinates.
+# Masks with transparency have the mesh bounds fitted to their opaque region;
+# fully opaque masks are taken to be drawn on the UV layout already (identity).
+def mask_alignment(image):
+    import numpy as np
+
+    alpha = np.asarray(image.getchannel("A"))
+    rows = np.flatnonzero(alpha.max(axis=1))
+    cols = np.flatnonzero(alpha.max(axis=0))
+    alignment = np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float32)
+    if len(rows) == 0 or alpha.min() == 255:
+        return alignment
+
+    height, width = alpha.shape
+    x0, y0, x1, y1 = cols[0] / width, rows[0] / height, (cols[-1] + 1) / width, (rows[-1] + 1) / height
+    u0, v0, u1, v1 = CANONICAL_UV_BOUNDS
+    scale_x, scale_y = (x1 - x0) / (u1 - u0), (y1 - y0) / (v1 - v0)
+    alignment[0] = (scale_x, 0, x0 - u0 * scale_x)
+    alignment[1] = (0, scale_y, y0 - v0 * scale_y)
+    return alignment
+
+
+def _png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# File name -> bytes of every derived asset of one mask
+def render_assets(image):
+    import numpy as np
+    from PIL import Image
+
+    assets = {}
+    for size in MASK_RESOLUTIONS:
+        resized = image if image.size == (size, size) else image.resize((size, size), Image.Resampling.LANCZOS)
+        assets[resolution_file(size)] = _png(resized)
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+    assets[THUMBNAIL_FILE] = _png(thumbnail)
+
+    alignment = io.BytesIO()
+    np.save(alignment, mask_alignment(image))
+    assets[ALIGNMENT_FILE] = alignment.getvalue()
+    return assets
+
+
+# Writes the derived assets of masks/<name> and returns their catalogue fields
+def ingest_mask(s3_client, bucket, key, etag, image):
+    prefix = derived_prefix(key, etag)
+    for name, data in render_assets(image).items():
+        content_type = "application/octet-stream" if name.endswith(".npy") else "image/png"
+        s3_client.put_object(Bucket=bucket, Key=prefix + name, Body=data, ContentType=content_type)
+
+    return {
+        "thumbnailKey": prefix + THUMBNAIL_FILE,
+        "alignmentKey": prefix + ALIGNMENT_FILE,
+        "resolutions": {str(size): prefix + resolution_file(size) for size in MASK_RESOLUTIONS},
+    }
@@ -38,3 +38,38 @@ resource "aws_apigatewayv2_route" "upload_mask" {
   route_key = "POST /v1/mask"
   target    = "integrations/${aws_apigatewayv2_integration.lambda_api.id}"
 }
+
+# POST /v1/image-upload/{userId}
+resource "aws_apigatewayv2_route" "image_upload_url" {
+  api_id    = var.api_gw_http_id
+  route_key = "POST /v1/image-upload/{userId}"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_api.id}"
+}
+
+# POST /v1/image-complete/{userId}
+resource "aws_apigatewayv2_route" "image_upload_complete" {
+  api_id    = var.api_gw_http_id
+  route_key = "POST /v1/image-complete/{userId}"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_api.id}"
+}
+
+# POST /v1/mask-upload
+resource "aws_apigatewayv2_route" "mask_upload_url" {
+  api_id    = var.api_gw_http_id
+  route_key = "POST /v1/mask-upload"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_api.id}"
+}
+
+# POST /v1/mask-complete
+resource "aws_apigatewayv2_route" "mask_upload_complete" {
+  api_id    = var.api_gw_http_id
+  route_key = "POST /v1/mask-complete"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_api.id}"
+}
+
+# POST /v1/batch
+resource "aws_apigatewayv2_route" "batch" {
+  api_id    = var.api_gw_http_id
+  route_key = "POST /v1/batch"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_api.id}"
+}
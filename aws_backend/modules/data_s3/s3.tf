@@ -15,6 +15,23 @@ resource "aws_s3_bucket_lifecycle_configuration" "bucket_day_expiration" {
       days = 10  # Set to delete objects after 10 day
     }
 
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1  # Presigned multipart uploads that were never completed
+    }
+
     status = "Enabled"
   }
-}
\ No newline at end of file
+}
+
+# Browsers upload straight to the bucket with presigned PUT URLs from the lambda
+resource "aws_s3_bucket_cors_configuration" "presigned_uploads" {
+  bucket = aws_s3_bucket.data_bucket.id
+
+  cors_rule {
+    allowed_methods = ["PUT"]
+    allowed_origins = ["*"]
+    allowed_headers = ["*"]
+    expose_headers  = ["ETag"]  # Needed to complete multipart uploads
+    max_age_seconds = 3000
+  }
+}
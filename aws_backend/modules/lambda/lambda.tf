@@ -4,6 +4,23 @@ data "archive_file" "lambda" {
   output_path = "${path.module}/../../lambda_api/lambda_api.zip"
 }
 
+# Pillow and numpy for mask ingestion, as manylinux wheels for the Lambda runtime.
+# build/lambda_layer is not checked in; it is filled before every plan (see terraform-deploy.yml):
+#   pip install -r lambda_api/requirements-layer.txt --target build/lambda_layer/python \
+#     --platform manylinux2014_x86_64 --implementation cp --python-version 3.12 --only-binary=:all:
+data "archive_file" "layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/../../build/lambda_layer"
+  output_path = "${path.module}/../../build/lambda_layer.zip"
+}
+
+resource "aws_lambda_layer_version" "api_dependencies" {
+  layer_name          = "eoh-api-dependencies"
+  filename            = data.archive_file.layer.output_path
+  source_code_hash    = data.archive_file.layer.output_base64sha256
+  compatible_runtimes = ["python3.12"]
+}
+
 resource "aws_lambda_function" "api_lambda" {
   function_name = "eoh-api-routing"
   role          = var.lambda_role_arn
@@ -12,13 +29,15 @@ resource "aws_lambda_function" "api_lambda" {
 
   filename         = "${path.module}/../../lambda_api/lambda_api.zip"
   source_code_hash = data.archive_file.lambda.output_base64sha256
+  layers           = [aws_lambda_layer_version.api_dependencies.arn]
 
-  timeout     = 10
-  memory_size = 128
+  # Mask ingestion decodes and resizes uploads inside the request
+  timeout     = 30
+  memory_size = 1024
 
   environment {
     variables = {
       MY_ENV_VAR = "example_value"
     }
   }
-}
\ No newline at end of file
+}
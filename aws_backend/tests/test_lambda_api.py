@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import base64
+import struct
+import zlib
+import io
+import importlib
+from datetime import datetime, timedelta
+import numpy as np
+from PIL import Image
+import pytest
+import requests
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda_api"))
+import mask_ingest  # noqa: E402
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The lambda module with its S3 and IoT clients pointed at moto."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    with mock_aws():
+        import main
+        main = importlib.reload(main)
+        boto3.client("s3").create_bucket(Bucket=main.S3_DATA_BUCKET)
+        yield main
+
+
+def invoke(api, method, resource, body=None, path_params=None, query=None, headers=None):
+    event = {"resource": resource, "httpMethod": method, "pathParameters": path_params or {},
+             "queryStringParameters": query, "headers": headers or {},
+             "body": json.dumps(body) if body is not None else None}
+    return api.lambda_handler(event, None)
+
+
+# RGBA PNG that is opaque inside box=(x0, y0, x1, y1), or everywhere without a box
+def png_image(width, height, box=None):
+    image = Image.new("RGBA", (width, height), (255, 0, 0, 0 if box else 255))
+    if box:
+        image.paste((255, 0, 0, 255), box)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_routes_load_without_the_image_layer(api, monkeypatch):
+    """Pillow and numpy come from a layer; without them only mask ingestion may fail."""
+    published = []
+    for name in ("PIL", "numpy"):
+        monkeypatch.setitem(sys.modules, name, None)
+    importlib.reload(mask_ingest)
+    api = importlib.reload(api)
+    monkeypatch.setattr(api.iot_client, "publish", lambda **kwargs: published.append(kwargs) or {})
+
+    response = invoke(api, "POST", "/v1/feature/{userId}", {"feature": "color", "featureParam": "red"},
+                      {"userId": "u1"})
+    assert response["statusCode"] == 200 and len(published) == 1
+    assert invoke(api, "GET", "/v1/mask")["statusCode"] == 200
+
+
+def test_presigned_image_upload_publishes_on_completion(api):
+    """The client PUTs to the presigned URL and completion publishes upload-image."""
+    response = invoke(api, "POST", "/v1/image-upload/{userId}", {"fileExtension": "png", "fileSize": 4},
+                      {"userId": "u1"})
+    upload = json.loads(response["body"])
+    assert upload["key"].startswith("images/") and upload["key"].endswith(".png")
+
+    put = requests.put(upload["uploadUrl"], data=b"\x89PNG", headers=upload["headers"])
+    assert put.status_code == 200
+
+    payload, is_mqtt = api.complete_image_upload({"key": upload["key"]}, {"userId": "u1"})
+    assert is_mqtt
+    assert payload["requestType"] == "upload-image"
+    assert payload["event"]["imageUrl"].endswith(upload["key"])
+
+    response = invoke(api, "POST", "/v1/image-complete/{userId}", {"key": upload["key"]}, {"userId": "u1"})
+    assert response["statusCode"] == 200
+
+
+def test_completion_rejects_missing_or_foreign_keys(api):
+    """Completing an upload that never happened, or outside the prefix, fails."""
+    response = invoke(api, "POST", "/v1/image-complete/{userId}", {"key": "images/missing.png"}, {"userId": "u1"})
+    assert response["statusCode"] == 500
+
+    response = invoke(api, "POST", "/v1/image-complete/{userId}", {"key": "masks/other.png"}, {"userId": "u1"})
+    assert response["statusCode"] == 500
+
+
+def test_large_mask_uploads_use_multipart(api, monkeypatch):
+    """Files over the threshold get one presigned URL per part and are completed with their ETags."""
+    monkeypatch.setattr(api, "MULTIPART_THRESHOLD", 1)
+    data = png_image(16, 16)
+    response = invoke(api, "POST", "/v1/mask-upload", {"fileName": "fox", "fileExtension": "png", "fileSize": len(data)})
+    upload = json.loads(response["body"])
+    assert upload["key"] == "masks/fox.png"
+    assert len(upload["partUrls"]) == 1
+
+    put = requests.put(upload["partUrls"][0], data=data)
+    parts = [{"partNumber": 1, "etag": put.headers["ETag"]}]
+
+    response = invoke(api, "POST", "/v1/mask-complete",
+                      {"key": upload["key"], "uploadId": upload["uploadId"], "parts": parts})
+    assert response["statusCode"] == 200
+    body = boto3.client("s3").get_object(Bucket=api.S3_DATA_BUCKET, Key="masks/fox.png")["Body"].read()
+    assert body == data
+
+
+def test_base64_mask_upload_still_works(api):
+    """The original body upload path stays available as a fallback."""
+    data = png_image(16, 16)
+    body = {"fileName": "cat", "fileExtension": "png", "fileData": base64.b64encode(data).decode()}
+
+    response = invoke(api, "POST", "/v1/mask", body)
+
+    assert response["statusCode"] == 200
+    assert boto3.client("s3").get_object(Bucket=api.S3_DATA_BUCKET, Key="masks/cat.png")["Body"].read() == data
+
+
+def png_header(width, height):
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr
+            + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr)))
+
+
+def test_image_dimensions_reads_common_headers(api):
+    """Width and height come from the PNG, GIF and JPEG headers alone."""
+    assert api._image_dimensions(png_header(640, 480)) == (640, 480)
+    assert api._image_dimensions(b"GIF89a" + struct.pack("<HH", 32, 16)) == (32, 16)
+    jpeg = b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", 4) + b"\x00\x00" \
+        + b"\xff\xc0" + struct.pack(">HBHH", 11, 8, 120, 200) + b"\x03\x00"
+    assert api._image_dimensions(jpeg) == (200, 120)
+    assert api._image_dimensions(b"not an image") == (None, None)
+
+
+def test_mask_catalogue_pages_past_the_listing_limit(api):
+    """The manifest is rebuilt from every page of the listing and served with cursors."""
+    s3 = boto3.client("s3")
+    for number in range(1005):
+        s3.put_object(Bucket=api.S3_DATA_BUCKET, Key=f"masks/{number:04d}.png", Body=png_header(64, 32))
+
+    keys, cursor = [], None
+    while True:
+        response = invoke(api, "GET", "/v1/mask", query={"limit": "400", "cursor": cursor} if cursor else {"limit": "400"})
+        page = json.loads(response["body"])
+        keys.extend(mask["key"] for mask in page["masks"])
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    assert len(keys) == 1005 and keys == sorted(keys)
+    assert page["masks"][0]["width"] == 64 and page["masks"][0]["height"] == 32
+    assert page["masksUrls"][0] == page["masks"][0]["url"]
+
+
+def test_mask_catalogue_answers_304_until_a_mask_is_uploaded(api):
+    """A matching If-None-Match gets 304 and an upload changes the ETag."""
+    invoke(api, "POST", "/v1/mask", {"fileData": base64.b64encode(png_image(10, 20)).decode(),
+                                     "fileExtension": "png", "fileName": "first"})
+    response = invoke(api, "GET", "/v1/mask")
+    etag = response["headers"]["ETag"]
+    assert [mask["key"] for mask in json.loads(response["body"])["masks"]] == ["masks/first.png"]
+
+    assert invoke(api, "GET", "/v1/mask", headers={"If-None-Match": etag})["statusCode"] == 304
+
+    invoke(api, "POST", "/v1/mask", {"fileData": base64.b64encode(png_image(30, 40)).decode(),
+                                     "fileExtension": "png", "fileName": "second"})
+    response = invoke(api, "GET", "/v1/mask", headers={"if-none-match": etag})
+    assert response["statusCode"] == 200 and response["headers"]["ETag"] != etag
+    masks = json.loads(response["body"])["masks"]
+    assert [(mask["key"], mask["width"], mask["height"]) for mask in masks] == [
+        ("masks/first.png", 10, 20), ("masks/second.png", 30, 40)]
+
+
+def test_mask_upload_writes_sizes_thumbnail_and_alignment(api):
+    """Uploading a mask ingests it once and the catalogue points at the results."""
+    response = invoke(api, "POST", "/v1/mask", {"fileData": base64.b64encode(png_image(400, 200, (100, 50, 300, 150))).decode(),
+                                                "fileExtension": "png", "fileName": "fox"})
+    assert response["statusCode"] == 200
+
+    mask = json.loads(invoke(api, "GET", "/v1/mask")["body"])["masks"][0]
+    s3 = boto3.client("s3")
+    prefix = f"masks/derived/fox.png/{mask['etag']}/"
+    assert mask["thumbnailKey"] == prefix + "thumbnail.png"
+    assert mask["thumbnailUrl"].endswith(mask["thumbnailKey"])
+
+    for size in (256, 512, 1024):
+        data = s3.get_object(Bucket=api.S3_DATA_BUCKET, Key=mask["resolutions"][str(size)])["Body"].read()
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.mode == "RGBA" and image.size == (size, size)
+    with Image.open(s3.get_object(Bucket=api.S3_DATA_BUCKET, Key=mask["thumbnailKey"])["Body"]) as thumbnail:
+        assert thumbnail.size == (128, 64)
+
+    alignment = np.load(io.BytesIO(s3.get_object(Bucket=api.S3_DATA_BUCKET, Key=mask["alignmentKey"])["Body"].read()))
+    u0, v0, u1, v1 = mask_ingest.CANONICAL_UV_BOUNDS
+    corners = np.array([[u0, v0], [u1, v1]]) @ alignment[:, :2].T + alignment[:, 2]
+    np.testing.assert_allclose(corners, [[0.25, 0.25], [0.75, 0.75]], atol=1e-5)
+
+    # Derived assets are not masks themselves
+    s3.delete_object(Bucket=api.S3_DATA_BUCKET, Key=api.CATALOGUE_KEY)
+    rebuilt = json.loads(invoke(api, "GET", "/v1/mask")["body"])["masks"]
+    assert [entry["key"] for entry in rebuilt] == ["masks/fox.png"]
+    assert rebuilt[0]["thumbnailKey"] == mask["thumbnailKey"]
+
+
+def test_mask_catalogue_drops_masks_the_lifecycle_rule_deleted(api):
+    """Entries older than the bucket's expiration leave the listing, and its ETag changes."""
+    for name in ("old", "new"):
+        invoke(api, "POST", "/v1/mask", {"fileData": base64.b64encode(png_image(10, 20)).decode(),
+                                         "fileExtension": "png", "fileName": name})
+    etag = invoke(api, "GET", "/v1/mask")["headers"]["ETag"]
+
+    s3 = boto3.client("s3")
+    catalogue = json.loads(s3.get_object(Bucket=api.S3_DATA_BUCKET, Key=api.CATALOGUE_KEY)["Body"].read())
+    old = catalogue["masks"]["masks/old.png"]
+    old["lastModified"] = (datetime.fromisoformat(old["lastModified"]) - timedelta(days=11)).isoformat()
+    s3.put_object(Bucket=api.S3_DATA_BUCKET, Key=api.CATALOGUE_KEY, Body=json.dumps(catalogue).encode())
+
+    response = invoke(api, "GET", "/v1/mask", headers={"If-None-Match": etag})
+    assert response["statusCode"] == 200
+    assert [mask["key"] for mask in json.loads(response["body"])["masks"]] == ["masks/new.png"]
+
+
+def test_concurrent_catalogue_rebuild_uses_the_winner(api, monkeypatch):
+    """Losing the race to create the manifest re-reads it instead of failing the request."""
+    boto3.client("s3").put_object(Bucket=api.S3_DATA_BUCKET, Key="masks/a.png", Body=png_header(8, 8))
+    rebuild = api._rebuild_catalogue
+
+    def rebuild_after_another_request():
+        rebuild()
+        return rebuild()
+
+    monkeypatch.setattr(api, "_rebuild_catalogue", rebuild_after_another_request)
+    response = invoke(api, "GET", "/v1/mask")
+
+    assert response["statusCode"] == 200
+    assert [mask["key"] for mask in json.loads(response["body"])["masks"]] == ["masks/a.png"]
+
+
+def test_invalid_mask_uploads_are_rejected(api):
+    """Bytes that are not an image never reach the bucket or the catalogue."""
+    response = invoke(api, "POST", "/v1/mask", {"fileData": base64.b64encode(b"not an image").decode(),
+                                                "fileExtension": "png", "fileName": "broken"})
+    assert response["statusCode"] == 500
+
+    upload = json.loads(invoke(api, "POST", "/v1/mask-upload", {"fileName": "late", "fileExtension": "png",
+                                                                "fileSize": 12})["body"])
+    requests.put(upload["uploadUrl"], data=b"not an image", headers=upload["headers"])
+    response = invoke(api, "POST", "/v1/mask-complete", {"key": upload["key"]})
+    assert response["statusCode"] == 500
+
+    listing = boto3.client("s3").list_objects_v2(Bucket=api.S3_DATA_BUCKET, Prefix="masks/")
+    assert "Contents" not in listing
+    assert json.loads(invoke(api, "GET", "/v1/mask")["body"])["masks"] == []
+
+
+def test_batch_merges_feature_changes_into_one_message(api, monkeypatch):
+    """A batch is validated as a whole and published as a single combined message."""
+    published = []
+    monkeypatch.setattr(api.iot_client, "publish", lambda **kwargs: published.append(kwargs) or {})
+    operations = [{"method": "POST", "path": "feature", "pathParameters": {"userId": "u1"},
+                   "body": {"feature": "color", "featureParam": value}} for value in ("red", "green", "blue")]
+    operations.append({"method": "GET", "path": "user", "pathParameters": {"userId": "u2"}})
+
+    response = invoke(api, "POST", "/v1/batch", {"operations": operations})
+
+    assert response["statusCode"] == 200
+    assert len(published) == 1
+    message = json.loads(published[0]["payload"])
+    assert message["requestType"] == "batch"
+    assert [(command["userId"], command["requestType"], command["event"].get("featureParam"))
+            for command in message["commands"]] == [("u1", "feature-change", "blue"), ("u2", "get-user-data", None)]
+
+    # One surviving command is published unwrapped
+    invoke(api, "POST", "/v1/batch", {"operations": operations[:2]})
+    assert json.loads(published[1]["payload"])["event"]["featureParam"] == "green"
+
+
+def test_batch_rejects_invalid_operations_before_publishing(api, monkeypatch):
+    """One bad operation fails the whole batch and nothing is published."""
+    published = []
+    monkeypatch.setattr(api.iot_client, "publish", lambda **kwargs: published.append(kwargs) or {})
+    good = {"method": "POST", "path": "feature", "pathParameters": {"userId": "u1"},
+            "body": {"feature": "color", "featureParam": "red"}}
+
+    for operations in ([good, {"method": "POST", "path": "feature", "pathParameters": {"userId": "u1"}, "body": {}}],
+                       [good, {"method": "POST", "path": "mask", "body": {}}],
+                       [{"method": "POST", "path": "image", "pathParameters": {"userId": "u1"},
+                         "body": {"imageData": base64.b64encode(b"image").decode(), "fileExtension": "png"}}, good],
+                       [good, {"method": "POST", "path": "batch", "body": {"operations": [good]}}],
+                       [good] * (api.BATCH_MAX_OPERATIONS + 1),
+                       []):
+        response = invoke(api, "POST", "/v1/batch", {"operations": operations})
+        assert response["statusCode"] == 500
+    assert published == []
+    assert "Contents" not in boto3.client("s3").list_objects_v2(Bucket=api.S3_DATA_BUCKET), "Nothing was written"
+
+
+def test_batch_with_non_string_names_is_a_bad_request(api, monkeypatch):
+    """A list or object where a feature or user belongs is a 400, not a crash in the merge."""
+    published = []
+    monkeypatch.setattr(api.iot_client, "publish", lambda **kwargs: published.append(kwargs) or {})
+
+    for operation in ({"method": "POST", "path": "feature", "pathParameters": {"userId": "u1"},
+                       "body": {"feature": ["color"], "featureParam": "red"}},
+                      {"method": "GET", "path": "user", "pathParameters": {"userId": {"id": "u1"}}}):
+        response = invoke(api, "POST", "/v1/batch", {"operations": [operation]})
+        assert response["statusCode"] == 400 and "operation 0" in json.loads(response["body"])["error"]
+    assert published == []
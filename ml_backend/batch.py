@@ -0,0 +1,250 @@
+"""Offline batch processing of recorded videos and image folders.
+
+Work is split into units (whole image chunks, whole videos or frame ranges of a
+long video) and spread over a pool of worker processes. Every worker holds its
+own FaceLandmarker instances and writes each unit's results to disk as soon as
+the unit is done.
+
+    python -m ml_backend.batch footage/ event.mp4 -o results/ --workers 8 --chunk-frames 3000
+"""
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "face_landmarker.task")
+
+
+@dataclass
+class WorkUnit:
+    name: str
+    kind: str  # "video" or "images"
+    path: str
+    start_frame: int = 0
+    end_frame: int = None
+    images: list = field(default_factory=list)
+
+    @property
+    def size(self):
+        if self.kind == "images":
+            return len(self.images)
+        return (self.end_frame or 0) - self.start_frame
+
+
+def _video_frame_count(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {path}")
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+# Expands input paths into work units, splitting long videos into chunk_frames ranges
+def plan_work_units(inputs, chunk_frames=None, images_per_unit=256):
+    units = []
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+        if os.path.isdir(path):
+            images = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            for start in range(0, len(images), images_per_unit):
+                units.append(WorkUnit(
+                    name=f"{stem}.images{start // images_per_unit:04d}",
+                    kind="images",
+                    path=path,
+                    images=images[start:start + images_per_unit],
+                ))
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            frame_count = _video_frame_count(path)
+            step = chunk_frames if chunk_frames and frame_count > chunk_frames else max(frame_count, 1)
+            for start in range(0, frame_count, step):
+                units.append(WorkUnit(
+                    name=f"{stem}.frames{start:07d}",
+                    kind="video",
+                    path=path,
+                    start_frame=start,
+                    end_frame=min(start + step, frame_count),
+                ))
+        else:
+            raise ValueError(f"Unsupported input (expected a video file or image directory): {path}")
+
+    return units
+
+
+# Per-process state, created once by the pool initializer
+_worker = {}
+
+
+def _init_worker(model_path, num_faces):
+    _worker.clear()
+    _worker.update(model_path=model_path, num_faces=num_faces, landmarkers={}, last_timestamp=0)
+
+
+def _landmarker(mode_name):
+    import mediapipe as mp
+
+    landmarkers = _worker["landmarkers"]
+    if mode_name not in landmarkers:
+        options = mp.tasks.vision.FaceLandmarkerOptions(
+            base_options=mp.tasks.BaseOptions(model_asset_path=_worker["model_path"]),
+            running_mode=getattr(mp.tasks.vision.RunningMode, mode_name),
+            num_faces=_worker["num_faces"],
+            output_face_blendshapes=True,
+            output_facial_transformation_matrixes=True,
+        )
+        landmarkers[mode_name] = mp.tasks.vision.FaceLandmarker.create_from_options(options)
+    return landmarkers[mode_name]
+
+
+class _ResultArrays:
+    """Accumulates landmarker results as flat per-face arrays."""
+
+    def __init__(self):
+        self.frame_indices = []
+        self.timestamps = []
+        self.face_counts = []
+        self.landmarks = []
+        self.blendshapes = []
+        self.matrices = []
+
+    def add(self, frame_index, timestamp_ms, result):
+        faces = len(result.face_landmarks)
+        self.frame_indices.append(frame_index)
+        self.timestamps.append(timestamp_ms)
+        self.face_counts.append(faces)
+        for face_index, face_landmarks in enumerate(result.face_landmarks):
+            self.landmarks.append([(landmark.x, landmark.y, landmark.z) for landmark in face_landmarks])
+            if result.face_blendshapes:
+                self.blendshapes.append([category.score for category in result.face_blendshapes[face_index]])
+            if result.facial_transformation_matrixes:
+                self.matrices.append(result.facial_transformation_matrixes[face_index])
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            frame_index=np.asarray(self.frame_indices, dtype=np.int64),
+            timestamp_ms=np.asarray(self.timestamps, dtype=np.int64),
+            face_count=np.asarray(self.face_counts, dtype=np.int16),
+            landmarks=np.asarray(self.landmarks, dtype=np.float32).reshape(-1, 478, 3),
+            blendshapes=np.asarray(self.blendshapes, dtype=np.float32).reshape(-1, 52),
+            matrices=np.asarray(self.matrices, dtype=np.float32).reshape(-1, 4, 4),
+        )
+        os.replace(tmp_path, path)
+
+
+def _to_mp_image(frame_bgr):
+    import mediapipe as mp
+
+    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_rgb)
+
+
+def _process_video(unit, arrays):
+    landmarker = _landmarker("VIDEO")
+    cap = cv2.VideoCapture(unit.path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        if unit.start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, unit.start_frame)
+
+        # VIDEO mode needs increasing timestamps per landmarker, even across units
+        base = _worker["last_timestamp"] + 1
+        for frame_index in range(unit.start_frame, unit.end_frame):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            video_ms = int(round((frame_index - unit.start_frame) * 1000.0 / fps))
+            _worker["last_timestamp"] = base + video_ms
+            result = landmarker.detect_for_video(_to_mp_image(frame), base + video_ms)
+            arrays.add(frame_index, int(round(frame_index * 1000.0 / fps)), result)
+    finally:
+        cap.release()
+
+
+def _process_images(unit, arrays):
+    landmarker = _landmarker("IMAGE")
+    for image_index, image_path in enumerate(unit.images):
+        frame = cv2.imread(image_path)
+        if frame is None:
+            print(f"Skipping unreadable image: {image_path}")
+            continue
+        arrays.add(image_index, 0, landmarker.detect(_to_mp_image(frame)))
+
+
+# Runs one unit inside a worker and writes <output_dir>/<unit.name>.npz
+def process_unit(unit, output_dir):
+    started = time.perf_counter()
+    arrays = _ResultArrays()
+    if unit.kind == "video":
+        _process_video(unit, arrays)
+    else:
+        _process_images(unit, arrays)
+
+    output_path = os.path.join(output_dir, f"{unit.name}.npz")
+    arrays.save(output_path)
+
+    summary = asdict(unit)
+    summary.update(
+        output=output_path,
+        frames=len(arrays.frame_indices),
+        faces=int(sum(arrays.face_counts)),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return summary
+
+
+def run_batch(inputs, output_dir, workers=None, chunk_frames=None, model_path=DEFAULT_MODEL_PATH, num_faces=1):
+    os.makedirs(output_dir, exist_ok=True)
+    units = plan_work_units(inputs, chunk_frames=chunk_frames)
+    # Largest units first so one long video does not finish last on its own
+    units.sort(key=lambda unit: unit.size, reverse=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(units), 1))
+
+    summaries = []
+    started = time.perf_counter()
+    # spawn keeps MediaPipe's threads out of forked children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(model_path, num_faces)) as pool:
+        futures = {pool.submit(process_unit, unit, output_dir): unit for unit in units}
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            print(f"[{len(summaries)}/{len(units)}] {summary['name']}: {summary['frames']} frames in {summary['seconds']}s")
+
+    summaries.sort(key=lambda summary: summary["name"])
+    with open(os.path.join(output_dir, "manifest.json"), "w") as manifest:
+        json.dump({"units": summaries, "seconds": round(time.perf_counter() - started, 3)}, manifest, indent=2)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run face landmark detection over videos and image folders.")
+    parser.add_argument("inputs", nargs="+", help="video files or directories of images")
+    parser.add_argument("-o", "--output", required=True, help="directory for per-unit .npz results")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-frames", type=int, default=None, help="split videos longer than this many frames")
+    parser.add_argument("--num-faces", type=int, default=1)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    run_batch(args.inputs, args.output, workers=args.workers, chunk_frames=args.chunk_frames,
+              model_path=args.model, num_faces=args.num_faces)
+
+
+if __name__ == "__main__":
+    main()
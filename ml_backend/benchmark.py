@@ -0,0 +1,402 @@
+"""Headless benchmark of the live pipeline on replayed frames.
+
+Frames come from a synthetic generator or a recorded video and go through the
+real FramePipeline, with either the real FaceLandmarker or FakeLandmarker, which
+answers with canned landmarks after a fixed delay. Every stage reports its
+duration and the run is summarized as throughput plus p50/p95/p99 per stage:
+
+    capture, convert, inference, callback, overlay, mask, display, render
+
+With --startup the report also holds the cold start of ml_backend.face_detection
+in a fresh interpreter (headless, on a short synthetic video): seconds until
+import finished, the landmarker was loaded and the first frame was rendered.
+
+The report is written as JSON. Given a baseline report, stages whose p95, startup
+phases or the overall throughput got worse by more than the tolerance fail the run.
+
+    python -m ml_backend.benchmark --frames 600 --size 1280x720 --fake-delay-ms 8 -o run.json
+    python -m ml_backend.benchmark --video clip.mp4 --real --baseline run.json
+    python -m ml_backend.benchmark --startup -o run.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict, namedtuple
+import cv2
+import numpy as np
+from ml_backend.blendshape_store import BLENDSHAPE_NAMES, BlendshapeStore
+from ml_backend.buffer_pool import BufferPool
+from ml_backend.pipeline import FramePipeline, LatestSlot
+from ml_backend.rendering import OVERLAY_STYLES, LandmarkResult, OverlayRenderer
+
+# Same fields as MediaPipe's blendshape categories
+Category = namedtuple("Category", ["index", "score", "display_name", "category_name"])
+
+# Stages compared against a baseline; overlay/mask/display are recorded by the benchmark's render
+STAGES = ("capture", "convert", "inference", "callback", "overlay", "mask", "display", "render")
+
+# Startup phases in seconds; process_s is the wall time of the whole process, interpreter start included
+STARTUP_PHASES = ("import_s", "landmarker_s", "first_frame_s", "process_s")
+STARTUP_MIN_DELTA_S = 0.05
+
+
+class StageTimer:
+    """Collects stage durations from any thread and summarizes them in milliseconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    # Times the body of a with block as one sample of stage
+    def measure(self, stage):
+        return _Measure(self, stage)
+
+    def summary(self):
+        with self._lock:
+            samples = {stage: np.array(values) * 1000.0 for stage, values in self._samples.items() if values}
+        return {
+            stage: {
+                "count": int(values.size),
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+                "p99_ms": float(np.percentile(values, 99)),
+            }
+            for stage, values in samples.items()
+        }
+
+
+class _Measure:
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.record(self.stage, time.perf_counter() - self.start)
+
+
+class SyntheticCapture:
+    """Capture stand-in producing deterministic frames with a moving pattern."""
+
+    def __init__(self, frames=300, width=1280, height=720, seed=0):
+        rng = np.random.default_rng(seed)
+        self.remaining = frames
+        self.width, self.height = width, height
+        # A wide blurry noise strip scrolled one column per frame, never static and not
+        # as hard on the JPEG encoder as per-pixel noise
+        coarse = rng.integers(0, 256, size=(height // 8 + 1, (width + frames) // 8 + 1, 3), dtype=np.uint8)
+        strip = cv2.resize(coarse, (coarse.shape[1] * 8, coarse.shape[0] * 8), interpolation=cv2.INTER_LINEAR)
+        self._strip = strip[:height, :width + frames]
+        self._index = 0
+
+    def isOpened(self):
+        return self.remaining > 0
+
+    def read(self, image=None):
+        if self.remaining <= 0:
+            return False, None
+        frame = self._strip[:, self._index:self._index + self.width]
+        self._index += 1
+        self.remaining -= 1
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def release(self):
+        self.remaining = 0
+
+
+class PacedCapture:
+    """Wraps a capture so frames come out no faster than fps, like a live camera.
+
+    The wait happens in isOpened(), which the capture loop calls before each read,
+    so the capture stage only measures the read itself.
+    """
+
+    def __init__(self, cap, fps=30.0):
+        self.cap = cap
+        self.interval = 1.0 / fps if fps else 0.0
+        self._next = None
+
+    def isOpened(self):
+        if self.interval:
+            now = time.perf_counter()
+            if self._next is not None and now < self._next:
+                time.sleep(self._next - now)
+            self._next = max(now, self._next or now) + self.interval
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        if image is None:
+            return self.cap.read()
+        return self.cap.read(image=image)
+
+    def release(self):
+        self.cap.release()
+
+
+# Canned result: the canonical face UV layout placed in the middle of the frame
+def canned_result(num_faces=1):
+    from ml_backend.masking import canonical_face_mesh
+
+    uv, _ = canonical_face_mesh()
+    face = np.zeros((478, 3), dtype=np.float32)
+    face[:468, 0] = 0.35 + 0.3 * uv[:, 0]
+    face[:468, 1] = 0.2 + 0.6 * uv[:, 1]
+    face[468:] = face[1]  # iris points collapse onto the nose tip
+    blendshapes = [Category(index, 0.5, "", name) for index, name in enumerate(BLENDSHAPE_NAMES)]
+    faces = [face.copy() for _ in range(num_faces)]
+    return LandmarkResult(faces, [blendshapes] * num_faces, [np.eye(4, dtype=np.float32)] * num_faces)
+
+
+class FakeLandmarker:
+    """Deterministic LIVE_STREAM landmarker stand-in.
+
+    Answers every frame with the same canned result after delay_ms on its own
+    thread. Like MediaPipe, a frame submitted while the previous one is still
+    being processed replaces any frame waiting behind it.
+    """
+
+    def __init__(self, options, delay_ms=8.0, num_faces=1):
+        self.options = options
+        self.delay = delay_ms / 1000.0
+        self.result = canned_result(num_faces)
+        self._pending = LatestSlot()
+        self._thread = threading.Thread(target=self._run, name="fake-landmarker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._pending.get(timeout=0.1)
+            if item is None:
+                if self._pending.closed:
+                    break
+                continue
+            image, timestamp_ms = item
+            time.sleep(self.delay)
+            self.options.result_callback(self.result, image, timestamp_ms)
+
+    def detect_async(self, image, timestamp_ms):
+        self._pending.put((image, timestamp_ms))
+
+    def close(self):
+        self._pending.close()
+        self._thread.join(timeout=1.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _live_stream_options(callback):
+    from ml_backend.face_detection import initialize_face_landmarker, model_path
+
+    options = initialize_face_landmarker(model_path)
+    options.result_callback = callback
+    return options
+
+
+# Replays the source through the pipeline and returns the report dict. Sources are finite,
+# so the run ends after max_empty_reads failed reads (a video file stays open after its end).
+def run_benchmark(cap, real=False, fake_delay_ms=8.0, overlay_style="points", mask_path=None, display=False,
+                  tracker=None, roi=None, label=None, max_empty_reads=1):
+    from ml_backend.face_detection import convert_frame
+
+    timer = StageTimer()
+    pipeline = FramePipeline(cap, convert_frame, tracker=tracker, roi=roi, pool=BufferPool(), timer=timer,
+                             max_empty_reads=max_empty_reads)
+
+    # Same work as face_detection.print_result
+    store = BlendshapeStore()
+
+    def on_result(result, output_image, timestamp_ms):
+        store.append_result(result, timestamp_ms)
+
+    if real:
+        from ml_backend.face_detection import FaceLandmarker
+
+        options = pipeline.bind(_live_stream_options(on_result))
+        landmarker = FaceLandmarker.create_from_options(options)
+    else:
+        from types import SimpleNamespace
+
+        options = pipeline.bind(SimpleNamespace(result_callback=on_result))
+        landmarker = FakeLandmarker(options, delay_ms=fake_delay_ms)
+
+    overlay = OverlayRenderer(style=overlay_style) if overlay_style else None
+    masker = None
+    if mask_path:
+        from ml_backend.masking import FaceMask, MaskRenderer
+        masker = MaskRenderer(FaceMask.from_file(mask_path))
+
+    def render(frame, result, timestamp_ms):
+        faces = result.face_landmarks or []
+        if masker:
+            with timer.measure("mask"):
+                masker.apply(frame, faces)
+        if overlay:
+            with timer.measure("overlay"):
+                overlay.draw(frame, faces)
+        with timer.measure("display"):
+            if display:
+                cv2.imshow("Benchmark", frame)
+                cv2.waitKey(1)
+            else:
+                cv2.imencode(".jpg", frame)
+
+    start = time.perf_counter()
+    with landmarker:
+        pipeline.run(landmarker, render)
+    elapsed = time.perf_counter() - start
+    if display:
+        cv2.destroyAllWindows()
+
+    stats = pipeline.stats()
+    return {
+        "label": label,
+        "config": {
+            "real": real,
+            "source": type(getattr(cap, "cap", cap)).__name__,
+            "fake_delay_ms": None if real else fake_delay_ms,
+            "overlay": overlay_style,
+            "mask": mask_path,
+            "tracking": tracker is not None,
+            "roi": roi is not None,
+        },
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "opencv": cv2.__version__},
+        "elapsed_s": elapsed,
+        "throughput_fps": stats["rendered"] / elapsed if elapsed > 0 else 0.0,
+        "pipeline": stats,
+        "stages": timer.summary(),
+    }
+
+
+# Cold start of face_detection in a subprocess, returns {phase: seconds} for STARTUP_PHASES
+def measure_startup(width=640, height=480, frames=30, timeout=120):
+    with tempfile.TemporaryDirectory() as directory:
+        video = os.path.join(directory, "startup.mp4")
+        cap = SyntheticCapture(frames, width, height)
+        writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"mp4v"), 30.0, (width, height))
+        while cap.isOpened():
+            writer.write(cap.read()[1])
+        writer.release()
+
+        report_path = os.path.join(directory, "startup.json")
+        command = [sys.executable, "-m", "ml_backend.face_detection", "--headless", "--source", video,
+                   "--max-frames", "1", "--startup-report", report_path]
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        start = time.perf_counter()
+        subprocess.run(command, cwd=root, check=True, timeout=timeout, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+
+        with open(report_path) as report_file:
+            timings = json.load(report_file)
+    timings["process_s"] = elapsed
+    return timings
+
+
+# Returns a list of human readable regressions of report against baseline.
+# Stage slowdowns below min_delta_ms are ignored so sub-millisecond stages do not flap.
+def compare_reports(report, baseline, tolerance=0.1, min_delta_ms=0.5):
+    regressions = []
+    base_fps, fps = baseline.get("throughput_fps", 0.0), report.get("throughput_fps", 0.0)
+    if base_fps and fps < base_fps * (1 - tolerance):
+        regressions.append(f"throughput {fps:.1f} fps < baseline {base_fps:.1f} fps")
+
+    for stage in STAGES:
+        base, current = baseline.get("stages", {}).get(stage), report.get("stages", {}).get(stage)
+        if not base or not current:
+            continue
+        if current["p95_ms"] > max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + min_delta_ms):
+            regressions.append(f"{stage} p95 {current['p95_ms']:.2f} ms > baseline {base['p95_ms']:.2f} ms")
+
+    for phase in STARTUP_PHASES:
+        base, current = baseline.get("startup", {}).get(phase), report.get("startup", {}).get(phase)
+        if base is None or current is None:
+            continue
+        if current > max(base * (1 + tolerance), base + STARTUP_MIN_DELTA_S):
+            regressions.append(f"startup {phase} {current:.2f} s > baseline {base:.2f} s")
+    return regressions
+
+
+def format_report(report):
+    lines = [f"throughput: {report['throughput_fps']:.1f} fps over {report['elapsed_s']:.2f} s",
+             f"{'stage':<10} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+    for stage in STAGES:
+        summary = report["stages"].get(stage)
+        if summary:
+            lines.append(f"{stage:<10} {summary['count']:>6} {summary['p50_ms']:>8.2f} "
+                         f"{summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f}")
+    startup = report.get("startup")
+    if startup:
+        lines.append("startup: " + ", ".join(f"{phase} {startup[phase]:.2f}" for phase in STARTUP_PHASES
+                                             if phase in startup))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the face landmark pipeline on replayed frames.")
+    parser.add_argument("--video", help="replay this recording instead of synthetic frames")
+    parser.add_argument("--frames", type=int, default=300, help="number of synthetic frames")
+    parser.add_argument("--size", default="1280x720", help="synthetic frame size, WIDTHxHEIGHT")
+    parser.add_argument("--fps", type=float, default=30.0, help="replay rate, 0 replays as fast as possible")
+    parser.add_argument("--real", action="store_true", help="use the real FaceLandmarker")
+    parser.add_argument("--fake-delay-ms", type=float, default=8.0)
+    parser.add_argument("--overlay", choices=OVERLAY_STYLES, default="points")
+    parser.add_argument("--mask", help="warp this mask image onto the faces")
+    parser.add_argument("--display", action="store_true", help="show frames instead of JPEG encoding them")
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="fail if this run regressed against the baseline report")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--label")
+    parser.add_argument("--startup", action="store_true", help="also measure face_detection cold start")
+    args = parser.parse_args(argv)
+
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        if not cap.isOpened():
+            parser.error(f"could not open video: {args.video}")
+    else:
+        width, height = (int(value) for value in args.size.lower().split("x"))
+        cap = SyntheticCapture(args.frames, width, height)
+    cap = PacedCapture(cap, args.fps)
+
+    report = run_benchmark(cap, real=args.real, fake_delay_ms=args.fake_delay_ms, overlay_style=args.overlay,
+                           mask_path=args.mask, display=args.display, label=args.label)
+    if args.startup:
+        report["startup"] = measure_startup()
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import time
+import cv2
+import numpy as np
+
+PLOT_MODES = ("blit", "overlay", "none")
+
+# BGR colors used for the OpenCV sparklines, cycled per blendshape
+SPARKLINE_COLORS = ((255, 191, 0), (0, 165, 255), (180, 105, 255), (0, 255, 255), (255, 255, 255))
+
+
+# Newest `window` scores of one face for each name, padded with NaN on the left
+def _face_history(store, names, window, face_index, out):
+    history = store.window(window)
+    rows = history.faces == face_index
+    out.fill(np.nan)
+    count = int(rows.sum())
+    if count:
+        columns = [store.columns[name] for name in names]
+        out[:, window - count:] = history.scores[rows][:, columns].T
+    return count
+
+
+class BlendshapePlot:
+    """Live matplotlib graph of tracked blendshapes that only redraws its lines.
+
+    Axes, labels and legend are drawn once into a cached background. refresh()
+    restores that background, updates the existing line artists from the store
+    and blits them, so each refresh costs the same however long the session runs.
+    Call refresh() from the render loop, it throttles itself to `interval` seconds.
+    """
+
+    def __init__(self, store, names, window=100, interval=0.1, face_index=0):
+        import matplotlib.pyplot as plt
+
+        self.store = store
+        self.names = list(names)
+        self.window = window
+        self.interval = interval
+        self.face_index = face_index
+
+        self.fig, self.ax = plt.subplots()
+        self.ax.set_xlim(0, window - 1)
+        self.ax.set_ylim(0, 1)
+        self.ax.set_title("Live Blendshape Graph")
+        self.ax.set_xlabel("Frame")
+        self.ax.set_ylabel("Score")
+
+        self._x = np.arange(window)
+        self._y = np.full((len(self.names), window), np.nan)
+        self.lines = [self.ax.plot(self._x, self._y[i], label=name, animated=True)[0] for i, name in enumerate(self.names)]
+        self.ax.legend(loc='upper right')
+        self.fig.tight_layout()
+
+        self._background = None
+        self._last_refresh = 0.0
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def show(self):
+        import matplotlib.pyplot as plt
+
+        plt.ion()  # Enable interactive mode so that plot updates without blocking
+        plt.show()
+        self.fig.canvas.draw()
+
+    # Window resizes redraw the figure, so the cached background has to be taken again
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.interval:
+            return False
+        self._last_refresh = now
+
+        canvas = self.fig.canvas
+        if self._background is None:
+            canvas.draw()
+
+        _face_history(self.store, self.names, self.window, self.face_index, self._y)
+        canvas.restore_region(self._background)
+        for line, y_data in zip(self.lines, self._y):
+            line.set_ydata(y_data)
+            self.ax.draw_artist(line)
+        canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+        return True
+
+
+class BlendshapeSparklines:
+    """Draws the tracked blendshape history straight into the OpenCV frame.
+
+    Used instead of matplotlib when the graph should not cost anything outside
+    the render stage. Each refresh is one polyline per tracked blendshape.
+    """
+
+    def __init__(self, store, names, window=100, origin=(10, 130), size=(200, 60), face_index=0):
+        self.store = store
+        self.names = list(names)
+        self.window = window
+        self.origin = origin
+        self.size = size
+        self.face_index = face_index
+
+        width, height = size
+        self._x = np.rint(np.linspace(origin[0], origin[0] + width - 1, window)).astype(np.int32)
+        self._y = np.full((len(self.names), window), np.nan, dtype=np.float32)
+
+    def draw(self, frame):
+        x0, y0 = self.origin
+        width, height = self.size
+        cv2.rectangle(frame, (x0, y0), (x0 + width, y0 + height), (40, 40, 40), -1)
+
+        count = _face_history(self.store, self.names, self.window, self.face_index, self._y)
+        if count < 2:
+            return frame
+
+        ys = np.rint(y0 + height - 1 - np.clip(self._y[:, -count:], 0.0, 1.0) * (height - 1)).astype(np.int32)
+        for i, name in enumerate(self.names):
+            color = SPARKLINE_COLORS[i % len(SPARKLINE_COLORS)]
+            points = np.stack([self._x[-count:], ys[i]], axis=1)
+            cv2.polylines(frame, [points], False, color, 1)
+            cv2.putText(frame, name, (x0 + width + 5, y0 + 12 + 14 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+        return frame
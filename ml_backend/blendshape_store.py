@@ -0,0 +1,124 @@
+import threading
+from collections import namedtuple
+import numpy as np
+
+# Category names of the 52 scores produced by the face_landmarker.task blendshape model
+BLENDSHAPE_NAMES = (
+    "_neutral", "browDownLeft", "browDownRight", "browInnerUp", "browOuterUpLeft",
+    "browOuterUpRight", "cheekPuff", "cheekSquintLeft", "cheekSquintRight", "eyeBlinkLeft",
+    "eyeBlinkRight", "eyeLookDownLeft", "eyeLookDownRight", "eyeLookInLeft", "eyeLookInRight",
+    "eyeLookOutLeft", "eyeLookOutRight", "eyeLookUpLeft", "eyeLookUpRight", "eyeSquintLeft",
+    "eyeSquintRight", "eyeWideLeft", "eyeWideRight", "jawForward", "jawLeft",
+    "jawOpen", "jawRight", "mouthClose", "mouthDimpleLeft", "mouthDimpleRight",
+    "mouthFrownLeft", "mouthFrownRight", "mouthFunnel", "mouthLeft", "mouthLowerDownLeft",
+    "mouthLowerDownRight", "mouthPressLeft", "mouthPressRight", "mouthPucker", "mouthRight",
+    "mouthRollLower", "mouthRollUpper", "mouthShrugLower", "mouthShrugUpper", "mouthSmileLeft",
+    "mouthSmileRight", "mouthStretchLeft", "mouthStretchRight", "mouthUpperUpLeft", "mouthUpperUpRight",
+    "noseSneerLeft", "noseSneerRight",
+)
+
+BlendshapeWindow = namedtuple("BlendshapeWindow", ["timestamps", "faces", "scores", "matrices"])
+
+
+class BlendshapeStore:
+    """Fixed-capacity ring buffer of per-face blendshape scores and transformation matrices.
+
+    One row is stored per face per frame. Every row is written twice, at i and at
+    i + capacity, so the newest n rows are always one contiguous slice and window()
+    can return views instead of copies. Views are only valid until the rows they
+    cover are overwritten, copy them if they need to outlive the next capacity appends.
+    """
+
+    def __init__(self, capacity=3000, names=BLENDSHAPE_NAMES):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.names = tuple(names)
+        self.columns = {name: index for index, name in enumerate(self.names)}
+
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._faces = np.zeros(2 * capacity, dtype=np.int16)
+        self._scores = np.zeros((2 * capacity, len(self.names)), dtype=np.float32)
+        self._matrices = np.zeros((2 * capacity, 4, 4), dtype=np.float32)
+
+        self._total = 0
+        self._lock = threading.Lock()
+        self._category_order = None
+
+    def __len__(self):
+        return min(self._total, self.capacity)
+
+    @property
+    def total(self):
+        return self._total
+
+    def append(self, timestamp_ms, face_index, scores, matrix=None):
+        with self._lock:
+            position = self._total % self.capacity
+            for row in (position, position + self.capacity):
+                self._timestamps[row] = timestamp_ms
+                self._faces[row] = face_index
+                self._scores[row] = scores
+                if matrix is None:
+                    self._matrices[row] = 0.0
+                else:
+                    self._matrices[row] = matrix
+            self._total += 1
+
+    # Appends one row per face of a FaceLandmarkerResult
+    def append_result(self, result, timestamp_ms):
+        if not result.face_blendshapes:
+            return
+
+        matrices = result.facial_transformation_matrixes or []
+        for face_index, face_blendshapes in enumerate(result.face_blendshapes):
+            scores = np.fromiter((category.score for category in face_blendshapes), dtype=np.float32, count=len(face_blendshapes))
+            order = self._column_order(face_blendshapes)
+            if order is not None:
+                reordered = np.zeros(len(self.names), dtype=np.float32)
+                reordered[order] = scores
+                scores = reordered
+            matrix = matrices[face_index] if face_index < len(matrices) else None
+            self.append(timestamp_ms, face_index, scores, matrix)
+
+    # Maps the model's category order onto our columns, worked out once from the first result
+    def _column_order(self, face_blendshapes):
+        if self._category_order is None:
+            model_names = tuple(category.category_name for category in face_blendshapes)
+            if model_names == self.names:
+                self._category_order = False
+            else:
+                self._category_order = np.array([self.columns[name] for name in model_names], dtype=np.intp)
+        if self._category_order is False:
+            return None
+        return self._category_order
+
+    # Views of the newest n rows (all stored rows by default), oldest first
+    def window(self, n=None):
+        with self._lock:
+            available = min(self._total, self.capacity)
+            n = available if n is None else min(n, available)
+            end = self._total % self.capacity + self.capacity
+            rows = slice(end - n, end)
+            return BlendshapeWindow(
+                self._timestamps[rows], self._faces[rows], self._scores[rows], self._matrices[rows]
+            )
+
+    def column(self, name, n=None):
+        return self.window(n).scores[:, self.columns[name]]
+
+    def latest(self):
+        window = self.window(1)
+        if len(window.timestamps) == 0:
+            return None
+        return BlendshapeWindow(window.timestamps[0], window.faces[0], window.scores[0], window.matrices[0])
+
+    # Copies the stored rows into a DataFrame, only for offline analysis
+    def to_dataframe(self, n=None):
+        import pandas as pd
+
+        window = self.window(n)
+        data = pd.DataFrame(window.scores.copy(), columns=list(self.names))
+        data.insert(0, "face_index", window.faces.copy())
+        data.insert(0, "timestamp_ms", window.timestamps.copy())
+        return data
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+
+
+class BufferPool:
+    """Reference counted pool of frame-sized numpy arrays.
+
+    acquire() hands out a free array of the requested shape (or allocates one)
+    with a reference count of 1. Every owner that keeps the array beyond the
+    current call retains it and releases it when done; the array goes back on
+    the free list once the count drops to 0. Arrays are tracked by identity, so
+    releasing an array the pool does not know about is a no-op.
+    """
+
+    def __init__(self, max_free=8):
+        self.max_free = max_free
+
+        self._lock = threading.Lock()
+        self._free = defaultdict(list)
+        self._owned = {}
+        self._started = time.monotonic()
+
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reuses = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            free = self._free[key]
+            if free:
+                array = free.pop()
+                self.reuses += 1
+            else:
+                array = np.empty(key[0], dtype=key[1])
+                self.allocations += 1
+                self.allocated_bytes += array.nbytes
+            self._owned[id(array)] = [array, 1]
+        return array
+
+    # Starts tracking an array allocated outside the pool, e.g. by cap.read()
+    def adopt(self, array):
+        with self._lock:
+            self._owned[id(array)] = [array, 1]
+            self.allocations += 1
+            self.allocated_bytes += array.nbytes
+        return array
+
+    def retain(self, array):
+        with self._lock:
+            entry = self._owned.get(id(array))
+            if entry is not None:
+                entry[1] += 1
+        return array
+
+    def release(self, array):
+        with self._lock:
+            entry = self._owned.get(id(array))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._owned[id(array)]
+            free = self._free[(array.shape, array.dtype)]
+            if len(free) < self.max_free:
+                free.append(array)
+
+    def stats(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-6)
+            in_use = list(self._owned.values())
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "allocations_per_second": self.allocations / elapsed,
+                "allocated_mb_per_second": self.allocated_bytes / elapsed / 1e6,
+                "in_use": len(in_use),
+                "in_use_bytes": sum(array.nbytes for array, _ in in_use),
+                "free": sum(len(free) for free in self._free.values()),
+            }
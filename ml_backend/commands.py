@@ -0,0 +1,154 @@
+import json
+from collections import OrderedDict, deque, namedtuple
+from dataclasses import dataclass, field
+
+# Request types published to the user-requests topic by aws_backend/lambda_api/main.py
+REQUEST_TYPES = ("feature-change", "upload-image", "get-user-data")
+
+Command = namedtuple("Command", ["user_id", "request_type", "event"])
+
+
+@dataclass
+class UserState:
+    user_id: str
+    features: dict = field(default_factory=dict)
+    image_url: str = None
+    data_requested: bool = False
+    commands: int = 0
+
+
+def _decode(payload):
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        payload = bytes(payload).decode("utf-8")
+    return json.loads(payload)
+
+
+def _to_command(message):
+    if not isinstance(message, dict):
+        return None
+
+    # Older clients sent a bare {"color": ...} message, treat it as an anonymous color change
+    if "requestType" not in message and "color" in message:
+        return Command(None, "feature-change", {"feature": "color", "featureParam": message["color"]})
+
+    request_type = message.get("requestType")
+    event = message.get("event") or {}
+    if request_type not in REQUEST_TYPES or not isinstance(event, dict):
+        return None
+    # Fields that end up in fold_commands keys must be hashable scalars
+    user_id = message.get("userId")
+    if user_id is not None and not isinstance(user_id, (str, int)):
+        return None
+    if request_type == "feature-change":
+        track_id = event.get("trackId")
+        if not isinstance(event.get("feature"), str):
+            return None
+        if track_id is not None and (not isinstance(track_id, int) or isinstance(track_id, bool)):
+            return None
+    return Command(user_id, request_type, event)
+
+
+# Turns one raw MQTT payload into a Command, or None if it is not a valid request
+def parse_command(payload):
+    return _to_command(_decode(payload))
+
+
+# Like parse_command, but a POST /v1/batch message ({"requestType": "batch", "commands": [...]})
+# becomes one entry per command; invalid entries are None
+def parse_commands(payload):
+    message = _decode(payload)
+    if isinstance(message, dict) and message.get("requestType") == "batch":
+        commands = message.get("commands")
+        if not isinstance(commands, list):
+            return [None]
+        return [_to_command(command) for command in commands]
+    return [_to_command(message)]
+
+
+# Keeps only the latest feature change per (user, feature), everything else in arrival order.
+# Face-local changes (no user, a trackId) are folded per face.
+def fold_commands(commands):
+    folded = OrderedDict()
+    for position, command in enumerate(commands):
+        if command.request_type == "feature-change":
+            key = (command.user_id, command.event.get("trackId"), "feature-change", command.event["feature"])
+            folded.pop(key, None)
+        else:
+            key = position
+        folded[key] = command
+    return list(folded.values())
+
+
+class CommandQueue:
+    """Hands MQTT messages from the awscrt callback thread to the frame loop.
+
+    The callback only appends the raw payload to a bounded deque; append and
+    popleft are atomic in CPython, so neither side takes a lock. When the queue
+    is full the oldest message is dropped. drain() runs between frames, parses
+    everything queued so far (unpacking batch messages) and folds repeated
+    feature changes.
+    """
+
+    def __init__(self, max_messages=1024):
+        self._messages = deque(maxlen=max_messages)
+        self.received = 0
+        self.drained = 0
+        self.malformed = 0
+
+    # Matches the awscrt subscribe callback signature
+    def on_message(self, topic, payload, **kwargs):
+        self.push(payload)
+
+    def push(self, payload):
+        self.received += 1
+        self._messages.append(payload)
+
+    @property
+    def dropped(self):
+        return max(self.received - self.drained - len(self._messages), 0)
+
+    def drain(self):
+        commands = []
+        while True:
+            try:
+                payload = self._messages.popleft()
+            except IndexError:
+                break
+            self.drained += 1
+            try:
+                parsed = parse_commands(payload)
+            except (UnicodeDecodeError, ValueError):
+                parsed = [None]
+            for command in parsed:
+                if command is None:
+                    self.malformed += 1
+                else:
+                    commands.append(command)
+        return fold_commands(commands)
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class UserRegistry:
+    """Per-user state built up from the commands applied so far."""
+
+    def __init__(self):
+        self.users = {}
+
+    def get(self, user_id):
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = UserState(user_id)
+        return state
+
+    def apply(self, command):
+        state = self.get(command.user_id)
+        state.commands += 1
+        if command.request_type == "feature-change":
+            state.features[command.event["feature"]] = command.event.get("featureParam")
+        elif command.request_type == "upload-image":
+            state.image_url = command.event.get("imageUrl")
+        elif command.request_type == "get-user-data":
+            state.data_requested = True
+        return state
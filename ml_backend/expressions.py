@@ -0,0 +1,231 @@
+"""Expression events (blink, smile, brow raise, ...) from blendshape scores.
+
+Rules are declarative, e.g. from a JSON file:
+
+    {
+      "smile": {"blendshapes": ["mouthSmileLeft", "mouthSmileRight"], "combine": "mean",
+                "on": 0.6, "off": 0.4, "hold": 5, "alpha": 0.5,
+                "feature": "mask", "featureParam": ["tiger", "fox"]}
+    }
+
+Per face and rule the combined score (mean, min or max of the listed
+blendshapes) is smoothed with an exponential moving average (alpha is the
+weight of the new score). An expression starts once the average has stayed at
+or above `on` for `hold` frames in a row and ends when it drops to `off` or
+below, so a score hovering around one threshold cannot toggle it. Every rule
+of every face is updated at once: ExpressionEngine compiles the rules into
+index and threshold arrays and each frame is a handful of NumPy operations on
+(faces, rules) arrays, with constant work per face and rule.
+
+A rule with a feature turns its start events into feature-change commands
+for that face, the same commands MQTT delivers, without the round trip
+through the API. A list of featureParams is cycled through.
+
+    python -m ml_backend.face_detection --num-faces 2 --expressions default
+    python -m ml_backend.face_detection --expressions rules.json
+"""
+import json
+from collections import namedtuple
+from dataclasses import dataclass
+import numpy as np
+from ml_backend.blendshape_store import BLENDSHAPE_NAMES
+
+COMBINES = ("mean", "min", "max")
+
+ExpressionEvent = namedtuple("ExpressionEvent", ["track_id", "expression", "phase", "value"])
+
+
+@dataclass(frozen=True)
+class ExpressionRule:
+    name: str
+    blendshapes: tuple
+    combine: str = "mean"
+    on: float = 0.5
+    off: float = 0.3
+    hold: int = 3  # Frames at or above `on` before the expression starts
+    alpha: float = 0.5
+    feature: str = None  # Feature changed when the expression starts, e.g. "mask" or "color"
+    feature_params: tuple = ()
+
+    def __post_init__(self):
+        unknown = [name for name in self.blendshapes if name not in BLENDSHAPE_NAMES]
+        if not self.blendshapes or unknown:
+            raise ValueError(f"rule {self.name!r} needs known blendshapes, got {list(self.blendshapes)}")
+        if self.combine not in COMBINES:
+            raise ValueError(f"rule {self.name!r}: combine must be one of {', '.join(COMBINES)}")
+        if not 0 <= self.off < self.on <= 1:
+            raise ValueError(f"rule {self.name!r}: need 0 <= off < on <= 1")
+        if self.hold < 1 or not 0 < self.alpha <= 1:
+            raise ValueError(f"rule {self.name!r}: hold must be at least 1 and alpha in (0, 1]")
+        if self.feature is not None and not self.feature_params:
+            raise ValueError(f"rule {self.name!r}: a feature needs a featureParam")
+
+
+DEFAULT_RULES = (
+    ExpressionRule("blink", ("eyeBlinkLeft", "eyeBlinkRight"), combine="min", on=0.5, off=0.25, hold=1, alpha=0.8),
+    ExpressionRule("smile", ("mouthSmileLeft", "mouthSmileRight"), on=0.6, off=0.4, hold=5,
+                   feature="color", feature_params=("green", "blue", "red")),
+    ExpressionRule("brow_raise", ("browInnerUp", "browOuterUpLeft", "browOuterUpRight"), on=0.5, off=0.3, hold=5),
+    ExpressionRule("jaw_open", ("jawOpen",), on=0.5, off=0.3, hold=3),
+)
+
+
+# Rules from a {name: {...}} mapping like the one in the module docstring
+def parse_rules(spec):
+    rules = []
+    for name, fields in spec.items():
+        params = fields.get("featureParam", ())
+        rules.append(ExpressionRule(
+            name,
+            tuple(fields.get("blendshapes", ())),
+            combine=fields.get("combine", "mean"),
+            on=float(fields.get("on", 0.5)),
+            off=float(fields.get("off", 0.3)),
+            hold=int(fields.get("hold", 3)),
+            alpha=float(fields.get("alpha", 0.5)),
+            feature=fields.get("feature"),
+            feature_params=tuple(params) if isinstance(params, list) else (params,),
+        ))
+    return rules
+
+
+# "default" or a path to a JSON rules file
+def load_rules(source):
+    if source == "default":
+        return list(DEFAULT_RULES)
+    with open(source) as rules_file:
+        return parse_rules(json.load(rules_file))
+
+
+class ExpressionEngine:
+    """Rolling expression state for every tracked face, see the module docstring.
+
+    State lives in (rows, rules) arrays with one row per track ID; rows of tracks
+    that have not been seen for max_missing frames are reused.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, max_missing=30):
+        self.rules = list(rules)
+        self.max_missing = max_missing
+        width = max(len(rule.blendshapes) for rule in self.rules)
+        columns = {name: column for column, name in enumerate(BLENDSHAPE_NAMES)}
+
+        # Blendshape columns per rule, padded by repeating the first so min/max are unaffected
+        self._columns = np.array([[columns[name] for name in rule.blendshapes] +
+                                  [columns[rule.blendshapes[0]]] * (width - len(rule.blendshapes))
+                                  for rule in self.rules], dtype=np.intp)
+        self._weights = np.array([[1 / len(rule.blendshapes)] * len(rule.blendshapes) +
+                                  [0.0] * (width - len(rule.blendshapes)) for rule in self.rules], dtype=np.float32)
+        self._combine = np.array([COMBINES.index(rule.combine) for rule in self.rules])
+        self._on = np.array([rule.on for rule in self.rules], dtype=np.float32)
+        self._off = np.array([rule.off for rule in self.rules], dtype=np.float32)
+        self._hold = np.array([rule.hold for rule in self.rules], dtype=np.int32)
+        self._alpha = np.array([rule.alpha for rule in self.rules], dtype=np.float32)
+
+        self._rows = {}
+        self._ema = np.zeros((0, len(self.rules)), dtype=np.float32)
+        self._streak = np.zeros((0, len(self.rules)), dtype=np.int32)
+        self._active = np.zeros((0, len(self.rules)), dtype=bool)
+        self._last_seen = np.zeros(0, dtype=np.int64)
+        self._frame = 0
+        self._category_order = None
+        self._cycle = [0] * len(self.rules)
+        self.events = 0
+
+    # (F, 52) scores in BLENDSHAPE_NAMES order from a result's face_blendshapes
+    def scores(self, face_blendshapes):
+        scores = np.array([[category.score for category in face] for face in face_blendshapes], dtype=np.float32)
+        if self._category_order is None:
+            names = tuple(category.category_name for category in face_blendshapes[0])
+            self._category_order = False if names == BLENDSHAPE_NAMES else \
+                np.array([BLENDSHAPE_NAMES.index(name) for name in names], dtype=np.intp)
+        if self._category_order is not False:
+            reordered = np.zeros((len(scores), len(BLENDSHAPE_NAMES)), dtype=np.float32)
+            reordered[:, self._category_order] = scores
+            scores = reordered
+        return scores
+
+    def _rows_for(self, track_ids):
+        stale = self._frame - self._last_seen > self.max_missing
+        for track_id, row in list(self._rows.items()):
+            if stale[row]:
+                del self._rows[track_id]
+
+        rows = []
+        for track_id in track_ids:
+            row = self._rows.get(track_id)
+            if row is None:
+                used = set(self._rows.values())
+                row = next((row for row in range(len(self._last_seen)) if row not in used), None)
+                if row is None:
+                    row = self._grow()
+                self._rows[track_id] = row
+                self._ema[row] = np.nan
+                self._streak[row] = 0
+                self._active[row] = False
+            rows.append(row)
+        return np.array(rows, dtype=np.intp)
+
+    def _grow(self):
+        row = len(self._last_seen)
+        capacity = max(4, 2 * row)
+        for name in ("_ema", "_streak", "_active"):
+            current = getattr(self, name)
+            grown = np.zeros((capacity, current.shape[1]), dtype=current.dtype)
+            grown[:row] = current
+            setattr(self, name, grown)
+        last_seen = np.full(capacity, -self.max_missing - 1, dtype=np.int64)
+        last_seen[:row] = self._last_seen
+        self._last_seen = last_seen
+        return row
+
+    # Feeds one frame: (F, 52) scores for the faces with these track IDs, returns ExpressionEvents
+    def update(self, track_ids, scores):
+        self._frame += 1
+        if not len(track_ids):
+            return []
+        rows = self._rows_for(track_ids)
+        self._last_seen[rows] = self._frame
+
+        picked = scores[:, self._columns]  # (F, rules, width)
+        combined = np.stack([(picked * self._weights).sum(axis=2), picked.min(axis=2), picked.max(axis=2)])
+        values = np.take_along_axis(combined, self._combine[None, None, :].repeat(len(rows), axis=1), axis=0)[0]
+
+        previous = self._ema[rows]
+        ema = np.where(np.isnan(previous), values, self._alpha * values + (1 - self._alpha) * previous)
+        active = self._active[rows]
+        streak = np.where(~active & (ema >= self._on), self._streak[rows] + 1, 0)
+        started = ~active & (streak >= self._hold)
+        ended = active & (ema <= self._off)
+
+        self._ema[rows] = ema
+        self._streak[rows] = np.where(started, 0, streak)
+        self._active[rows] = (active | started) & ~ended
+
+        events = [ExpressionEvent(track_ids[face], self.rules[rule].name, "start", float(ema[face, rule]))
+                  for face, rule in zip(*np.nonzero(started))]
+        events += [ExpressionEvent(track_ids[face], self.rules[rule].name, "end", float(ema[face, rule]))
+                   for face, rule in zip(*np.nonzero(ended))]
+        self.events += len(events)
+        return events
+
+    def active(self, track_id):
+        row = self._rows.get(track_id)
+        if row is None:
+            return []
+        return [rule.name for rule, on in zip(self.rules, self._active[row]) if on]
+
+    # The feature-change event a start event triggers, or None; featureParam lists are cycled per rule
+    def feature_change(self, event):
+        if event.phase != "start":
+            return None
+        index = next(index for index, rule in enumerate(self.rules) if rule.name == event.expression)
+        rule = self.rules[index]
+        if rule.feature is None:
+            return None
+        param = rule.feature_params[self._cycle[index] % len(rule.feature_params)]
+        self._cycle[index] += 1
+        return {"feature": rule.feature, "featureParam": param}
+
+    def stats(self):
+        return {"faces": len(self._rows), "rules": len(self.rules), "events": self.events}
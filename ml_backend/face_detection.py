@@ -1,17 +1,40 @@
-import json
-import cv2
+"""Live face landmarks, masks and overlays from a camera, video file or stream.
+
+MediaPipe, awscrt/awsiot and matplotlib are only imported once the feature
+that needs them is used, so importing this module is cheap. --headless never
+opens a window or a matplotlib figure and sends frames to a sink instead (see
+sinks.py). --startup-report writes how long import, model load and the first
+frame took; ml_backend.benchmark --startup tracks it over time.
+
+    python -m ml_backend.face_detection
+    python -m ml_backend.face_detection --headless --mqtt --metrics-port 9100
+    python -m ml_backend.face_detection --headless --source rtsp://booth-1/stream --sink tcp://127.0.0.1:9000
+    python -m ml_backend.face_detection --stream-port 8080   # MJPEG at http://127.0.0.1:8080/stream/preview
+"""
 import time
+STARTUP_STARTED = time.perf_counter()
+import os
+import json
+import argparse
+import importlib
 import threading
-import logging
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-from awscrt import mqtt
-from awsiot import mqtt_connection_builder
+import cv2
+from ml_backend.blendshape_plot import BlendshapePlot, BlendshapeSparklines
+from ml_backend.blendshape_store import BlendshapeStore
+from ml_backend.buffer_pool import BufferPool
+from ml_backend.commands import CommandQueue, UserRegistry
+from ml_backend.expressions import ExpressionEngine, load_rules
+from ml_backend.identity import IdentityTracker
+from ml_backend.mask_cache import LocalMaskSource, MaskCache, S3MaskSource
+from ml_backend.masking import FaceMask, MaskRenderer
+from ml_backend.metrics import MetricsRegistry, MetricsServer
+from ml_backend.pipeline import FramePipeline
+from ml_backend.quality import LandmarkerRebuilder, QualityController, landmarker_options
+from ml_backend.recording import Recorder
+from ml_backend.rendering import LandmarkResult, OverlayRenderer
+from ml_backend.roi import RoiSelector
+from ml_backend.sinks import SINK_SPECS, TeeSink, WindowSink, open_sink
+from ml_backend.tracking import LandmarkTracker
 
 
 # Create a face landmarker instance with the live stream mode:
@@ -20,6 +43,9 @@ landmark_results = None
 # Default 
 color = (0, 255, 0)  # Default: Green
 
+# featureParam values accepted by a "color" feature change
+FEATURE_COLORS = {"red": (0, 0, 255), "blue": (255, 0, 0), "green": (0, 255, 0)}
+
 # When True, model will receive requests from AWS
 # Only enable when proper files are in your directory
 MQTT_TOPIC_ENABLED = False
@@ -28,98 +54,135 @@ MQTT_TOPIC_ENABLED = False
 ENDPOINT = "aevqdnds5bghe-ats.iot.us-east-1.amazonaws.com"
 CLIENT_ID = "eoh-processing-unit"
 TOPIC = "user-requests"
-CERTIFICATE_PATH = "./certificates/eoh-certificate.pem.crt"
-PRIVATE_KEY_PATH = "./certificates/eoh-private.pem.key"
-ROOT_CA_PATH = "./certificates/AmazonRootCA1.pem"
-
-model_path = "models/face_landmarker.task"
-
-BaseOptions = mp.tasks.BaseOptions
-FaceLandmarker = mp.tasks.vision.FaceLandmarker
-FaceLandmarkerOptions = mp.tasks.vision.FaceLandmarkerOptions
-FaceLandmarkerResult = mp.tasks.vision.FaceLandmarkerResult
-VisionRunningMode = mp.tasks.vision.RunningMode
-
-
-blendshape_results = []  # Stores all frames' blendshapes
-transformation_matrices = []  # Stores transformation matrices
-blendShapeData = pd.DataFrame() # Stores all blendshapes in a DataFrame
-
-def print_result(result: FaceLandmarkerResult, output_image: mp.Image, timestamp_ms: int):
-    global landmark_results, blendshape_results, transformation_matrices, blendShapeData
+# Paths are relative to ml_backend/ so the module can be run from the repo root
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CERTIFICATE_PATH = os.path.join(BASE_DIR, "certificates", "eoh-certificate.pem.crt")
+PRIVATE_KEY_PATH = os.path.join(BASE_DIR, "certificates", "eoh-private.pem.key")
+ROOT_CA_PATH = os.path.join(BASE_DIR, "certificates", "AmazonRootCA1.pem")
+
+model_path = os.path.join(BASE_DIR, "models", "face_landmarker.task")
+
+# Names this module used to import eagerly, resolved on first attribute access instead:
+# name -> (module, attribute or None for the module itself)
+_LAZY_NAMES = {
+    "mp": ("mediapipe", None),
+    "python": ("mediapipe.tasks.python", None),
+    "vision": ("mediapipe.tasks.python.vision", None),
+    "BaseOptions": ("mediapipe.tasks.python", "BaseOptions"),
+    "FaceLandmarker": ("mediapipe.tasks.python.vision", "FaceLandmarker"),
+    "FaceLandmarkerOptions": ("mediapipe.tasks.python.vision", "FaceLandmarkerOptions"),
+    "FaceLandmarkerResult": ("mediapipe.tasks.python.vision", "FaceLandmarkerResult"),
+    "VisionRunningMode": ("mediapipe.tasks.python.vision", "RunningMode"),
+    "mqtt": ("awscrt.mqtt", None),
+    "mqtt_connection_builder": ("awsiot.mqtt_connection_builder", None),
+}
+
+def __getattr__(name):
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = _LAZY_NAMES[name]
+    value = importlib.import_module(module_name)
+    return getattr(value, attribute) if attribute else value
+
+# Seconds from the start of this module's import to each startup phase
+startup_timings = {}
+
+def mark_startup(phase):
+    if phase not in startup_timings:
+        startup_timings[phase] = time.perf_counter() - STARTUP_STARTED
+
+
+# Number of face rows kept for plotting and export (~100 seconds of one face at 30 fps)
+BLENDSHAPE_HISTORY = 3000
+
+# Stores blendshapes and transformation matrices in a fixed-size ring buffer
+blendshape_store = BlendshapeStore(capacity=BLENDSHAPE_HISTORY)
+
+# When set, every result is also streamed to a new recording under this directory (see recording.py)
+RECORDING_DIR = None
+# Also record every face's landmarks (~330 MB per hour instead of ~20 MB)
+RECORD_LANDMARKS = False
+recorder = None
+
+def print_result(result: "FaceLandmarkerResult", output_image: "mp.Image", timestamp_ms: int):
+    global landmark_results
     landmark_results = result
 
-
     if result.face_blendshapes:
-        frame_blendshapes = []  # Stores blendshapes for the current frame
-        
-        for face_blendshapes in result.face_blendshapes:
-            face_data = {blendshape.category_name: blendshape.score for blendshape in face_blendshapes}
-            frame_blendshapes.append(face_data)
-
-        blendShapeData = pd.concat([blendShapeData, pd.DataFrame(frame_blendshapes)], ignore_index=True)
-
-        blendshape_results.append(frame_blendshapes)  # Save this frame's blendshapes
+        blendshape_store.append_result(result, timestamp_ms)
+    if recorder:
+        recorder.record(result, timestamp_ms)
 
 
 # Blendshapes we want to track live
 tracked_blendshapes = ["mouthSmileLeft", "eyeBlinkRight", "browInnerUp"]
 
-blendshape_history = {name: [] for name in tracked_blendshapes}
-frame_indices = []
+# When True, the landmarker only runs every few frames and optical flow tracks the face in between
+TRACKING_ENABLED = False
+
+# When True, the landmarker only sees a crop around the last detected faces (full frame every 30 frames)
+ROI_ENABLED = False
 
-# Set up the plot
-fig, ax = plt.subplots()
+# Optional mask image laid out on the canonical face UV map, warped onto every face
+MASK_PATH = None
 
-def update_plot(frame):
-    global blendShapeData, blendshape_history, frame_indiqces
-    # columns = blendShapeData.columns.to_list()
-    # print(columns)
+# Faces the landmarker looks for; each one keeps a track ID, and a "mask" feature change
+# from a user puts that user's mask on their own face only (see identity.py)
+NUM_FACES = 1
+SMOOTHING = 0.0  # Weight of the previous landmarks of the same face, 0 draws the raw landmarks
+user_masks = {}
+face_masks = {}  # Track ID -> mask, for faces nobody has claimed; dropped with the track
 
-    if blendShapeData.empty:
-        return
+# Expression rules ("default" or a JSON file, see expressions.py); events can change masks or features locally
+EXPRESSIONS = None
 
-    # Assume each row = one face in one frame
-    latest_row = blendShapeData.iloc[-1]
+# On-device mask cache, filled from S3 when AWS is enabled or from MASK_SOURCE_DIR offline
+MASK_CACHE_DIR = os.path.join(BASE_DIR, "downloads", "masks")
+MASK_SOURCE_DIR = None  # Local directory laid out like the bucket (masks/<file>)
+MASK_KEY = None  # Mask to start with, e.g. "masks/tiger.png"
 
-    # Append current frame index
-    current_index = frame_indices[-1] + 1 if frame_indices else 0
-    frame_indices.append(current_index)
+# "blit" shows a matplotlib graph, "overlay" draws it into the video frame, "none" disables it
+PLOT_MODE = "blit"
 
-    for name in tracked_blendshapes:
-        score = latest_row.get(name, 0.0)
-        blendshape_history[name].append(score)
+# When True, frames go to SINK instead of a window and the matplotlib graph is never created
+HEADLESS = False
+SINK = None  # See sinks.SINK_SPECS; defaults to "null" when headless and "window" otherwise
+STREAM_PORT = None  # Also serve the rendered frames as MJPEG on this port, e.g. for the React live feed
 
- 
-    #Clear and replot
-    ax.clear()
+# When set, quality is lowered step by step to hold this frame rate (and latency), see quality.py
+TARGET_FPS = None
+MAX_LATENCY_MS = None
 
-    # Plot only the latest 100 points for a sliding window effect
-    window_size = 100
-    for name in tracked_blendshapes:
-        y_data = blendshape_history[name][-window_size:]
-        x_data = frame_indices[-window_size:]
-        ax.plot(x_data, y_data, label=name)
+# Messages from the user-requests topic wait here until the next frame boundary
+commands = CommandQueue()
+users = UserRegistry()
 
-    ax.set_ylim(0, 1)
-    ax.set_title("Live Blendshape Graph")
-    ax.set_xlabel("Frame")
-    ax.set_ylabel("Score")
-    ax.legend(loc='upper right')
-    plt.tight_layout()
+# Stage timings and counters are always recorded; set a port to serve them at http://127.0.0.1:<port>/metrics
+METRICS_PORT = None
+metrics = MetricsRegistry()
+metrics.add_collector("commands", lambda: {"queued": len(commands), "received": commands.received,
+                                           "dropped": commands.dropped, "malformed": commands.malformed})
+metrics.add_collector("startup", lambda: dict(startup_timings))
 
-def initialize_face_landmarker(model_path: str):
+def initialize_face_landmarker(model_path: str, num_faces: int = 1):
+    import mediapipe as mp
+
+    BaseOptions = mp.tasks.BaseOptions
+    FaceLandmarkerOptions = mp.tasks.vision.FaceLandmarkerOptions
+    VisionRunningMode = mp.tasks.vision.RunningMode
     options = FaceLandmarkerOptions(
         base_options=BaseOptions(model_asset_path=model_path),
         running_mode=VisionRunningMode.LIVE_STREAM,
         result_callback=print_result,
+        num_faces=num_faces,
         output_face_blendshapes=True,
         output_facial_transformation_matrixes=True 
     )
     return options
 
-def initialize_camera():
-    cap = cv2.VideoCapture(0)
+# source is a camera index, video file or stream URL
+def initialize_camera(source=0):
+    cap = cv2.VideoCapture(source)
 
     if not cap.isOpened():
         raise Exception("Error: Could not open camera.")
@@ -128,6 +191,9 @@ def initialize_camera():
 def initialize_mqtt_connection():
     mqtt_connection = None
     if MQTT_TOPIC_ENABLED:
+        from awscrt import mqtt
+        from awsiot import mqtt_connection_builder
+
         print("Connecting to AWS IoT...")
         mqtt_connection = mqtt_connection_builder.mtls_from_path(
             endpoint=ENDPOINT,
@@ -145,78 +211,325 @@ def initialize_mqtt_connection():
 
     return mqtt_connection
 
-def on_message_received(topic, payload, **kwargs):
-            global color
+def initialize_mask_cache():
+    if MASK_SOURCE_DIR:
+        source = LocalMaskSource(MASK_SOURCE_DIR)
+    elif MQTT_TOPIC_ENABLED:
+        source = S3MaskSource()
+    else:
+        return None
 
-            try:
-                payload_str = payload.decode("utf-8")  # Decode byte payload to string
-                event = json.loads(payload_str)  # Parse JSON string
-                print(f"Message received on topic {topic}:")
-                print(json.dumps(event, indent=4))
+    mask_cache = MaskCache(source, MASK_CACHE_DIR)
+    mask_cache.prefetch()  # Download and decode the mask listing in the background
+    return mask_cache
 
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {e}")
-            except Exception as e:
-                print(f"Unexpected error: {e}")
+# Runs on the awscrt thread, so it only queues the raw payload for the frame loop
+def on_message_received(topic, payload, **kwargs):
+    with metrics.span("mqtt_callback"):
+        commands.on_message(topic, payload, **kwargs)
+
+# Loads a mask for a user off the render thread; it is drawn from the next frame after it is ready.
+# With a track_id the mask belongs to that unclaimed face only. Commands without a user or a track
+# change the mask of every face that has no mask of its own.
+def load_user_mask(mask_cache, user_id, name, masker=None, track_id=None):
+    def run():
+        try:
+            mask = mask_cache.get(mask_cache.find(name))
+        except Exception as e:
+            print(f"Failed to load mask {name!r} for user {user_id}: {e}")
+            return
+        if track_id is not None:
+            face_masks[track_id] = mask
+        elif user_id is None:
+            if masker:
+                masker.mask = mask
+        else:
+            user_masks[user_id] = mask
+
+    threading.Thread(target=run, name="user-mask", daemon=True).start()
+
+# Applies every command queued since the last frame, called between frames on the render thread
+def apply_commands(overlay=None, masker=None, identities=None, mask_cache=None):
+    with metrics.span("commands_drain"):
+        drained = commands.drain()
+    for command in drained:
+        # Expression changes on unclaimed faces carry a trackId and stay out of the shared user state
+        face_local = command.user_id is None and "trackId" in command.event
+        state = None if face_local else users.apply(command)
+        print(f"Applied {command.request_type} for user {command.user_id}: {command.event}")
+        if command.request_type == "feature-change" and command.event["feature"] == "color":
+            new_color = FEATURE_COLORS.get(command.event.get("featureParam"))
+            if new_color and overlay:
+                overlay.color = new_color
+        elif command.request_type == "feature-change" and command.event["feature"] == "mask":
+            if identities and command.user_id is not None:
+                identities.assign_user(command.user_id, command.event.get("trackId"))
+            if mask_cache and command.event.get("featureParam"):
+                load_user_mask(mask_cache, command.user_id, command.event["featureParam"], masker,
+                               command.event.get("trackId") if face_local else None)
+        elif command.request_type == "get-user-data":
+            print(f"User data: {state}")
+
+# Turns expression events into the same commands MQTT delivers, applied at the next frame boundary.
+# A claimed face changes its user's features; a face nobody has claimed gets a face-local command
+# (no user, its trackId), so its mask stays on it without claiming the face for anyone.
+def queue_expression_commands(expressions, events, tracks):
+    users_by_track = {track.track_id: track.user_id for track in tracks}
+    for event in events:
+        change = expressions.feature_change(event)
+        if change is None:
+            continue
+        user_id = users_by_track.get(event.track_id)
+        if user_id is None:
+            change["trackId"] = event.track_id
+        print(f"Expression {event.expression} on face {event.track_id}: {change}")
+        commands.push(json.dumps({"requestType": "feature-change", "userId": user_id, "event": change}))
+
+# Converts a captured BGR frame into the image format the landmarker expects
+# out is an optional preallocated RGB array; mp.Image copies the pixels, so it can be reused right after
+def convert_frame(frame, out=None):
+    import mediapipe as mp
+
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out)
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_rgb)
+
+# Draws one (frame, result) pair from the pipeline into the sink (a window by default), returns False to stop
+def render_frame(frame, result, overlay, sparklines=None, masker=None, sink=None, masks=None):
+    # Warp the mask (per face when masks is given) and draw landmarks if detected
+    if result and result.face_landmarks:
+        if masker:
+            masker.apply(frame, result.face_landmarks, masks)
+        if overlay:
+            overlay.draw(frame, result.face_landmarks)
+
+    # Display facial blendshapes in OpenCV overlay
+    if result and result.face_blendshapes:
+        for i, face_blendshapes in enumerate(result.face_blendshapes):
+            y_offset = 20
+            for blendshape in face_blendshapes[:5]:  # Show top 5 blendshapes
+                text = f"{blendshape.category_name}: {blendshape.score:.2f}"
+                cv2.putText(frame, text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                y_offset += 20
+
+    if sparklines:
+        sparklines.draw(frame)
+
+    if sink is None:
+        sink = WindowSink()
+    return sink.write(frame)
 
 # Start face landmark detection
-def run_face_landmark_detection(cap, options, color=(0, 255, 0)):
+def run_face_landmark_detection(cap, options, color=(0, 255, 0), overlay_style="points", plot_mode="none", mask=None,
+                                tracker=None, roi=None, sink=None, max_frames=None, max_empty_reads=None, quality=None,
+                                identities=None, mask_cache=None, expressions=None):
+    import mediapipe as mp
+
+    global recorder
+    sink = sink or WindowSink()
     mqtt_connection = initialize_mqtt_connection()
 
-    with FaceLandmarker.create_from_options(options) as landmarker:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                print("Ignoring empty camera frame.")
-                continue
-
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_rgb)
-            frame_timestamp_ms = int(time.time() * 1000)
-            landmarker.detect_async(mp_image, frame_timestamp_ms)
-            time.sleep(0.01)
-
-            # Draw landmarks if detected
-            if landmark_results and landmark_results.face_landmarks:
-                for face_landmarks in landmark_results.face_landmarks:
-                    for landmark in face_landmarks:
-                        x, y = int(landmark.x * frame.shape[1]), int(landmark.y * frame.shape[0])
-                        cv2.circle(frame, (x, y), 1, color, -1)  # Draw dots for landmarks
-
-            # Display facial blendshapes in OpenCV overlay
-            if landmark_results and landmark_results.face_blendshapes:
-                for i, face_blendshapes in enumerate(landmark_results.face_blendshapes):
-                    y_offset = 20
-                    for blendshape in face_blendshapes[:5]:  # Show top 5 blendshapes
-                        text = f"{blendshape.category_name}: {blendshape.score:.2f}"
-                        cv2.putText(frame, text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                        y_offset += 20
-
-            cv2.imshow('MediaPipe Face Detection', frame)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+    if RECORDING_DIR:
+        recorder = Recorder(os.path.join(RECORDING_DIR, time.strftime("session-%Y%m%d-%H%M%S")),
+                            landmarks=RECORD_LANDMARKS)
+        metrics.add_collector("recorder", lambda: {"recorded": recorder.recorded, "dropped": recorder.dropped})
+
+    plot, sparklines = None, None
+    if plot_mode == "blit":
+        plot = BlendshapePlot(blendshape_store, tracked_blendshapes)
+        plot.show()
+    elif plot_mode == "overlay":
+        sparklines = BlendshapeSparklines(blendshape_store, tracked_blendshapes)
+
+    # Capture, inference and rendering each run on their own stage, see pipeline.py
+    if quality:
+        quality.timer = metrics
+        metrics.add_collector("quality", quality.stats)
+    pipeline = FramePipeline(cap, convert_frame, tracker=tracker, roi=roi, pool=BufferPool(),
+                             timer=quality or metrics, max_empty_reads=max_empty_reads)
+    metrics.add_collector("pipeline", pipeline.stats)
+    metrics_server = MetricsServer(metrics, port=METRICS_PORT).start() if METRICS_PORT else None
+    pipeline.bind(options)
+    overlay = OverlayRenderer(style=overlay_style, color=color) if overlay_style else None
+    masker = MaskRenderer(mask)
+    if identities:
+        metrics.add_collector("identity", identities.stats)
+    if expressions:
+        metrics.add_collector("expressions", expressions.stats)
+
+    rendered = 0
+    show_sparklines = True
+    rebuilder = LandmarkerRebuilder(mp.tasks.vision.FaceLandmarker.create_from_options, pipeline)
+    tracker_intervals = (tracker.min_interval, tracker.max_interval) if tracker else None
+    built_options = options
+
+    # Levels only ever lower the configured settings, so each one is applied to the originals
+    def apply_quality(level, previous, reason):
+        nonlocal show_sparklines, built_options
+        pipeline.input_scale = level.input_scale
+        if tracker:
+            tracker.min_interval = max(tracker_intervals[0], level.stride)
+            tracker.max_interval = max(tracker_intervals[1], level.stride)
+        else:
+            pipeline.inference_stride = level.stride
+        if overlay:
+            overlay.style = level.overlay_style or overlay_style
+        if plot:
+            plot.interval = level.plot_interval if level.plot_interval is not None else float("inf")
+        show_sparklines = level.plot_interval is not None
+
+        level_options = landmarker_options(options, level, options.num_faces)
+        if level_options != built_options:
+            built_options = level_options
+            rebuilder.request(level_options)
+
+    if quality:
+        quality.on_change = apply_quality
+
+    def render(frame, result, timestamp_ms):
+        nonlocal rendered
+        apply_commands(overlay, masker, identities, mask_cache)
+        masks = None
+        if identities and result:
+            tracks = identities.update(result.face_landmarks or [])
+            live = {track.track_id for track in identities.tracks}
+            # Snapshot the keys: user-mask threads may insert while we prune
+            for track_id in list(face_masks):
+                if track_id not in live:
+                    face_masks.pop(track_id, None)
+            masks = [user_masks.get(track.user_id) if track.user_id is not None else face_masks.get(track.track_id)
+                     for track in tracks]
+            if identities.smoothing and tracks:
+                result = LandmarkResult([track.landmarks for track in tracks], result.face_blendshapes,
+                                        result.facial_transformation_matrixes)
+            if expressions and result.face_blendshapes and len(result.face_blendshapes) == len(tracks):
+                with metrics.span("expressions"):
+                    events = expressions.update([track.track_id for track in tracks],
+                                                expressions.scores(result.face_blendshapes))
+                queue_expression_commands(expressions, events, tracks)
+        keep_running = render_frame(frame, result, overlay, sparklines if show_sparklines else None, masker, sink,
+                                    masks)
+        if plot:
+            plot.refresh()
+        if quality:
+            quality.frame_rendered(timestamp_ms)
+        rendered += 1
+        mark_startup("first_frame_s")
+        return keep_running and (max_frames is None or rendered < max_frames)
+
+    with mp.tasks.vision.FaceLandmarker.create_from_options(options) as landmarker:
+        mark_startup("landmarker_s")
+        pipeline.run(landmarker, render)
+    rebuilder.join(timeout=5.0)
+
+    print(f"Pipeline stats: {pipeline.stats()}")
+    if recorder:
+        recorder.close()
+        print(f"Recorded {recorder.recorded} results to {recorder.path}")
+    if metrics_server:
+        metrics_server.stop()
 
     cap.release()
-    cv2.destroyAllWindows()
+    sink.close()
 
     if MQTT_TOPIC_ENABLED and mqtt_connection:
         print("Disconnecting...")
         mqtt_connection.disconnect().result()
         print("Disconnected from AWS IoT.")
 
-# Main function
-def main():
-    cap = initialize_camera()
-    options = initialize_face_landmarker(model_path)
-
-    ani = animation.FuncAnimation(fig, update_plot, interval=100)
-    plt.ion()  # Enable interactive mode so that plot updates without blocking
-    plt.show()
-
-    run_face_landmark_detection(cap, options, color=color)
+# Command line defaults come from the module settings above
+def main(argv=None):
+    global HEADLESS, MQTT_TOPIC_ENABLED, METRICS_PORT, RECORDING_DIR, MASK_PATH, MASK_KEY, MASK_SOURCE_DIR
+    global TRACKING_ENABLED, ROI_ENABLED, TARGET_FPS, MAX_LATENCY_MS, NUM_FACES, SMOOTHING, EXPRESSIONS
+    global RECORD_LANDMARKS
+
+    parser = argparse.ArgumentParser(description="Live face landmarks with masks and overlays.")
+    parser.add_argument("--source", default="0", help="camera index, video file or stream URL")
+    parser.add_argument("--headless", action="store_true", default=HEADLESS, help="no window and no matplotlib")
+    parser.add_argument("--sink", action="append", default=[SINK] if SINK else [],
+                        help=f"where frames go (repeatable): {', '.join(SINK_SPECS)}")
+    parser.add_argument("--stream-port", type=int, default=STREAM_PORT, help="same as --sink http://127.0.0.1:PORT")
+    parser.add_argument("--plot", choices=("blit", "overlay", "none"), default=PLOT_MODE)
+    parser.add_argument("--mqtt", action="store_true", default=MQTT_TOPIC_ENABLED, help="take requests from AWS IoT")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT)
+    parser.add_argument("--recording-dir", default=RECORDING_DIR)
+    parser.add_argument("--record-landmarks", action="store_true", default=RECORD_LANDMARKS,
+                        help="also record landmarks, not just blendshapes and matrices")
+    parser.add_argument("--mask", default=MASK_PATH, help="mask image on the canonical UV layout")
+    parser.add_argument("--mask-key", default=MASK_KEY, help="mask to start with from the mask cache")
+    parser.add_argument("--mask-source-dir", default=MASK_SOURCE_DIR)
+    parser.add_argument("--num-faces", type=int, default=NUM_FACES, help="most faces to detect and mask")
+    parser.add_argument("--smoothing", type=float, default=SMOOTHING,
+                        help="0-1, how much each face's landmarks are smoothed over time")
+    parser.add_argument("--expressions", default=EXPRESSIONS,
+                        help="'default' or a JSON file of expression rules that trigger feature changes")
+    parser.add_argument("--tracking", action="store_true", default=TRACKING_ENABLED)
+    parser.add_argument("--roi", action="store_true", default=ROI_ENABLED)
+    parser.add_argument("--target-fps", type=float, default=TARGET_FPS,
+                        help="lower input size, detection rate and detail as needed to hold this frame rate")
+    parser.add_argument("--max-latency-ms", type=float, default=MAX_LATENCY_MS,
+                        help="also lower quality when frames take longer than this to reach the sink")
+    parser.add_argument("--max-frames", type=int, default=None, help="stop after rendering this many frames")
+    parser.add_argument("--startup-report", help="write startup timings (JSON) here on exit")
+    args = parser.parse_args(argv)
+
+    HEADLESS, MQTT_TOPIC_ENABLED, METRICS_PORT = args.headless, args.mqtt, args.metrics_port
+    RECORDING_DIR, MASK_PATH, MASK_KEY, MASK_SOURCE_DIR = args.recording_dir, args.mask, args.mask_key, args.mask_source_dir
+    RECORD_LANDMARKS = args.record_landmarks
+    TRACKING_ENABLED, ROI_ENABLED = args.tracking, args.roi
+    TARGET_FPS, MAX_LATENCY_MS = args.target_fps, args.max_latency_ms
+    NUM_FACES, SMOOTHING, EXPRESSIONS = args.num_faces, args.smoothing, args.expressions
+    if NUM_FACES < 1 or not 0 <= SMOOTHING < 1:
+        parser.error("--num-faces must be at least 1 and --smoothing between 0 and 1")
+    try:
+        expressions = ExpressionEngine(load_rules(EXPRESSIONS)) if EXPRESSIONS else None
+    except (OSError, ValueError) as e:
+        parser.error(f"--expressions: {e}")
+    if MAX_LATENCY_MS and not TARGET_FPS:
+        parser.error("--max-latency-ms needs --target-fps")
+
+    sink_specs = args.sink or ["null" if args.headless else "window"]
+    if args.stream_port:
+        sink_specs.append(f"http://127.0.0.1:{args.stream_port}")
+    if args.headless and "window" in sink_specs:
+        parser.error("--headless cannot use the window sink")
+    plot_mode = "none" if args.headless and args.plot == "blit" else args.plot
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    cap = initialize_camera(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    sinks = [open_sink(spec, fps=fps) for spec in sink_specs]
+    for position, sink in enumerate(sinks):
+        if hasattr(sink, "stats"):
+            metrics.add_collector(f"sink{position}", sink.stats)
+    sink = sinks[0] if len(sinks) == 1 else TeeSink(sinks)
+    options = initialize_face_landmarker(model_path, NUM_FACES)
+
+    mask_cache = initialize_mask_cache()
+
+    # Landmark dots are only drawn when no mask is configured
+    mask = FaceMask.from_file(MASK_PATH) if MASK_PATH else None
+    if mask is None and mask_cache and MASK_KEY:
+        mask = mask_cache.get(MASK_KEY)
+    overlay_style = None if mask else "points"
+
+    tracker = LandmarkTracker() if TRACKING_ENABLED else None
+    roi = RoiSelector() if ROI_ENABLED else None
+    quality = QualityController(TARGET_FPS, MAX_LATENCY_MS) if TARGET_FPS else None
+    identities = IdentityTracker(smoothing=SMOOTHING)
+
+    run_face_landmark_detection(cap, options, color=color, overlay_style=overlay_style, plot_mode=plot_mode, mask=mask,
+                                tracker=tracker, roi=roi, sink=sink, max_frames=args.max_frames, quality=quality,
+                                identities=identities, mask_cache=mask_cache, expressions=expressions,
+                                # A video file is over at its first failed read, cameras and streams keep trying
+                                max_empty_reads=1 if os.path.isfile(args.source) else None)
+
+    print(f"Startup: {startup_timings}")
+    if args.startup_report:
+        with open(args.startup_report, "w") as report_file:
+            json.dump(startup_timings, report_file, indent=2)
+
+mark_startup("import_s")
 
 # Run main function
 if __name__ == "__main__":
     main()
-    
\ No newline at end of file
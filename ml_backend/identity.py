@@ -0,0 +1,180 @@
+"""Stable track IDs for the faces in landmarker results.
+
+MediaPipe lists faces in no particular order, so the same person can be face 0
+in one frame and face 1 in the next. IdentityTracker matches every result to the
+faces it saw before on box IoU and the distance between their stable landmarks
+(one (tracks, faces) cost matrix, solved with the Hungarian algorithm) and hands
+back a FaceTrack per face, in result order. Anything keyed by person (landmark
+smoothing, masks, the user a face belongs to) lives on the track.
+
+A user is attached to a track by assign_user(). Without an explicit track the
+user gets the longest-lived face that has no user yet, or waits for the next
+face to appear. When a track is lost its user waits for a new face as well.
+A user assigned to an explicit track is pinned to that face and goes with it.
+Taking a face that already has a user, pinned or not, sends that user back to
+wait for a free face.
+"""
+import itertools
+from dataclasses import dataclass
+import numpy as np
+from ml_backend.rendering import landmarks_to_normalized
+from ml_backend.tracking import STABLE_LANDMARKS
+
+# Cost of a pair that fails both gates, far above any real cost
+INFEASIBLE = 1e6
+
+
+@dataclass(eq=False)
+class FaceTrack:
+    track_id: int
+    landmarks: np.ndarray  # normalized (N, 3), smoothed when the tracker smooths
+    box: np.ndarray  # normalized x0, y0, x1, y1 of the last matched face
+    hits: int = 1
+    misses: int = 0
+    user_id: str = None
+    pinned: bool = False  # The user was assigned to this face explicitly and does not move on
+
+
+# (F, N, 3) landmarks -> (F, 4) boxes
+def face_boxes(faces):
+    xy = faces[..., :2]
+    return np.concatenate([xy.min(axis=1), xy.max(axis=1)], axis=1)
+
+
+# (A, 4) and (B, 4) boxes -> (A, B) intersection over union
+def box_iou(a, b):
+    low = np.maximum(a[:, None, :2], b[None, :, :2])
+    high = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(high - low, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-12)
+
+
+# (A, N, 3) and (B, N, 3) landmarks -> (A, B) mean stable landmark distance,
+# in units of each row's box diagonal so near and far faces are judged alike
+def landmark_distance(a, b, a_boxes):
+    stable_a = a[:, STABLE_LANDMARKS, :2]
+    stable_b = b[:, STABLE_LANDMARKS, :2]
+    distance = np.linalg.norm(stable_a[:, None] - stable_b[None], axis=3).mean(axis=2)
+    diagonal = np.linalg.norm(a_boxes[:, 2:] - a_boxes[:, :2], axis=1)
+    return distance / np.maximum(diagonal, 1e-6)[:, None]
+
+
+class IdentityTracker:
+    """Keeps a FaceTrack per person across results, see the module docstring.
+
+    A face may only continue a track when their boxes overlap by at least min_iou
+    or their landmarks are within max_distance box diagonals. Tracks survive
+    max_misses results without a face. smoothing is the weight of the previous
+    landmarks in an exponential moving average (0 keeps the raw landmarks).
+    """
+
+    def __init__(self, min_iou=0.1, max_distance=0.5, iou_weight=0.5, max_misses=15, smoothing=0.0):
+        self.min_iou = min_iou
+        self.max_distance = max_distance
+        self.iou_weight = iou_weight
+        self.max_misses = max_misses
+        self.smoothing = smoothing
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._waiting_users = []
+        self.created = 0
+        self.lost = 0
+
+    # Pairs tracks (rows) with faces (columns), returns {face index: track}
+    def _match(self, faces, boxes):
+        if not self.tracks or not len(faces):
+            return {}
+        from scipy.optimize import linear_sum_assignment
+
+        track_faces = np.stack([track.landmarks for track in self.tracks])
+        track_boxes = np.stack([track.box for track in self.tracks])
+        iou = box_iou(track_boxes, boxes)
+        distance = landmark_distance(track_faces, faces, track_boxes)
+        feasible = (iou >= self.min_iou) | (distance <= self.max_distance)
+        cost = self.iou_weight * (1 - iou) + (1 - self.iou_weight) * np.minimum(distance / self.max_distance, 1)
+        cost[~feasible] = INFEASIBLE
+
+        rows, columns = linear_sum_assignment(cost)
+        return {column: self.tracks[row] for row, column in zip(rows, columns) if feasible[row, column]}
+
+    # Returns one FaceTrack per face of the result, in the result's order
+    def update(self, face_landmarks):
+        arrays = [landmarks_to_normalized(face) for face in face_landmarks]
+        faces = np.stack(arrays) if arrays else np.empty((0, 0, 3), dtype=np.float32)
+        boxes = face_boxes(faces) if arrays else np.empty((0, 4), dtype=np.float32)
+        matches = self._match(faces, boxes)
+
+        tracks = []
+        for position, face in enumerate(arrays):
+            track = matches.get(position)
+            if track is None:
+                track = FaceTrack(next(self._ids), face, boxes[position])
+                self.tracks.append(track)
+                self.created += 1
+            else:
+                if self.smoothing and track.landmarks.shape == face.shape:
+                    face = self.smoothing * track.landmarks + (1 - self.smoothing) * face
+                track.landmarks = face
+                track.box = boxes[position]
+                track.hits += 1
+                track.misses = 0
+            tracks.append(track)
+
+        matched = set(map(id, tracks))
+        for track in self.tracks:
+            if id(track) not in matched:
+                track.misses += 1
+        for track in [track for track in self.tracks if track.misses > self.max_misses]:
+            self.tracks.remove(track)
+            self.lost += 1
+            if track.user_id is not None and not track.pinned:
+                self._waiting_users.append(track.user_id)
+
+        self._seat_waiting_users()
+        return tracks
+
+    # Attaches user_id to a face: track_id if given, otherwise the oldest face without a user
+    def assign_user(self, user_id, track_id=None):
+        current = self.track_of(user_id)
+        if current is not None and (track_id is None or current.track_id == track_id):
+            return current
+        if track_id is not None:
+            track = next((track for track in self.tracks if track.track_id == track_id), None)
+            # An unknown track leaves the user where they are
+            if track is None:
+                return current
+        else:
+            track = next((track for track in self.tracks if track.user_id is None), None)
+        if current is not None:
+            current.user_id, current.pinned = None, False
+        if user_id in self._waiting_users:
+            self._waiting_users.remove(user_id)
+        if track is None:
+            self._waiting_users.append(user_id)
+            return None
+        if track.user_id is not None:
+            self._waiting_users.append(track.user_id)
+        track.user_id, track.pinned = user_id, track_id is not None
+        return track
+
+    def track_of(self, user_id):
+        return next((track for track in self.tracks if track.user_id == user_id), None)
+
+    def _seat_waiting_users(self):
+        while self._waiting_users:
+            track = next((track for track in self.tracks if track.user_id is None and not track.misses), None)
+            if track is None:
+                return
+            track.user_id = self._waiting_users.pop(0)
+
+    def stats(self):
+        return {
+            "tracks": len(self.tracks),
+            "created": self.created,
+            "lost": self.lost,
+            "waiting_users": len(self._waiting_users),
+        }
@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+import cv2
+import numpy as np
+from ml_backend.masking import FaceMask, canonical_face_mesh
+
+# Matches the bucket and prefixes used by aws_backend/lambda_api/main.py and mask_ingest.py
+S3_DATA_BUCKET = "eoh-data-bucket"
+MASK_PREFIX = "masks/"
+MASK_DERIVED_PREFIX = "masks/derived/"
+MASK_RESOLUTIONS = (256, 512, 1024)
+ALIGNMENT_FILE = "alignment.npy"
+
+MaskObject = namedtuple("MaskObject", ["key", "etag", "size"])
+
+MASK_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+class S3MaskSource:
+    """Lists and downloads masks from the S3 data bucket."""
+
+    def __init__(self, bucket=S3_DATA_BUCKET, prefix=MASK_PREFIX, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("s3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    def list_masks(self):
+        masks = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                if item["Key"].startswith(MASK_DERIVED_PREFIX):
+                    continue
+                if item["Key"].lower().endswith(MASK_EXTENSIONS):
+                    masks.append(MaskObject(item["Key"], item["ETag"].strip('"'), item["Size"]))
+        return masks
+
+    def download(self, key, path):
+        self.client.download_file(self.bucket, key, path)
+
+
+class LocalMaskSource:
+    """Local directory laid out like the bucket, used offline and in tests.
+
+    ETags are the MD5 of the file contents, like S3 for single-part uploads.
+    """
+
+    def __init__(self, root, prefix=MASK_PREFIX):
+        self.root = root
+        self.prefix = prefix
+
+    def list_masks(self):
+        masks = []
+        directory = os.path.join(self.root, self.prefix)
+        if not os.path.isdir(directory):
+            return masks
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and name.lower().endswith(MASK_EXTENSIONS):
+                with open(path, "rb") as file:
+                    etag = hashlib.md5(file.read()).hexdigest()
+                masks.append(MaskObject(self.prefix + name, etag, os.path.getsize(path)))
+        return masks
+
+    def download(self, key, path):
+        shutil.copyfile(os.path.join(self.root, key), path)
+
+
+class MaskCache:
+    """Two-tier on-device cache of mask assets.
+
+    The disk tier keeps downloaded files keyed by S3 key and ETag and evicts the
+    least recently used files once max_disk_bytes is exceeded. The memory tier
+    keeps ready-to-warp FaceMask objects (decoded BGRA, resized to the square UV
+    layout, triangles precomputed), so switching to a cached mask is one dict lookup.
+    Masks ingested by the backend are loaded from their pre-sized RGBA asset and
+    alignment sidecar; older uploads fall back to decoding the original.
+    """
+
+    def __init__(self, source, cache_dir, max_disk_bytes=512 * 1024 * 1024, max_memory_masks=16, mask_size=512):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_masks = max_memory_masks
+        self.mask_size = mask_size
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index = self._load_index()
+        self._listing = {}
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._prefetch_thread = None
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose files were removed behind our back
+        return {key: entry for key, entry in index.items() if os.path.exists(os.path.join(self.cache_dir, entry["file"]))}
+
+    def _save_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(self._index, index_file)
+        os.replace(tmp_path, self._index_path)
+
+    def refresh_listing(self):
+        listing = {mask.key: mask for mask in self.source.list_masks()}
+        with self._lock:
+            self._listing = listing
+        return list(listing.values())
+
+    def keys(self):
+        with self._lock:
+            return list(self._listing)
+
+    # Key of a mask given as a key or as the bare file name the gallery sends, with or without extension
+    def find(self, name):
+        keys = self.keys() or [mask.key for mask in self.refresh_listing()]
+        for key in keys:
+            file_name = key.rsplit("/", 1)[-1]
+            if name in (key, file_name, os.path.splitext(file_name)[0]):
+                return key
+        raise KeyError(f"Unknown mask: {name}")
+
+    # Disk tier: returns a local path for the mask, downloading it if the ETag changed
+    def fetch(self, mask):
+        with self._lock:
+            entry = self._index.get(mask.key)
+            if entry and entry["etag"] == mask.etag:
+                entry["last_used"] = time.time()
+                return os.path.join(self.cache_dir, entry["file"])
+
+        extension = os.path.splitext(mask.key)[1].lower()
+        file_name = hashlib.sha1(f"{mask.key}:{mask.etag}".encode()).hexdigest() + extension
+        path = os.path.join(self.cache_dir, file_name)
+        tmp_path = path + ".part"
+        self.source.download(mask.key, tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._index.get(mask.key)
+            if previous and previous["file"] != file_name:
+                self._remove_file(previous["file"])
+            self._index[mask.key] = {
+                "etag": mask.etag,
+                "file": file_name,
+                "size": os.path.getsize(path),
+                "last_used": time.time(),
+            }
+            self._evict_disk(keep=mask.key)
+            self._save_index()
+        return path
+
+    def _remove_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.cache_dir, file_name))
+        except OSError:
+            pass
+
+    def _evict_disk(self, keep=None):
+        total = sum(entry["size"] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda key: self._index[key]["last_used"]):
+            if total <= self.max_disk_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self._index.pop(key)
+            self._remove_file(entry["file"])
+            total -= entry["size"]
+
+    def disk_usage(self):
+        with self._lock:
+            return sum(entry["size"] for entry in self._index.values())
+
+    # Decodes a mask file into a FaceMask on the square UV layout
+    def _decode(self, mask, path):
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Could not decode mask: {mask.key}")
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+        elif image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+        image = cv2.resize(image, (self.mask_size, self.mask_size), interpolation=cv2.INTER_AREA)
+        return FaceMask(np.ascontiguousarray(image), name=mask.key)
+
+    # Ingested assets of a mask, or None if it was uploaded before ingestion existed
+    def _load_derived(self, mask):
+        size = min((size for size in MASK_RESOLUTIONS if size >= self.mask_size), default=MASK_RESOLUTIONS[-1])
+        prefix = f"{MASK_DERIVED_PREFIX}{mask.key[len(MASK_PREFIX):]}/{mask.etag}/"
+        try:
+            image_path = self.fetch(MaskObject(f"{prefix}rgba-{size}.png", mask.etag, 0))
+            alignment_path = self.fetch(MaskObject(prefix + ALIGNMENT_FILE, mask.etag, 0))
+        except Exception:
+            return None
+
+        image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if image is None or image.ndim != 3 or image.shape[2] != 4:
+            return None
+        if size != self.mask_size:
+            image = cv2.resize(image, (self.mask_size, self.mask_size), interpolation=cv2.INTER_AREA)
+        # The sidecar maps canonical UVs into the mask, so nothing is fitted here
+        alignment = np.load(alignment_path)
+        canonical_uv, _ = canonical_face_mesh()
+        uv = canonical_uv @ alignment[:, :2].T + alignment[:, 2]
+        return FaceMask(np.ascontiguousarray(image), uv=uv, name=mask.key)
+
+    # Memory tier lookup, falls back to the disk tier and the source on a miss
+    def get(self, key):
+        with self._lock:
+            cached = self._memory.get(key)
+            mask = self._listing.get(key)
+            if cached is not None and (mask is None or cached[0] == mask.etag):
+                self._memory.move_to_end(key)
+                return cached[1]
+
+        if mask is None:
+            self.refresh_listing()
+            with self._lock:
+                mask = self._listing.get(key)
+            if mask is None:
+                raise KeyError(f"Unknown mask: {key}")
+        return self.load(mask)
+
+    def load(self, mask):
+        face_mask = self._load_derived(mask)
+        if face_mask is None:
+            face_mask = self._decode(mask, self.fetch(mask))
+        with self._lock:
+            self._memory[mask.key] = (mask.etag, face_mask)
+            self._memory.move_to_end(mask.key)
+            while len(self._memory) > self.max_memory_masks:
+                self._memory.popitem(last=False)
+        return face_mask
+
+    def is_loaded(self, key):
+        with self._lock:
+            return key in self._memory
+
+    # Downloads every listed mask and decodes as many as the memory tier holds,
+    # on a background thread unless background=False
+    def prefetch(self, background=True):
+        def run():
+            for position, mask in enumerate(self.refresh_listing()):
+                try:
+                    if position < self.max_memory_masks:
+                        self.load(mask)
+                    else:
+                        self.fetch(mask)
+                except Exception as e:
+                    print(f"Failed to prefetch mask {mask.key}: {e}")
+
+        if not background:
+            run()
+            return None
+        self._prefetch_thread = threading.Thread(target=run, name="mask-prefetch", daemon=True)
+        self._prefetch_thread.start()
+        return self._prefetch_thread
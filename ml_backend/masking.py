@@ -0,0 +1,164 @@
+import os
+import zipfile
+import functools
+import cv2
+import numpy as np
+from ml_backend.rendering import landmarks_to_normalized
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "face_landmarker.task")
+
+# The canonical mesh covers the first 468 landmarks, the remaining 10 are iris points
+MESH_VERTEX_COUNT = 468
+
+
+# Canonical UV coordinates (468, 2) and triangles (T, 3) of the face mesh.
+# Read once from the geometry metadata bundled inside face_landmarker.task.
+@functools.lru_cache(maxsize=None)
+def canonical_face_mesh(model_path=DEFAULT_MODEL_PATH):
+    from mediapipe.modules.face_geometry.protos import geometry_pipeline_metadata_pb2
+
+    with zipfile.ZipFile(model_path) as bundle:
+        metadata = geometry_pipeline_metadata_pb2.GeometryPipelineMetadata()
+        metadata.ParseFromString(bundle.read("geometry_pipeline_metadata_landmarks.binarypb"))
+
+    mesh = metadata.canonical_mesh
+    # Vertices are stored as x, y, z, u, v; v already points down like image rows
+    vertices = np.array(mesh.vertex_buffer, dtype=np.float32).reshape(-1, 5)
+    uv = vertices[:, 3:5].copy()
+    triangles = np.array(mesh.index_buffer, dtype=np.int32).reshape(-1, 3)
+    uv.setflags(write=False)
+    triangles.setflags(write=False)
+    return uv, triangles
+
+
+# Per-triangle affine transforms (T, 2, 3) mapping triangles src -> dst, solved in one batch.
+# Triangles with degenerate src corners get an all-zero transform and valid=False.
+def batch_triangle_affines(src, dst):
+    src = src.astype(np.float64, copy=False)
+    dst = dst.astype(np.float64, copy=False)
+
+    src_edges = np.stack([src[:, 1] - src[:, 0], src[:, 2] - src[:, 0]], axis=2)  # (T, 2, 2)
+    dst_edges = np.stack([dst[:, 1] - dst[:, 0], dst[:, 2] - dst[:, 0]], axis=2)
+
+    det = src_edges[:, 0, 0] * src_edges[:, 1, 1] - src_edges[:, 0, 1] * src_edges[:, 1, 0]
+    valid = np.abs(det) > 1e-9
+    safe_det = np.where(valid, det, 1.0)
+    inverse = np.empty_like(src_edges)
+    inverse[:, 0, 0] = src_edges[:, 1, 1] / safe_det
+    inverse[:, 0, 1] = -src_edges[:, 0, 1] / safe_det
+    inverse[:, 1, 0] = -src_edges[:, 1, 0] / safe_det
+    inverse[:, 1, 1] = src_edges[:, 0, 0] / safe_det
+
+    linear = dst_edges @ inverse
+    translation = dst[:, 0] - np.einsum("tij,tj->ti", linear, src[:, 0])
+    affines = np.concatenate([linear, translation[:, :, None]], axis=2)
+    affines[~valid] = 0.0
+    return affines, valid
+
+
+class FaceMask:
+    """A mask image prepared for warping onto the face mesh.
+
+    The image is BGRA and laid out like the canonical face UV map, unless uv gives
+    the mask's own (468, 2) normalized landmark positions. The triangulation and
+    the mask-space triangle corners are computed here, once per mask.
+    """
+
+    def __init__(self, image, uv=None, triangles=None, name=None):
+        if image.ndim != 3 or image.shape[2] not in (3, 4):
+            raise ValueError("mask image must be BGR or BGRA")
+        if image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+
+        canonical_uv, canonical_triangles = canonical_face_mesh()
+        uv = canonical_uv if uv is None else np.asarray(uv, dtype=np.float32)[:MESH_VERTEX_COUNT]
+        self.triangles = canonical_triangles if triangles is None else np.asarray(triangles, dtype=np.int32)
+
+        self.name = name
+        self.image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        self.uv = uv
+        self.source_points = uv * np.array((width, height), dtype=np.float32)
+        self.source_triangles = self.source_points[self.triangles]  # (T, 3, 2)
+
+    @classmethod
+    def from_file(cls, path, uv=None):
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Could not read mask image: {path}")
+        return cls(image, uv=uv, name=os.path.basename(path))
+
+
+class MaskRenderer:
+    """Warps a FaceMask onto detected faces with piecewise-affine triangles.
+
+    Per face and frame this solves all triangle transforms in one batch, rasterizes
+    the triangle ids (far triangles first so the nearest one wins) into a label map
+    covering only the face bounding box, builds the remap grid from the labels and
+    does a single cv2.remap and alpha composite inside that box.
+    """
+
+    def __init__(self, mask=None):
+        self.mask = mask
+        self._grid = None
+
+    # masks optionally gives every face its own mask, faces without one get self.mask
+    def apply(self, frame, faces, masks=None):
+        height, width = frame.shape[:2]
+        for position, face_landmarks in enumerate(faces):
+            mask = masks[position] if masks is not None and masks[position] is not None else self.mask
+            if mask is None:
+                continue
+            normalized = landmarks_to_normalized(face_landmarks)[:MESH_VERTEX_COUNT]
+            self._apply_face(frame, normalized, width, height, mask)
+        return frame
+
+    def _grid_for(self, box_height, box_width):
+        if self._grid is None or self._grid[0].shape[0] < box_height or self._grid[0].shape[1] < box_width:
+            rows = max(box_height, 0 if self._grid is None else self._grid[0].shape[0])
+            cols = max(box_width, 0 if self._grid is None else self._grid[0].shape[1])
+            ys, xs = np.indices((rows, cols), dtype=np.float32)
+            self._grid = (xs, ys)
+        xs, ys = self._grid
+        return xs[:box_height, :box_width], ys[:box_height, :box_width]
+
+    def _apply_face(self, frame, normalized, width, height, mask):
+        points = normalized[:, :2] * np.array((width, height), dtype=np.float32)
+
+        x0, y0 = np.floor(points.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(points.max(axis=0)).astype(int) + 1
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, width), min(y1, height)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return
+
+        # Inverse mapping: frame triangle -> mask triangle, one affine per triangle
+        dst_triangles = points[mask.triangles] - np.array((x0, y0), dtype=np.float32)
+        affines, valid = batch_triangle_affines(dst_triangles, mask.source_triangles)
+
+        # Painter's order: MediaPipe z grows away from the camera, so draw largest z first
+        depth = normalized[:, 2][mask.triangles].mean(axis=1)
+        order = np.argsort(-depth)
+        order = order[valid[order]]
+
+        box_height, box_width = y1 - y0, x1 - x0
+        labels = np.zeros((box_height, box_width), dtype=np.uint16)
+        corners = np.rint(dst_triangles).astype(np.int32)
+        for index in order:
+            cv2.fillConvexPoly(labels, corners[index], int(index) + 1)
+
+        # Label 0 gets a transform that samples outside the mask image, where alpha is 0
+        coefficients = np.empty((6, len(affines) + 1), dtype=np.float32)
+        coefficients[:, 0] = (0, 0, -1, 0, 0, -1)
+        coefficients[:, 1:] = affines.reshape(-1, 6).T
+        a, b, c, d, e, f = (np.take(row, labels) for row in coefficients)
+        xs, ys = self._grid_for(box_height, box_width)
+        map_x = a * xs + b * ys + c
+        map_y = d * xs + e * ys + f
+
+        warped = cv2.remap(mask.image, map_x, map_y, cv2.INTER_LINEAR,
+                           borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
+
+        region = frame[y0:y1, x0:x1]
+        alpha = warped[..., 3].astype(np.float32)
+        region[:] = cv2.blendLinear(region, np.ascontiguousarray(warped[..., :3]), 255.0 - alpha, alpha)
@@ -0,0 +1,284 @@
+"""Low overhead metrics for the live pipeline, served in Prometheus text format.
+
+A MetricsRegistry can be passed to FramePipeline as its timer, so every stage
+duration lands in a fixed-bucket histogram. Counters and gauges cover the rest,
+and collectors pull numbers (pipeline stats, queue depths) only when scraped.
+
+    GET /metrics          Prometheus text exposition
+    GET /profile/start    start the sampling profiler
+    GET /profile/stop     stop it and return the collapsed stacks (flamegraph.pl input)
+"""
+import re
+import sys
+import time
+import bisect
+import threading
+from collections import Counter as StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, from 0.1 ms to 1 s, roughly x2 apart
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Prometheus metric and label names only allow [a-zA-Z0-9_:]
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions under a lock."""
+
+    def __init__(self, name, help_text="", buckets=DEFAULT_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def render(self):
+        counts, total, count = self.snapshot()
+        lines = []
+        cumulative = 0
+        for edge, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labels + (("le", edge),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text="", labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labels)} {self.value}"]
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them on demand.
+
+    record(stage, seconds) makes the registry usable as a FramePipeline timer;
+    stages share one histogram family labelled by stage.
+    """
+
+    def __init__(self, prefix="ml"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._collectors = {}
+
+    def record(self, stage, seconds):
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(
+                    stage, Histogram(f"{self.prefix}_stage_seconds", labels=(("stage", stage),)))
+        histogram.observe(seconds)
+
+    # Times the body of a with block as one sample of stage
+    def span(self, stage):
+        return _Span(self, stage)
+
+    def counter(self, name, help_text=""):
+        full_name = f"{self.prefix}_{name}"
+        with self._lock:
+            counter = self._counters.get(full_name)
+            if counter is None:
+                counter = self._counters[full_name] = Counter(full_name, help_text)
+        return counter
+
+    # collect() -> {name: number} is called on every scrape and rendered as gauges,
+    # adding a collector under an existing name replaces it. A {label: {value: {name: number}}}
+    # entry becomes labelled gauges, e.g. {"profile": {"full": {"viewers": 2}}} renders
+    # <collector>_viewers{profile="full"} 2
+    def add_collector(self, name, collect):
+        with self._lock:
+            self._collectors[f"{self.prefix}_{name}"] = collect
+
+    def render(self):
+        with self._lock:
+            stages = list(self._stages.values())
+            counters = list(self._counters.values())
+            collectors = list(self._collectors.items())
+
+        lines = []
+        if stages:
+            lines.append(f"# HELP {self.prefix}_stage_seconds Duration of each pipeline stage.")
+            lines.append(f"# TYPE {self.prefix}_stage_seconds histogram")
+            for histogram in stages:
+                lines.extend(histogram.render())
+        for counter in counters:
+            if counter.help:
+                lines.append(f"# HELP {counter.name} {counter.help}")
+            lines.append(f"# TYPE {counter.name} counter")
+            lines.extend(counter.render())
+        for name, collect in collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Metrics collector {name} failed: {e}")
+                continue
+            families = {}
+            for key, value in values.items():
+                if _is_number(value):
+                    families.setdefault(_metric_name(f"{name}_{key}"), []).append(((), value))
+                elif isinstance(value, dict):
+                    for label_value, gauges in value.items():
+                        for gauge, number in gauges.items():
+                            if _is_number(number):
+                                families.setdefault(_metric_name(f"{name}_{gauge}"), []).append(
+                                    (((_metric_name(key), label_value),), number))
+            for metric, samples in families.items():
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(f"{metric}{_format_labels(labels)} {number}" for labels, number in samples)
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.registry.record(self.stage, time.perf_counter() - self.start)
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread at a fixed interval while running.
+
+    Stacks are counted in collapsed form ("thread;outer;inner count"), which
+    flamegraph.pl and speedscope read directly. Costs nothing while stopped.
+    """
+
+    def __init__(self, interval=0.005, max_depth=32):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = StackCounter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        return self.collapsed()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry (and profiler) over HTTP on a background thread."""
+
+    def __init__(self, registry, port=9100, host="127.0.0.1", profiler=None):
+        self.registry = registry
+        self.profiler = profiler or SamplingProfiler()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = server.registry.render(), "text/plain; version=0.0.4"
+                elif self.path == "/profile/start":
+                    server.profiler.start()
+                    body, content_type = "profiling\n", "text/plain"
+                elif self.path == "/profile/stop":
+                    body, content_type = server.profiler.stop(), "text/plain"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._httpd.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.profiler.stop()
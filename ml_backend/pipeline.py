@@ -0,0 +1,414 @@
+import threading
+import time
+from collections import OrderedDict
+import cv2
+from ml_backend.roi import map_result_to_frame
+
+
+class MonotonicTimestamps:
+    """Millisecond timestamps for detect_async that never repeat or go backwards.
+
+    MediaPipe rejects a frame whose timestamp is not strictly greater than the
+    previous one, which int(time.time() * 1000) cannot guarantee.
+    """
+
+    def __init__(self):
+        self._last = -1
+        self._lock = threading.Lock()
+
+    def next(self):
+        now = time.monotonic_ns() // 1_000_000
+        with self._lock:
+            self._last = max(now, self._last + 1)
+            return self._last
+
+
+class LatestSlot:
+    """Single item hand-off between threads where the newest item wins.
+
+    A put() that replaces an item nobody has taken yet counts as a dropped item
+    and hands the replaced item to on_drop, if given.
+    """
+
+    def __init__(self, on_drop=None):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            replaced = self._item if self._has_item else None
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+        if replaced is not None and self.on_drop is not None:
+            self.on_drop(replaced)
+
+    # Returns the pending item, or None on timeout or once closed and empty
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._has_item and not self._closed:
+                self._cond.wait(timeout)
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        with self._cond:
+            return self._closed and not self._has_item
+
+
+class FramePipeline:
+    """Capture -> inference -> render pipeline for a LIVE_STREAM landmarker.
+
+    Capture runs on its own thread and only keeps the newest frame. The inference
+    thread converts that frame and hands it to detect_async, remembering which
+    frame belongs to which timestamp so the result callback can pair them. The
+    render stage runs on the caller's thread (OpenCV windows must stay there) and
+    only ever sees the newest (frame, result) pair.
+
+    With a tracker (see tracking.py) the inference stage only sends the frames the
+    tracker asks for to the landmarker and hands tracked results straight to render.
+    With an ROI selector (see roi.py) only the region around the last faces is
+    converted and sent, and results are mapped back to full-frame coordinates
+    before anything else sees them.
+
+    With a buffer pool (see buffer_pool.py) frames are read into pooled arrays and
+    convert is called as convert(frame, out) with a pooled destination. Each frame
+    has exactly one owner at a time (a slot, the in-flight map or the renderer)
+    and goes back to the pool when the renderer is done with it or it is dropped.
+
+    With a timer (anything with record(stage, seconds), see benchmark.py) the
+    capture, convert, inference, callback and render stages report their durations.
+
+    input_scale and inference_stride can be changed while running (see quality.py):
+    frames are resized before conversion (results are normalized, so nothing else
+    changes), and without a tracker only every stride-th frame is detected while
+    the others are rendered with the last result. replace_landmarker() swaps in a
+    new landmarker at the next frame; the landmarker given to run() stays owned
+    by the caller, replacements are closed by the pipeline.
+
+    Cameras sometimes return an empty frame and keep going, so failed reads are
+    skipped. Video files stay "opened" after their last frame; set
+    max_empty_reads to end the run after that many failed reads in a row.
+    """
+
+    def __init__(self, cap, convert, max_in_flight=4, tracker=None, roi=None, pool=None, timer=None,
+                 drain_timeout=1.0, max_empty_reads=None):
+        self.cap = cap
+        self.convert = convert
+        self.max_in_flight = max_in_flight
+        self.tracker = tracker
+        self.roi = roi
+        self.pool = pool
+        self.timer = timer
+        self.drain_timeout = drain_timeout
+        self.max_empty_reads = max_empty_reads
+        self.input_scale = 1.0
+        self.inference_stride = 1
+
+        self.timestamps = MonotonicTimestamps()
+        self.frames = LatestSlot(on_drop=self._release)
+        self.results = LatestSlot(on_drop=lambda item: self._release(item[0]))
+        self.replacements = LatestSlot(on_drop=_close_later)
+
+        self._in_flight = OrderedDict()
+        self._submitted = {}
+        # Crop of every ROI frame still awaiting its result, kept even when the frame itself was
+        # dropped so a late result is still mapped back to full-frame coordinates
+        self._rois = OrderedDict()
+        self._in_flight_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+        self._last_result_timestamp = -1
+        self._last_result = None
+        self._since_detection = 0
+
+        self.captured = 0
+        self.rendered = 0
+        self.tracked = 0
+        self.reused = 0
+        self.landmarker_swaps = 0
+        self.dropped_inference = 0
+
+    def _record(self, stage, start):
+        if self.timer is not None:
+            self.timer.record(stage, time.perf_counter() - start)
+
+    def _release(self, frame):
+        if self.pool is not None:
+            self.pool.release(frame)
+
+    # Wrap the options' result callback so results get paired with their frames
+    def bind(self, options):
+        user_callback = options.result_callback
+
+        def on_result(result, output_image, timestamp_ms):
+            result = self._on_result(result, timestamp_ms)
+            if user_callback is not None:
+                start = time.perf_counter()
+                user_callback(result, output_image, timestamp_ms)
+                self._record("callback", start)
+
+        options.result_callback = on_result
+        return options
+
+    def _on_result(self, result, timestamp_ms):
+        with self._in_flight_lock:
+            # Results arrive in timestamp order, anything older was skipped by the landmarker
+            while self._in_flight:
+                oldest = next(iter(self._in_flight))
+                if oldest >= timestamp_ms:
+                    break
+                self._release(self._in_flight.pop(oldest)[0])
+                self._submitted.pop(oldest, None)
+                self.dropped_inference += 1
+            while self._rois and next(iter(self._rois)) < timestamp_ms:
+                self._rois.popitem(last=False)
+            frame, _ = self._in_flight.pop(timestamp_ms, (None, None))
+            roi = self._rois.pop(timestamp_ms, None)
+            submitted = self._submitted.pop(timestamp_ms, None)
+
+        if submitted is not None:
+            self._record("inference", submitted)
+
+        if roi is not None:
+            result = map_result_to_frame(result, roi)
+        if self.roi is not None and frame is not None:
+            height, width = frame.shape[:2]
+            self.roi.update(result.face_landmarks or [], width, height)
+
+        if self.tracker is not None:
+            if frame is None:
+                self.tracker.detection_dropped()
+            else:
+                self.tracker.update_detection(frame, result)
+
+        if frame is not None:
+            self._last_result = result
+            self._put_result(frame, result, timestamp_ms)
+        return result
+
+    # Tracked frames can overtake a slow detection, never render older than what was shown
+    def _put_result(self, frame, result, timestamp_ms):
+        with self._in_flight_lock:
+            if timestamp_ms <= self._last_result_timestamp:
+                self._release(frame)
+                return
+            self._last_result_timestamp = timestamp_ms
+        self.results.put((frame, result, timestamp_ms))
+
+    # Reads the next frame, into a pooled array of the last frame's shape when possible
+    def _read(self, shape):
+        if self.pool is None or shape is None:
+            ret, frame = self.cap.read()
+            if ret and self.pool is not None:
+                self.pool.adopt(frame)
+            return ret, frame
+
+        buffer = self.pool.acquire(shape)
+        ret, frame = self.cap.read(image=buffer)
+        if frame is not buffer:
+            # The source changed resolution, OpenCV allocated a new array
+            self.pool.release(buffer)
+            if ret:
+                self.pool.adopt(frame)
+        return ret, frame
+
+    def _capture_loop(self):
+        shape = None
+        empty_reads = 0
+        try:
+            while not self._stop.is_set() and self.cap.isOpened():
+                start = time.perf_counter()
+                ret, frame = self._read(shape)
+                self._record("capture", start)
+                if not ret:
+                    empty_reads += 1
+                    if self.max_empty_reads is not None and empty_reads >= self.max_empty_reads:
+                        break
+                    print("Ignoring empty camera frame.")
+                    continue
+                empty_reads = 0
+                if self.pool is not None:
+                    shape = frame.shape
+                self.captured += 1
+                self.frames.put(frame)
+        finally:
+            self.frames.close()
+
+    def _convert(self, frame):
+        scale = self.input_scale
+        if scale != 1.0:
+            height, width = frame.shape[:2]
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if self.pool is None:
+            return self.convert(frame)
+        # The converted image is copied by the landmarker's input, so its buffer is free again right away
+        out = self.pool.acquire(frame.shape)
+        try:
+            return self.convert(frame, out)
+        finally:
+            self.pool.release(out)
+
+    # Use landmarker for every frame from the next one on
+    def replace_landmarker(self, landmarker):
+        self.replacements.put(landmarker)
+
+    def _swap_landmarker(self, landmarker, original):
+        replacement = self.replacements.get(timeout=0)
+        if replacement is None:
+            return landmarker
+        if landmarker is not original:
+            # Its last results may still be on the way, they are paired like any other
+            _close_later(landmarker)
+        self.landmarker_swaps += 1
+        return replacement
+
+    def _inference_loop(self, original):
+        landmarker = original
+        try:
+            while not self._stop.is_set():
+                frame = self.frames.get(timeout=0.1)
+                if frame is None:
+                    if self.frames.closed:
+                        break
+                    continue
+
+                landmarker = self._swap_landmarker(landmarker, original)
+                timestamp_ms = self.timestamps.next()
+                if self.tracker is not None:
+                    tracked = self.tracker.process(frame)
+                    if tracked is not None:
+                        self.tracked += 1
+                        self._put_result(frame, tracked, timestamp_ms)
+                        continue
+                    self.tracker.detection_requested()
+                elif self._last_result is not None and self._since_detection + 1 < self.inference_stride:
+                    self._since_detection += 1
+                    self.reused += 1
+                    self._put_result(frame, self._last_result, timestamp_ms)
+                    continue
+                self._since_detection = 0
+
+                roi = self.roi.plan(frame) if self.roi is not None else None
+                start = time.perf_counter()
+                image = self._convert(frame if roi is None else self.roi.crop(frame, roi))
+                self._record("convert", start)
+                with self._in_flight_lock:
+                    self._in_flight[timestamp_ms] = (frame, roi)
+                    if roi is not None:
+                        self._rois[timestamp_ms] = roi
+                        # Bounded in case the landmarker stops answering altogether
+                        while len(self._rois) > 4 * self.max_in_flight:
+                            self._rois.popitem(last=False)
+                    if self.timer is not None:
+                        self._submitted[timestamp_ms] = time.perf_counter()
+                    if len(self._in_flight) > self.max_in_flight:
+                        stale_timestamp, (stale_frame, _) = self._in_flight.popitem(last=False)
+                        self._submitted.pop(stale_timestamp, None)
+                        self._release(stale_frame)
+                        self.dropped_inference += 1
+                landmarker.detect_async(image, timestamp_ms)
+
+            # The source ended, give the landmarker a moment to answer what it still has
+            deadline = time.monotonic() + self.drain_timeout
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                with self._in_flight_lock:
+                    if not self._in_flight:
+                        break
+                time.sleep(0.001)
+        finally:
+            self.results.close()
+            self.replacements.close()
+            for spare in (landmarker, self.replacements.get(timeout=0)):
+                if spare is not None and spare is not original:
+                    spare.close()
+
+    # Run until the source ends or render() returns False
+    def run(self, landmarker, render):
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, args=(landmarker,), name="inference", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self.results.get(timeout=0.1)
+                if item is None:
+                    if self.results.closed:
+                        break
+                    continue
+
+                frame, result, timestamp_ms = item
+                self.rendered += 1
+                start = time.perf_counter()
+                try:
+                    keep_running = render(frame, result, timestamp_ms)
+                finally:
+                    self._release(frame)
+                self._record("render", start)
+                if keep_running is False:
+                    break
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        self.frames.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+        # Hand back whatever was still queued so the pool stats end at zero in use
+        if self.pool is not None:
+            frame = self.frames.get(timeout=0)
+            if frame is not None:
+                self._release(frame)
+            item = self.results.get(timeout=0)
+            if item is not None:
+                self._release(item[0])
+            with self._in_flight_lock:
+                for frame, _ in self._in_flight.values():
+                    self._release(frame)
+                self._in_flight.clear()
+                self._submitted.clear()
+                self._rois.clear()
+
+    def stats(self):
+        stats = {
+            "captured": self.captured,
+            "rendered": self.rendered,
+            "tracked": self.tracked,
+            "reused": self.reused,
+            "landmarker_swaps": self.landmarker_swaps,
+            "dropped_capture": self.frames.dropped,
+            "dropped_inference": self.dropped_inference,
+            "dropped_render": self.results.dropped,
+            "in_flight": len(self._in_flight),
+        }
+        if self.pool is not None:
+            stats.update({f"pool_{name}": value for name, value in self.pool.stats().items()})
+        return stats
+
+
+# Closing a landmarker waits for its graph to finish, keep that off the pipeline threads
+def _close_later(landmarker):
+    threading.Thread(target=landmarker.close, name="landmarker-close", daemon=True).start()
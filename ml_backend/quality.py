@@ -0,0 +1,237 @@
+"""Adaptive quality: trade detail for frame rate when the machine falls behind.
+
+QualityController sits between the pipeline and its timer (anything with
+record(stage, seconds), e.g. the MetricsRegistry) and is told about every
+rendered frame. Once per window it works out
+
+    fps         rendered frames per second
+    latency_ms  mean time from handing a frame to inference until it was rendered
+    load        time per rendered frame of the busiest stage / frame budget
+                (capture is left out, it waits on the camera)
+
+and walks a ladder of QualityLevels. It steps down after degrade_after windows
+in a row that miss the budget and steps back up only after upgrade_after windows
+that would still fit with `headroom` to spare, so a level that only just fits
+does not flap. Each time a level has to be left again, the wait to re-enter it
+doubles (up to max_backoff times upgrade_after). Every change goes to on_change(level, previous, reason), is
+printed and counted, and the current state is available from stats().
+
+    python -m ml_backend.face_detection --target-fps 20 --max-latency-ms 150
+"""
+import dataclasses
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    name: str
+    input_scale: float = 1.0  # Frames are resized by this before conversion and inference
+    stride: int = 1  # Detect at most every stride frames, the others are tracked or reuse the last result
+    num_faces: int = None  # Upper bound on the configured num_faces, None keeps it
+    blendshapes: bool = True
+    matrices: bool = True
+    overlay_style: str = None  # None keeps the configured overlay style
+    plot_interval: float = 0.1  # Seconds between plot refreshes, None stops refreshing
+
+
+# Best first; every step gives up something the render loop does not strictly need
+QUALITY_LEVELS = (
+    QualityLevel("full"),
+    QualityLevel("reduced", input_scale=0.75, stride=2, plot_interval=0.2),
+    QualityLevel("low", input_scale=0.5, stride=3, num_faces=2, matrices=False, overlay_style="points",
+                 plot_interval=0.5),
+    QualityLevel("minimal", input_scale=0.5, stride=4, num_faces=1, blendshapes=False, matrices=False,
+                 overlay_style="points", plot_interval=None),
+)
+
+# Stages that do not cost pipeline time (capture blocks on the camera)
+IDLE_STAGES = ("capture",)
+
+
+class QualityController:
+    """Feedback loop from measured stage durations to a QualityLevel, see the module docstring."""
+
+    def __init__(self, target_fps=20.0, max_latency_ms=None, levels=QUALITY_LEVELS, window_s=2.0,
+                 degrade_after=2, upgrade_after=3, headroom=1.25, max_backoff=8, timer=None, on_change=None):
+        if not levels:
+            raise ValueError("at least one quality level is needed")
+        self.target_fps = target_fps
+        self.max_latency_ms = max_latency_ms
+        self.levels = tuple(levels)
+        self.window_s = window_s
+        self.degrade_after = degrade_after
+        self.upgrade_after = upgrade_after
+        self.headroom = headroom
+        self.max_backoff = max_backoff
+        self.timer = timer
+        self.on_change = on_change
+
+        self.index = 0
+        self.fps = 0.0
+        self.latency_ms = 0.0
+        self.load = 0.0
+        self.degrades = 0
+        self.upgrades = 0
+
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._frames = 0
+        self._latency_total = 0.0
+        self._window_start = None
+        self._bad_windows = 0
+        self._good_windows = 0
+        self._settling = False
+        self._backoff = [1] * len(self.levels)
+        self._entered_by_upgrade = False
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    # FramePipeline timer interface, forwarded to the wrapped timer
+    def record(self, stage, seconds):
+        if stage not in IDLE_STAGES:
+            with self._lock:
+                total = self._stages.get(stage, 0.0)
+                self._stages[stage] = total + seconds
+        if self.timer is not None:
+            self.timer.record(stage, seconds)
+
+    # Called from the render stage with the pipeline timestamp of the frame
+    def frame_rendered(self, timestamp_ms, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = now
+                self._stages.clear()
+                return
+            self._frames += 1
+            self._latency_total += max(0.0, now * 1000.0 - timestamp_ms)
+            elapsed = now - self._window_start
+            if elapsed < self.window_s:
+                return
+            window = self._close_window(elapsed, now)
+
+        self._judge(*window)
+
+    def _close_window(self, elapsed, now):
+        self.fps = self._frames / elapsed
+        self.latency_ms = self._latency_total / self._frames
+        # Stages that skip frames (strided or tracked detection) only cost their share
+        self.load = max(self._stages.values(), default=0.0) / self._frames * self.target_fps
+        self._frames = 0
+        self._latency_total = 0.0
+        self._stages.clear()
+        self._window_start = now
+        return self.fps, self.latency_ms, self.load
+
+    def _judge(self, fps, latency_ms, load):
+        # The first window after a change still mixes in frames from the old level
+        if self._settling:
+            self._settling = False
+            return
+
+        too_slow = load > 1.0 and fps < self.target_fps
+        too_late = self.max_latency_ms is not None and latency_ms > self.max_latency_ms
+        spare = load * self.headroom <= 1.0 and (
+            self.max_latency_ms is None or latency_ms * self.headroom <= self.max_latency_ms)
+
+        if too_slow or too_late:
+            self._good_windows = 0
+            self._bad_windows += 1
+            if self._bad_windows >= self.degrade_after and self.index < len(self.levels) - 1:
+                reason = f"latency {latency_ms:.0f} ms" if too_late else f"{fps:.1f} fps at load {load:.2f}"
+                self._change(self.index + 1, reason)
+        elif spare:
+            self._bad_windows = 0
+            self._good_windows += 1
+            if self.index > 0 and self._good_windows >= self.upgrade_after * self._backoff[self.index - 1]:
+                self._change(self.index - 1, f"load {load:.2f} leaves headroom")
+        else:
+            self._bad_windows = 0
+            self._good_windows = 0
+
+    def _change(self, index, reason):
+        previous, degrade = self.level, index > self.index
+        self.index = index
+        entered_by_upgrade, self._entered_by_upgrade = self._entered_by_upgrade, not degrade
+        self._bad_windows = 0
+        self._good_windows = 0
+        self._settling = True
+        if degrade:
+            self.degrades += 1
+            if entered_by_upgrade:
+                self._backoff[index - 1] = min(self._backoff[index - 1] * 2, self.max_backoff)
+        else:
+            self.upgrades += 1
+        if self.timer is not None and hasattr(self.timer, "counter"):
+            self.timer.counter("quality_changes", "Adaptive quality level changes").inc()
+        print(f"Quality {previous.name} -> {self.level.name} ({reason})")
+        if self.on_change is not None:
+            self.on_change(self.level, previous, reason)
+
+    def stats(self):
+        return {
+            "level": self.index,
+            "fps": round(self.fps, 2),
+            "latency_ms": round(self.latency_ms, 2),
+            "load": round(self.load, 3),
+            "degrades": self.degrades,
+            "upgrades": self.upgrades,
+        }
+
+
+# The landmarker options for a level; num_faces is the configured maximum
+def landmarker_options(options, level, num_faces=1):
+    return dataclasses.replace(
+        options,
+        num_faces=min(num_faces, level.num_faces or num_faces),
+        output_face_blendshapes=options.output_face_blendshapes and level.blendshapes,
+        output_facial_transformation_matrixes=options.output_facial_transformation_matrixes and level.matrices,
+    )
+
+
+class LandmarkerRebuilder:
+    """Creates landmarkers for new options off the render thread and hands them to the pipeline.
+
+    Creating a landmarker takes around a second, so it happens on a background
+    thread while the current one keeps running. Requests made while a build is
+    under way only keep the newest options.
+    """
+
+    def __init__(self, create, pipeline):
+        self.create = create
+        self.pipeline = pipeline
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._wanted = None
+        self._building = False
+        self._thread = None
+
+    def request(self, options):
+        with self._lock:
+            self._wanted = options
+            if self._building:
+                return
+            self._building = True
+            self._thread = threading.Thread(target=self._build, name="landmarker-rebuild", daemon=True)
+            self._thread.start()
+
+    def _build(self):
+        while True:
+            with self._lock:
+                options, self._wanted = self._wanted, None
+                if options is None:
+                    self._building = False
+                    return
+            try:
+                self.pipeline.replace_landmarker(self.create(options))
+                self.rebuilds += 1
+            except Exception as e:
+                print(f"Failed to rebuild the landmarker: {e}")
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
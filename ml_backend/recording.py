@@ -0,0 +1,209 @@
+"""Append-only on-disk recording of landmarker results.
+
+A recording is a directory of raw little-endian arrays plus a small meta.json:
+
+    index.bin        one record per result: timestamp_ms, frame_index, first face row, face count
+    landmarks.f16    (rows, 478, 3) float16 normalized landmarks, one row per face
+    blendshapes.f16  (rows, 52) float16 scores
+    matrices.f32     (rows, 4, 4) float32 facial transformation matrices
+
+frame_index is whatever the writer passes to record(), a running result count
+by default. Recordings whose frame indices are frames of a video file (batch
+imports) are marked with video_frames in meta.json.
+
+Files only ever grow, in chunks written by a background thread, and the index
+is written last so a reader never sees a face row without its index entry.
+RecordingReader maps the files with np.memmap, so nothing is loaded up front.
+
+By default only blendshapes and matrices are kept: one face at 30 fps takes
+about 0.2 KB per frame, ~20 MB per hour. landmarks=True adds the 478 landmarks
+of every face (~2.9 KB), for ~330 MB per hour; re-rendering needs them.
+"""
+import os
+import json
+import queue
+import threading
+import numpy as np
+from ml_backend.blendshape_store import BLENDSHAPE_NAMES
+from ml_backend.rendering import landmarks_to_normalized
+
+FORMAT_VERSION = 1
+LANDMARK_COUNT = 478
+
+INDEX_DTYPE = np.dtype([("timestamp_ms", "<i8"), ("frame_index", "<i8"), ("face_start", "<i8"), ("face_count", "<i4")])
+LANDMARKS_FILE, BLENDSHAPES_FILE, MATRICES_FILE, INDEX_FILE = "landmarks.f16", "blendshapes.f16", "matrices.f32", "index.bin"
+
+
+# Blendshape scores of one face, from MediaPipe categories or an array of scores
+def _scores(face_blendshapes):
+    if isinstance(face_blendshapes, np.ndarray):
+        return face_blendshapes
+    return np.fromiter((category.score for category in face_blendshapes), dtype=np.float32)
+
+
+class Recorder:
+    """Streams results to a recording directory from a background thread.
+
+    record() only puts the result on a bounded queue and never waits; if the
+    writer falls that far behind the result is counted in dropped instead.
+    max_pending=0 makes the queue unbounded, for offline imports.
+    Conversion to arrays happens on the writer thread, chunk_frames results
+    at a time. video_frames marks frame indices as frames of a video file.
+    """
+
+    def __init__(self, path, landmarks=False, chunk_frames=64, max_pending=1024, video_frames=False):
+        self.path = path
+        self.landmarks = landmarks
+        self.chunk_frames = chunk_frames
+        self.recorded = 0
+        self.dropped = 0
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            if meta["landmarks"] != landmarks:
+                raise ValueError(f"Recording at {path} was made with landmarks={meta['landmarks']}")
+        else:
+            with open(meta_path, "w") as meta_file:
+                json.dump({"version": FORMAT_VERSION, "landmarks": landmarks, "landmark_count": LANDMARK_COUNT,
+                           "blendshape_names": list(BLENDSHAPE_NAMES), "video_frames": video_frames},
+                          meta_file, indent=2)
+
+        self._files = {name: open(os.path.join(path, name), "ab")
+                       for name in (INDEX_FILE, BLENDSHAPES_FILE, MATRICES_FILE) + ((LANDMARKS_FILE,) if landmarks else ())}
+        self._next_row = os.path.getsize(os.path.join(path, BLENDSHAPES_FILE)) // (len(BLENDSHAPE_NAMES) * 2)
+        self._next_frame = os.path.getsize(os.path.join(path, INDEX_FILE)) // INDEX_DTYPE.itemsize
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    # Safe to call from the landmarker callback
+    def record(self, result, timestamp_ms, frame_index=None):
+        try:
+            self._queue.put_nowait((result, timestamp_ms, frame_index))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        chunk = []
+        while True:
+            item = self._queue.get()
+            if item is not None:
+                chunk.append(item)
+            if chunk and (item is None or len(chunk) >= self.chunk_frames or self._queue.empty()):
+                self._write_chunk(chunk)
+                chunk = []
+            if item is None:
+                break
+
+    def _write_chunk(self, chunk):
+        index = np.zeros(len(chunk), dtype=INDEX_DTYPE)
+        landmarks, blendshapes, matrices = [], [], []
+        for position, (result, timestamp_ms, frame_index) in enumerate(chunk):
+            faces = result.face_landmarks or []
+            scores = result.face_blendshapes or []
+            transforms = result.facial_transformation_matrixes or []
+            index[position] = (timestamp_ms, self._next_frame if frame_index is None else frame_index,
+                               self._next_row, len(faces))
+            for face_index, face in enumerate(faces):
+                if self.landmarks:
+                    landmarks.append(landmarks_to_normalized(face)[:LANDMARK_COUNT])
+                row = np.zeros(len(BLENDSHAPE_NAMES), dtype=np.float16)
+                if face_index < len(scores):
+                    values = _scores(scores[face_index])[:len(BLENDSHAPE_NAMES)]
+                    row[:len(values)] = values
+                blendshapes.append(row)
+                matrix = transforms[face_index] if face_index < len(transforms) else np.full((4, 4), np.nan)
+                matrices.append(np.asarray(matrix, dtype=np.float32).reshape(4, 4))
+            self._next_row += len(faces)
+            self._next_frame += 1
+
+        if blendshapes:
+            if self.landmarks:
+                self._files[LANDMARKS_FILE].write(np.asarray(landmarks, dtype="<f2").tobytes())
+            self._files[BLENDSHAPES_FILE].write(np.asarray(blendshapes, dtype="<f2").tobytes())
+            self._files[MATRICES_FILE].write(np.asarray(matrices, dtype="<f4").tobytes())
+            for name in (LANDMARKS_FILE, BLENDSHAPES_FILE, MATRICES_FILE):
+                if name in self._files:
+                    self._files[name].flush()
+        self._files[INDEX_FILE].write(index.tobytes())
+        self._files[INDEX_FILE].flush()
+        self.recorded += len(chunk)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        for file in self._files.values():
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _memmap(path, dtype, row_shape):
+    row_size = int(np.prod(row_shape)) * np.dtype(dtype).itemsize
+    rows = os.path.getsize(path) // row_size if os.path.exists(path) else 0
+    if rows == 0:
+        return np.zeros((0,) + row_shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,) + row_shape)
+
+
+class RecordingReader:
+    """Memory-mapped view of a recording, safe to open while it is being written."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            self.meta = json.load(meta_file)
+        self.blendshape_names = tuple(self.meta["blendshape_names"])
+
+        self.index = _memmap(os.path.join(path, INDEX_FILE), INDEX_DTYPE, ())
+        self.blendshapes = _memmap(os.path.join(path, BLENDSHAPES_FILE), "<f2", (len(self.blendshape_names),))
+        self.matrices = _memmap(os.path.join(path, MATRICES_FILE), "<f4", (4, 4))
+        self.landmarks = None
+        if self.meta["landmarks"]:
+            self.landmarks = _memmap(os.path.join(path, LANDMARKS_FILE), "<f2", (self.meta["landmark_count"], 3))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index["timestamp_ms"]
+
+    @property
+    def frame_indices(self):
+        return self.index["frame_index"]
+
+    # Face rows of the i-th recorded result
+    def rows(self, position):
+        entry = self.index[position]
+        start = int(entry["face_start"])
+        return slice(start, start + int(entry["face_count"]))
+
+    # Landmarks of every face in the i-th result as a list of (478, 3) float32 arrays
+    def faces(self, position):
+        if self.landmarks is None:
+            return []
+        return [np.asarray(face, dtype=np.float32) for face in self.landmarks[self.rows(position)]]
+
+    # Position of the last result at or before timestamp_ms, or -1
+    def find(self, timestamp_ms):
+        return int(np.searchsorted(self.timestamps, timestamp_ms, side="right")) - 1
+
+    # Position of the result for a video frame index, or -1 if that frame has none
+    def find_frame(self, frame_index):
+        frames = self.frame_indices
+        position = int(np.searchsorted(frames, frame_index))
+        if position < len(frames) and frames[position] == frame_index:
+            return position
+        return -1
+
+    def column(self, name):
+        return self.blendshapes[:, self.blendshape_names.index(name)]
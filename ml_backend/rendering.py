@@ -0,0 +1,150 @@
+import functools
+from collections import namedtuple
+import cv2
+import numpy as np
+
+OVERLAY_STYLES = ("points", "contours", "mesh")
+
+# Array form of a FaceLandmarkerResult, used for results we compute or remap ourselves.
+# face_landmarks holds one normalized (478, 3) array per face.
+LandmarkResult = namedtuple("LandmarkResult", ["face_landmarks", "face_blendshapes", "facial_transformation_matrixes"])
+
+
+# Converts one face's landmarks into a normalized (N, 3) float32 array of x, y, z.
+# Accepts a MediaPipe landmark list or an already converted array, which is returned as is.
+def landmarks_to_normalized(face_landmarks):
+    if isinstance(face_landmarks, np.ndarray):
+        return face_landmarks.astype(np.float32, copy=False)
+    return np.array([(landmark.x, landmark.y, landmark.z) for landmark in face_landmarks], dtype=np.float32)
+
+
+# Converts one face's landmarks into an (N, 2) int32 array of pixel coordinates
+def landmarks_to_array(face_landmarks, width, height):
+    normalized = landmarks_to_normalized(face_landmarks)[:, :2]
+    return np.rint(normalized * np.array((width, height), dtype=np.float32)).astype(np.int32)
+
+
+# Edge index arrays (E, 2) for the contour and tessellation styles, built once
+@functools.lru_cache(maxsize=None)
+def connection_edges(style):
+    from mediapipe.tasks.python.vision import FaceLandmarksConnections
+
+    if style == "contours":
+        connections = FaceLandmarksConnections.FACE_LANDMARKS_CONTOURS
+    elif style == "mesh":
+        connections = FaceLandmarksConnections.FACE_LANDMARKS_TESSELATION
+    else:
+        raise ValueError(f"invalid overlay style: {style}")
+
+    edges = np.array([(connection.start, connection.end) for connection in connections], dtype=np.int32)
+    edges.setflags(write=False)
+    return edges
+
+
+# Pixel offsets of a filled disk, matching cv2.circle(..., radius, color, -1)
+@functools.lru_cache(maxsize=None)
+def _disk_offsets(radius):
+    span = np.arange(-radius, radius + 1)
+    dx, dy = np.meshgrid(span, span)
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    return np.stack([dx[inside], dy[inside]], axis=1).astype(np.int32)
+
+
+# Stamps every point as a small disk with one fancy-indexing assignment
+def draw_points(image, points, color, radius=1):
+    stamped = (points[:, None, :] + _disk_offsets(radius)[None, :, :]).reshape(-1, 2)
+    height, width = image.shape[:2]
+    visible = (stamped[:, 0] >= 0) & (stamped[:, 0] < width) & (stamped[:, 1] >= 0) & (stamped[:, 1] < height)
+    stamped = stamped[visible]
+    image[stamped[:, 1], stamped[:, 0]] = color
+
+
+# Draws all edges of a connection set with a single cv2.polylines call
+def draw_connections(image, points, edges, color, thickness=1):
+    segments = np.ascontiguousarray(points[edges])
+    cv2.polylines(image, segments, False, color, thickness, cv2.LINE_8)
+
+
+def _draw_face(image, points, style, color):
+    if style == "points":
+        draw_points(image, points, color)
+    else:
+        draw_connections(image, points, connection_edges(style), color)
+
+
+# Draws every face straight onto the frame, no caching
+def draw_landmarks(frame, faces, color=(0, 255, 0), style="points"):
+    height, width = frame.shape[:2]
+    for face_landmarks in faces:
+        _draw_face(frame, landmarks_to_array(face_landmarks, width, height), style, color)
+
+
+class OverlayRenderer:
+    """Draws landmark overlays and reuses the last drawn layer while faces hold still.
+
+    The layer is only redrawn when the face count, color or style changes, or when
+    any landmark has moved more than reuse_threshold pixels since the last redraw.
+    Compositing the cached layer only touches the overlay's bounding box.
+    """
+
+    def __init__(self, style="points", color=(0, 255, 0), reuse_threshold=1.0):
+        if style not in OVERLAY_STYLES:
+            raise ValueError(f"invalid overlay style: {style}")
+        self.style = style
+        self.color = tuple(color)
+        self.reuse_threshold = reuse_threshold
+
+        self._layer = None
+        self._mask = None
+        self._points = None
+        self._key = None
+        self._bbox = None
+        self.redraws = 0
+        self.reuses = 0
+
+    def draw(self, frame, faces):
+        height, width = frame.shape[:2]
+        points = [landmarks_to_array(face_landmarks, width, height) for face_landmarks in faces]
+        if not points:
+            return frame
+
+        key = (frame.shape, self.style, tuple(self.color), tuple(len(face) for face in points))
+        if key != self._key or self._moved(points):
+            self._redraw(frame.shape, points, key)
+        else:
+            self.reuses += 1
+
+        x0, y0, x1, y1 = self._bbox
+        if x1 > x0 and y1 > y0:
+            np.copyto(frame[y0:y1, x0:x1], self._layer[y0:y1, x0:x1], where=self._mask[y0:y1, x0:x1, None].view(bool))
+        return frame
+
+    def _moved(self, points):
+        return any(
+            np.abs(current - previous).max() > self.reuse_threshold
+            for current, previous in zip(points, self._points)
+        )
+
+    def _redraw(self, shape, points, key):
+        if self._layer is None or self._layer.shape != shape:
+            self._layer = np.zeros(shape, dtype=np.uint8)
+            self._mask = np.zeros(shape[:2], dtype=np.uint8)
+            self._bbox = (0, 0, shape[1], shape[0])
+
+        # Only the previously drawn region can be dirty
+        x0, y0, x1, y1 = self._bbox
+        self._layer[y0:y1, x0:x1] = 0
+        self._mask[y0:y1, x0:x1] = 0
+
+        for face in points:
+            _draw_face(self._layer, face, self.style, self.color)
+            _draw_face(self._mask, face, self.style, 1)
+
+        stacked = np.concatenate(points)
+        pad = 2
+        x0, y0 = np.maximum(stacked.min(axis=0) - pad, 0)
+        x1, y1 = np.minimum(stacked.max(axis=0) + pad + 1, (shape[1], shape[0]))
+        self._bbox = (int(x0), int(y0), int(x1), int(y1))
+        self._points = points
+        self._key = key
+        self.redraws += 1
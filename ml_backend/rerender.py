@@ -0,0 +1,229 @@
+"""Re-render a captured video with different masks or overlays, without inference.
+
+Landmarks come from a recording (see recording.py) whose frame_index column
+refers to frames of the video, i.e. one imported from ml_backend.batch results.
+Live recordings count results rather than video frames (and the live file sink
+writes frames with the overlay already drawn), so they are refused. Each mask is rendered over frame ranges in
+worker processes; every worker seeks the video to its range, maps the
+recording, and writes its own part file. Parts are joined with ffmpeg's concat
+demuxer when ffmpeg is installed, otherwise by re-encoding them with OpenCV.
+
+    python -m ml_backend.batch event.mp4 -o results/
+    python -m ml_backend.rerender event.mp4 --batch-results results/ --mask masks/ -o renders/
+    python -m ml_backend.rerender event.mp4 --recording renders/event.recording --overlay mesh -o renders/
+"""
+import os
+import glob
+import shutil
+import argparse
+import subprocess
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from ml_backend.batch import _video_frame_count
+from ml_backend.mask_cache import MASK_EXTENSIONS
+from ml_backend.recording import Recorder, RecordingReader
+from ml_backend.rendering import OVERLAY_STYLES, LandmarkResult
+
+
+@dataclass
+class RenderUnit:
+    video: str
+    recording: str
+    output: str
+    start_frame: int
+    end_frame: int
+    mask: str = None
+    overlay: str = None
+
+
+# Converts the .npz units ml_backend.batch wrote for one video into a recording
+def import_batch_results(batch_dir, video, recording_dir):
+    stem = os.path.splitext(os.path.basename(video))[0]
+    paths = sorted(glob.glob(os.path.join(batch_dir, f"{glob.escape(stem)}.frames*.npz")))
+    if not paths:
+        raise ValueError(f"No batch results for {video} in {batch_dir}")
+
+    with Recorder(recording_dir, landmarks=True, max_pending=0, video_frames=True) as recorder:
+        for path in paths:
+            with np.load(path) as results:
+                face_start = np.concatenate([[0], np.cumsum(results["face_count"])])
+                for position, frame_index in enumerate(results["frame_index"]):
+                    rows = slice(face_start[position], face_start[position + 1])
+                    recorder.record(LandmarkResult(list(results["landmarks"][rows]), list(results["blendshapes"][rows]),
+                                                   list(results["matrices"][rows])),
+                                    int(results["timestamp_ms"][position]), frame_index=int(frame_index))
+    return recording_dir
+
+
+# Splits every (mask or overlay) job into frame ranges of about chunk_frames
+def plan_render_units(video, recording, output_dir, masks=(), overlay=None, chunk_frames=600):
+    frame_count = _video_frame_count(video)
+    stem = os.path.splitext(os.path.basename(video))[0]
+    jobs = [(mask, None, os.path.splitext(os.path.basename(mask))[0]) for mask in masks]
+    if overlay:
+        jobs.append((None, overlay, overlay))
+
+    units = []
+    for mask, overlay_style, name in jobs:
+        for start in range(0, frame_count, chunk_frames):
+            part = os.path.join(output_dir, f"{stem}.{name}.part{start:07d}.mp4")
+            units.append(RenderUnit(video, recording, part, start, min(start + chunk_frames, frame_count),
+                                    mask, overlay_style))
+    return units
+
+
+# Per-process cache of loaded masks, readers and renderers
+_worker = {}
+
+
+# Returns draw(frame, faces) for the unit's mask or overlay
+def _renderer(unit):
+    from ml_backend.masking import FaceMask, MaskRenderer
+    from ml_backend.rendering import OverlayRenderer
+
+    key = (unit.mask, unit.overlay)
+    if key not in _worker:
+        if unit.mask:
+            _worker[key] = MaskRenderer(FaceMask.from_file(unit.mask)).apply
+        else:
+            _worker[key] = OverlayRenderer(style=unit.overlay).draw
+    return _worker[key]
+
+
+def _reader(path):
+    key = ("recording", path)
+    if key not in _worker:
+        _worker[key] = RecordingReader(path)
+    return _worker[key]
+
+
+# Renders one frame range into its part file, runs inside a worker
+def render_unit(unit):
+    reader = _reader(unit.recording)
+    draw = _renderer(unit)
+    frames = reader.frame_indices
+
+    cap = cv2.VideoCapture(unit.video)
+    writer = None
+    rendered = 0
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.set(cv2.CAP_PROP_POS_FRAMES, unit.start_frame)
+        # Frames without their own result keep the last face seen before them
+        positions = np.searchsorted(frames, np.arange(unit.start_frame, unit.end_frame), side="right") - 1
+        for position in positions:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(unit.output, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            if position >= 0:
+                draw(frame, reader.faces(position))
+            writer.write(frame)
+            rendered += 1
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+    return unit.output, rendered
+
+
+def _concat_parts(parts, output):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        list_path = output + ".parts.txt"
+        with open(list_path, "w") as list_file:
+            list_file.writelines(f"file '{os.path.abspath(part)}'\n" for part in parts)
+        try:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                            "-c", "copy", output], check=True)
+        finally:
+            os.remove(list_path)
+    else:
+        writer = None
+        for part in parts:
+            cap = cv2.VideoCapture(part)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if writer is None:
+                    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+                    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), fps, frame.shape[1::-1])
+                writer.write(frame)
+            cap.release()
+        if writer is not None:
+            writer.release()
+    for part in parts:
+        os.remove(part)
+
+
+def rerender(video, recording, output_dir, masks=(), overlay=None, workers=None, chunk_frames=600):
+    os.makedirs(output_dir, exist_ok=True)
+    units = plan_render_units(video, recording, output_dir, masks, overlay, chunk_frames)
+    workers = min(workers or os.cpu_count() or 1, max(len(units), 1))
+
+    # spawn for the same reason as batch.py: no forked copies of library threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        results = list(pool.map(render_unit, units))
+
+    # Units of one job are planned in frame order and map() keeps that order
+    jobs = {}
+    for path, rendered in results:
+        output = path.rsplit(".part", 1)[0] + ".mp4"
+        parts = jobs.setdefault(output, [])
+        if rendered:
+            parts.append(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    for output, parts in jobs.items():
+        _concat_parts(parts, output)
+    return list(jobs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply masks or overlays to a video using recorded landmarks.")
+    parser.add_argument("video")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recording", help="recording imported from batch results for this video")
+    source.add_argument("--batch-results", help="output directory of ml_backend.batch for this video")
+    parser.add_argument("--mask", action="append", default=[], help="mask image or directory of masks (repeatable)")
+    parser.add_argument("--overlay", choices=OVERLAY_STYLES, help="draw this landmark overlay instead")
+    parser.add_argument("-o", "--output", required=True, help="directory for the rendered videos")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-frames", type=int, default=600)
+    args = parser.parse_args(argv)
+
+    masks = []
+    for path in args.mask:
+        if os.path.isdir(path):
+            masks.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(MASK_EXTENSIONS)))
+        else:
+            masks.append(path)
+    if not masks and not args.overlay:
+        parser.error("give at least one --mask or an --overlay")
+
+    recording = args.recording
+    if recording:
+        meta = RecordingReader(recording).meta
+        if not meta.get("video_frames") or not meta["landmarks"]:
+            parser.error(f"{recording} is not aligned to video frames or has no landmarks, "
+                         "re-render from --batch-results instead")
+    if args.batch_results:
+        stem = os.path.splitext(os.path.basename(args.video))[0]
+        recording = os.path.join(args.output, f"{stem}.recording")
+        if not os.path.exists(os.path.join(recording, "meta.json")):
+            import_batch_results(args.batch_results, args.video, recording)
+
+    for output in rerender(args.video, recording, args.output, masks, args.overlay, args.workers, args.chunk_frames):
+        print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from collections import namedtuple
+import cv2
+import numpy as np
+from ml_backend.rendering import LandmarkResult, landmarks_to_normalized
+
+# Crop rectangle in frame pixels plus the frame size it was cut from
+Roi = namedtuple("Roi", ["x0", "y0", "width", "height", "frame_width", "frame_height"])
+
+
+# Maps one face's landmarks from crop-normalized to frame-normalized coordinates
+def map_landmarks_to_frame(face, roi):
+    mapped = np.empty_like(face)
+    mapped[:, 0] = (face[:, 0] * roi.width + roi.x0) / roi.frame_width
+    mapped[:, 1] = (face[:, 1] * roi.height + roi.y0) / roi.frame_height
+    # z is on the same scale as x, which was the crop width
+    mapped[:, 2] = face[:, 2] * roi.width / roi.frame_width
+    return mapped
+
+
+# Maps a result computed on a crop back to full-frame coordinates
+def map_result_to_frame(result, roi):
+    faces = [map_landmarks_to_frame(landmarks_to_normalized(face), roi) for face in (result.face_landmarks or [])]
+    return LandmarkResult(faces, result.face_blendshapes, result.facial_transformation_matrixes)
+
+
+class RoiSelector:
+    """Picks the part of the next frame the landmarker needs to see.
+
+    The region is the union box of the last result's faces, padded by `padding`
+    times its size on every side and squared up. It is kept while the faces stay
+    well inside it, so MediaPipe's own tracking sees a stable crop, and is moved
+    once they get close to its edge or shrink a lot. The whole frame is used
+    again every `full_frame_every` frames and whenever no face was found, so new
+    faces entering the scene are picked up.
+    """
+
+    def __init__(self, padding=0.4, max_side=320, full_frame_every=30, edge_margin=0.1):
+        self.padding = padding
+        self.max_side = max_side
+        self.full_frame_every = full_frame_every
+        self.edge_margin = edge_margin
+
+        self.roi = None
+        self._frames_since_full = 0
+        self.full_frames = 0
+        self.cropped_frames = 0
+
+    # Called with every full-frame result, computed on a crop or not
+    def update(self, faces, frame_width, frame_height):
+        faces = [landmarks_to_normalized(face) for face in faces]
+        if not faces:
+            self.roi = None
+            return
+
+        points = np.concatenate([face[:, :2] for face in faces]) * (frame_width, frame_height)
+        low, high = points.min(axis=0), points.max(axis=0)
+        if self.roi is not None and self._still_fits(low, high):
+            return
+
+        center = (low + high) / 2
+        side = float((high - low).max()) * (1 + 2 * self.padding)
+        side = max(min(side, frame_width, frame_height), 16)
+        x0 = int(np.clip(center[0] - side / 2, 0, frame_width - side))
+        y0 = int(np.clip(center[1] - side / 2, 0, frame_height - side))
+        self.roi = Roi(x0, y0, int(side), int(side), frame_width, frame_height)
+
+    def _still_fits(self, low, high):
+        roi = self.roi
+        margin = self.edge_margin * roi.width
+        inside = (low[0] >= roi.x0 + margin and low[1] >= roi.y0 + margin and
+                  high[0] <= roi.x0 + roi.width - margin and high[1] <= roi.y0 + roi.height - margin)
+        # A face far smaller than the crop would waste the landmarker's input resolution
+        big_enough = (high - low).max() * (1 + 2 * self.padding) >= roi.width / 2
+        return inside and big_enough
+
+    # Returns the region to use for this frame, or None for the whole frame
+    def plan(self, frame):
+        height, width = frame.shape[:2]
+        self._frames_since_full += 1
+        if (self.roi is None or self._frames_since_full >= self.full_frame_every
+                or (self.roi.frame_width, self.roi.frame_height) != (width, height)):
+            self._frames_since_full = 0
+            self.full_frames += 1
+            return None
+        self.cropped_frames += 1
+        return self.roi
+
+    # Cuts the region out of the BGR frame and shrinks it to at most max_side
+    def crop(self, frame, roi):
+        crop = frame[roi.y0:roi.y0 + roi.height, roi.x0:roi.x0 + roi.width]
+        side = max(roi.width, roi.height)
+        if side > self.max_side:
+            scale = self.max_side / side
+            size = (max(int(round(roi.width * scale)), 1), max(int(round(roi.height * scale)), 1))
+            crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(crop)
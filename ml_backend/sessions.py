@@ -0,0 +1,354 @@
+"""Several input streams in one process, sharing a small pool of landmarkers.
+
+Every stream is a session with its own capture thread and state. A fixed number
+of inference workers (at most one per core) take the newest frame of whichever
+session is next in round-robin order, borrow a landmarker from the pool, and
+hand the result back to that session. Sessions without a new frame are skipped,
+so idle streams cost no inference, and landmarkers are only created once that
+many workers need one at the same time. A video file session ends at the end of
+the file; cameras, URLs and sockets keep retrying after a failed read.
+
+    python -m ml_backend.sessions 0 1 rtsp://booth-3/stream clip.mp4 --socket 9000
+"""
+import os
+import queue
+import socket
+import struct
+import argparse
+import threading
+from dataclasses import dataclass, field
+import cv2
+import numpy as np
+from ml_backend.blendshape_store import BlendshapeStore
+from ml_backend.commands import UserRegistry
+from ml_backend.pipeline import LatestSlot
+from ml_backend.rendering import OverlayRenderer
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "face_landmarker.task")
+
+
+class SocketSource:
+    """Capture-like source for frames pushed over a local TCP socket.
+
+    Accepts one client at a time; each frame is a 4-byte big-endian length
+    followed by an encoded image (JPEG or PNG).
+    """
+
+    def __init__(self, port, host="127.0.0.1"):
+        self._server = socket.create_server((host, port))
+        self.port = self._server.getsockname()[1]
+        self._client = None
+        self._open = True
+
+    def isOpened(self):
+        return self._open
+
+    def _read_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._client.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client disconnected")
+            data.extend(chunk)
+        return bytes(data)
+
+    def read(self):
+        if not self._open:
+            return False, None
+        try:
+            if self._client is None:
+                self._client, _ = self._server.accept()
+            size, = struct.unpack(">I", self._read_exactly(4))
+            frame = cv2.imdecode(np.frombuffer(self._read_exactly(size), dtype=np.uint8), cv2.IMREAD_COLOR)
+        except (ConnectionError, OSError):
+            # Wait for the next client
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            return False, None
+        return frame is not None, frame
+
+    def release(self):
+        self._open = False
+        if self._client is not None:
+            self._client.close()
+        self._server.close()
+
+
+# Seconds a capture thread waits after a failed read before trying again
+READ_RETRY_DELAY = 0.01
+
+
+# Opens a camera index, RTSP/HTTP URL, video file, or "socket:PORT"
+def open_source(spec):
+    if isinstance(spec, int) or str(spec).isdigit():
+        return cv2.VideoCapture(int(spec))
+    if str(spec).startswith("socket:"):
+        return SocketSource(int(spec.split(":", 1)[1]))
+    return cv2.VideoCapture(spec)
+
+
+@dataclass
+class SessionState:
+    color: tuple = (0, 255, 0)
+    landmark_results: object = None
+    blendshapes: BlendshapeStore = field(default_factory=lambda: BlendshapeStore(capacity=300))
+    users: UserRegistry = field(default_factory=UserRegistry)
+
+
+class Session:
+    """One input stream and everything that belongs to it.
+
+    The session ends after max_empty_reads failed reads in a row (None retries
+    forever, e.g. for cameras and sockets).
+    """
+
+    def __init__(self, session_id, cap, max_empty_reads=None):
+        self.session_id = session_id
+        self.cap = cap
+        self.max_empty_reads = max_empty_reads
+        self.state = SessionState()
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+
+        self.busy = False
+        self.captured = 0
+        self.processed = 0
+        self._thread = None
+
+    def _capture_loop(self, stop):
+        empty_reads = 0
+        try:
+            while not stop.is_set() and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if not ret:
+                    empty_reads += 1
+                    if self.max_empty_reads is not None and empty_reads >= self.max_empty_reads:
+                        break
+                    stop.wait(READ_RETRY_DELAY)
+                    continue
+                empty_reads = 0
+                self.captured += 1
+                self.frames.put(frame)
+        finally:
+            self.frames.close()
+
+    def start(self, stop):
+        self._thread = threading.Thread(target=self._capture_loop, args=(stop,), name=f"capture-{self.session_id}",
+                                        daemon=True)
+        self._thread.start()
+
+    def on_result(self, frame, result, timestamp_ms):
+        self.state.landmark_results = result
+        self.state.blendshapes.append_result(result, timestamp_ms)
+        self.processed += 1
+        self.results.put((frame, result))
+
+    @property
+    def finished(self):
+        return self.frames.closed and not self.busy
+
+
+class LandmarkerPool:
+    """Bounded pool of IMAGE-mode landmarkers shared by every session.
+
+    IMAGE mode keeps no state between calls, so any instance can serve any
+    stream. Instances are created on first demand, up to size.
+    """
+
+    def __init__(self, size=None, factory=None, model_path=DEFAULT_MODEL_PATH):
+        self.size = size or os.cpu_count() or 1
+        self.factory = factory or (lambda: create_image_landmarker(model_path))
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self.created < self.size:
+                self.created += 1
+                return self.factory()
+        return self._idle.get()
+
+    def release(self, landmarker):
+        self._idle.put(landmarker)
+
+    def close(self):
+        while True:
+            try:
+                landmarker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            close = getattr(landmarker, "close", None)
+            if close:
+                close()
+
+
+def create_image_landmarker(model_path=DEFAULT_MODEL_PATH, num_faces=1):
+    import mediapipe as mp
+
+    options = mp.tasks.vision.FaceLandmarkerOptions(
+        base_options=mp.tasks.BaseOptions(model_asset_path=model_path),
+        running_mode=mp.tasks.vision.RunningMode.IMAGE,
+        num_faces=num_faces,
+        output_face_blendshapes=True,
+        output_facial_transformation_matrixes=True,
+    )
+    return mp.tasks.vision.FaceLandmarker.create_from_options(options)
+
+
+def convert_image(frame):
+    import mediapipe as mp
+
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+class SessionManager:
+    """Runs sessions and schedules their frames onto the landmarker pool.
+
+    workers inference threads (defaults to the core count) pick sessions in
+    round-robin order, skipping sessions that are busy or have no new frame.
+    """
+
+    def __init__(self, pool=None, workers=None, convert=convert_image):
+        self.pool = pool or LandmarkerPool()
+        self.workers = min(workers or os.cpu_count() or 1, os.cpu_count() or 1)
+        self.convert = convert
+        self.sessions = {}
+
+        self._lock = threading.Condition()
+        self._next = 0
+        self._stop = threading.Event()
+        self._threads = []
+        self._timestamps = {}
+
+    def add(self, session_id, cap, max_empty_reads=None):
+        session = Session(session_id, cap, max_empty_reads)
+        with self._lock:
+            self.sessions[session_id] = session
+            if self._threads:
+                session.start(self._stop)
+            self._lock.notify_all()
+        return session
+
+    # Next session with a pending frame in round-robin order, marked busy
+    def _take(self):
+        with self._lock:
+            while not self._stop.is_set():
+                sessions = list(self.sessions.values())
+                for offset in range(len(sessions)):
+                    session = sessions[(self._next + offset) % len(sessions)]
+                    if session.busy:
+                        continue
+                    frame = session.frames.get(timeout=0)
+                    if frame is not None:
+                        self._next = (self._next + offset + 1) % len(sessions)
+                        session.busy = True
+                        return session, frame
+                if sessions and all(session.frames.closed for session in sessions):
+                    return None, None
+                self._lock.wait(0.005)
+            return None, None
+
+    def _worker_loop(self):
+        while True:
+            session, frame = self._take()
+            if session is None:
+                break
+            try:
+                timestamp_ms = self._timestamps.get(session.session_id, 0) + 1
+                self._timestamps[session.session_id] = timestamp_ms
+                landmarker = self.pool.acquire()
+                try:
+                    result = landmarker.detect(self.convert(frame))
+                finally:
+                    self.pool.release(landmarker)
+                session.on_result(frame, result, timestamp_ms)
+            except Exception as e:
+                print(f"Inference failed for session {session.session_id}: {e}")
+            finally:
+                with self._lock:
+                    session.busy = False
+                    self._lock.notify_all()
+
+    def start(self):
+        for session in self.sessions.values():
+            session.start(self._stop)
+        self._threads = [threading.Thread(target=self._worker_loop, name=f"inference-{index}", daemon=True)
+                         for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    # Calls render(session, frame, result) on the caller's thread for every new result,
+    # until every source has ended or render returns False
+    def run(self, render):
+        self.start()
+        try:
+            while True:
+                sessions = list(self.sessions.values())
+                rendered = False
+                for session in sessions:
+                    item = session.results.get(timeout=0)
+                    if item is None:
+                        continue
+                    rendered = True
+                    if render(session, *item) is False:
+                        return
+                if not rendered:
+                    if all(session.finished for session in sessions) and not any(t.is_alive() for t in self._threads):
+                        return
+                    self._stop.wait(0.005)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        for session in self.sessions.values():
+            session.cap.release()
+        self.pool.close()
+
+    def stats(self):
+        return {
+            "landmarkers": self.pool.created,
+            "sessions": {session_id: {"captured": session.captured, "processed": session.processed,
+                                      "dropped": session.frames.dropped}
+                         for session_id, session in self.sessions.items()},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run face landmark detection on several streams in one process.")
+    parser.add_argument("sources", nargs="*", help="camera indexes, RTSP URLs or video files")
+    parser.add_argument("--socket", type=int, action="append", default=[], help="accept pushed frames on this port")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--landmarkers", type=int, default=None, help="landmarker pool size (default: core count)")
+    args = parser.parse_args(argv)
+    if not args.sources and not args.socket:
+        parser.error("no sources given")
+
+    manager = SessionManager(LandmarkerPool(args.landmarkers, model_path=args.model))
+    for spec in args.sources + [f"socket:{port}" for port in args.socket]:
+        manager.add(str(spec), open_source(spec), max_empty_reads=1 if os.path.isfile(str(spec)) else None)
+    overlays = {}
+
+    def render(session, frame, result):
+        overlay = overlays.setdefault(session.session_id, OverlayRenderer(color=session.state.color))
+        overlay.draw(frame, result.face_landmarks or [])
+        cv2.imshow(f"Session {session.session_id}", frame)
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+    manager.run(render)
+    cv2.destroyAllWindows()
+    print(f"Session stats: {manager.stats()}")
+
+
+if __name__ == "__main__":
+    main()
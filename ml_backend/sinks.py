@@ -0,0 +1,181 @@
+"""Where rendered frames go: a window, a video file, a TCP socket or nowhere.
+
+Every sink has write(frame) -> keep_running and close(). Only WindowSink
+touches the display, so the others work on machines without one.
+
+    window              cv2.imshow, q stops (the default)
+    null                discard frames, e.g. when only MQTT, metrics or recordings matter
+    file:out.mp4        encode into a video file (any path ending in .mp4/.avi works too)
+    tcp://host:port     push JPEG frames to a listener, same framing as sessions.SocketSource
+    http://host:port    serve MJPEG to browsers, see streaming.py
+
+Several sinks can be combined with TeeSink.
+"""
+import time
+import socket
+import struct
+import threading
+import cv2
+from ml_backend.pipeline import LatestSlot
+
+SINK_SPECS = ("window", "null", "file:PATH", "tcp://HOST:PORT", "http://HOST:PORT")
+
+
+class NullSink:
+    def __init__(self):
+        self.frames = 0
+
+    def write(self, frame):
+        self.frames += 1
+        return True
+
+    def close(self):
+        pass
+
+
+class WindowSink:
+    def __init__(self, title="MediaPipe Face Detection"):
+        self.title = title
+
+    def write(self, frame):
+        cv2.imshow(self.title, frame)
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class FileSink:
+    """Encodes frames into a video file, opened on the first frame so the size is known."""
+
+    def __init__(self, path, fps=30.0, fourcc="mp4v"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self._writer = None
+
+    def write(self, frame):
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (width, height))
+        self._writer.write(frame)
+        return True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+
+class SocketSink:
+    """Sends each frame as a 4-byte big-endian length and a JPEG to a TCP listener.
+
+    write() only copies the frame into a newest-wins slot; a sender thread
+    encodes and sends, so a slow listener loses frames instead of holding up
+    rendering. A missing, vanished or stalled listener (no progress for
+    send_timeout seconds) never stops the pipeline: frames are dropped and the
+    connection is retried at most every retry_interval seconds.
+    """
+
+    def __init__(self, host, port, quality=80, retry_interval=1.0, send_timeout=1.0):
+        self.address = (host, port)
+        self.quality = quality
+        self.retry_interval = retry_interval
+        self.send_timeout = send_timeout
+        self.sent = 0
+        self.failed = 0
+        self._socket = None
+        self._next_attempt = 0.0
+        self._pending = LatestSlot()
+        self._thread = threading.Thread(target=self._send_loop, name="socket-sink", daemon=True)
+        self._thread.start()
+
+    # Frames replaced before the sender got to them plus frames it could not send
+    @property
+    def dropped(self):
+        return self._pending.dropped + self.failed
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return None
+        self._next_attempt = now + self.retry_interval
+        try:
+            self._socket = socket.create_connection(self.address, timeout=self.retry_interval)
+            self._socket.settimeout(self.send_timeout)
+        except OSError:
+            self._socket = None
+        return self._socket
+
+    def _send(self, frame):
+        if self._socket is None and self._connect() is None:
+            self.failed += 1
+            return
+        ok, encoded = cv2.imencode(".jpg", frame, (cv2.IMWRITE_JPEG_QUALITY, self.quality))
+        try:
+            self._socket.sendall(struct.pack(">I", len(encoded)) + encoded.tobytes())
+            self.sent += 1
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            self.failed += 1
+
+    def _send_loop(self):
+        while True:
+            frame = self._pending.get(timeout=0.5)
+            if frame is None:
+                if self._pending.closed:
+                    break
+                continue
+            self._send(frame)
+
+    def write(self, frame):
+        self._pending.put(frame.copy())
+        return True
+
+    # Sends the frame still pending, then disconnects
+    def close(self):
+        self._pending.close()
+        self._thread.join(timeout=self.send_timeout + self.retry_interval)
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class TeeSink:
+    """Writes every frame to each sink in turn; stops when any of them asks to."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, frame):
+        keep_running = True
+        for sink in self.sinks:
+            keep_running = sink.write(frame) and keep_running
+        return keep_running
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# Builds a sink from a command line spec, see SINK_SPECS
+def open_sink(spec, fps=30.0):
+    if spec == "window":
+        return WindowSink()
+    if spec == "null":
+        return NullSink()
+    if spec.startswith(("tcp://", "http://")):
+        scheme, _, address = spec.partition("://")
+        host, _, port = address.rstrip("/").rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Invalid {scheme} sink: {spec}")
+        if scheme == "http":
+            from ml_backend.streaming import StreamServer
+            return StreamServer(int(port), host).start()
+        return SocketSink(host, int(port))
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):], fps=fps)
+    if spec.lower().endswith((".mp4", ".avi")):
+        return FileSink(spec, fps=fps)
+    raise ValueError(f"Unknown sink {spec!r}, expected one of {', '.join(SINK_SPECS)}")
@@ -0,0 +1,268 @@
+"""Serves processed frames to browsers as MJPEG (or multipart WebP) over HTTP.
+
+StreamServer is a sink (see sinks.py): write(frame) copies the frame into a
+single pending slot and returns at once, and only while someone is watching.
+An encoder thread takes the newest pending frame and encodes it once per
+profile that has viewers, in parallel on a small thread pool (cv2.imencode
+releases the GIL). All viewers of a profile share those bytes. A viewer always
+gets the newest encoded frame, so a slow client skips frames instead of
+holding back the encoder, other viewers or the pipeline.
+
+    GET /stream/<profile>                             multipart/x-mixed-replace stream
+    GET /stream?quality=60&width=640&format=webp      same, for an ad-hoc profile
+    GET /frame/<profile>                              newest frame as a single image
+    GET /profiles                                     configured profiles as JSON
+
+    python -m ml_backend.face_detection --sink window --sink http://127.0.0.1:8080
+"""
+import json
+import threading
+from dataclasses import asdict, dataclass
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import cv2
+from ml_backend.pipeline import LatestSlot
+
+# format -> (file extension, OpenCV quality flag, content type)
+FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+BOUNDARY = "frame"
+
+
+@dataclass(frozen=True)
+class StreamProfile:
+    quality: int = 80
+    width: int = None  # None keeps the frame width, the height always keeps the aspect ratio
+    format: str = "jpeg"
+
+
+DEFAULT_PROFILES = {"full": StreamProfile(80), "preview": StreamProfile(60, width=640)}
+
+
+class _Channel:
+    """Newest encoded frame of one profile, plus the viewers waiting for the next one."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.viewers = 0
+        self.encoded = 0
+        self.skipped = 0
+        self._cond = threading.Condition()
+        self._data = None
+        self._sequence = 0
+        self._closed = False
+
+    def publish(self, data):
+        with self._cond:
+            self._data = data
+            self._sequence += 1
+            self.encoded += 1
+            self._cond.notify_all()
+
+    # Returns (sequence, data) once there is a frame newer than sequence, or the old pair on timeout
+    def wait(self, sequence, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._sequence != sequence or self._closed, timeout)
+            return self._sequence, self._data
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class StreamServer:
+    """HTTP output stage for processed frames; also a sink with write() and close()."""
+
+    def __init__(self, port=8080, host="127.0.0.1", profiles=None, workers=2, max_profiles=8):
+        self.max_profiles = max_profiles
+        self.received = 0
+        self._channels = {name: _Channel(profile) for name, profile in (profiles or DEFAULT_PROFILES).items()}
+        self._lock = threading.Lock()
+        self._pending = LatestSlot()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stream-encode")
+        self._encoder = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # A client that stops reading is dropped once a write has been stuck this long
+            timeout = 10
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if url.path == "/profiles":
+                    profiles = {name: asdict(channel.profile) for name, channel in server._channels.items()}
+                    self._send(200, "application/json", json.dumps(profiles).encode())
+                    return
+                if parts[0] not in ("stream", "frame") or len(parts) > 2:
+                    self.send_error(404)
+                    return
+                try:
+                    channel = server.channel(parts[1] if len(parts) == 2 else None, parse_qs(url.query))
+                except KeyError:
+                    self.send_error(404, "unknown profile")
+                    return
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                if parts[0] == "frame":
+                    self._send_frame(channel)
+                else:
+                    self._stream(channel)
+
+            def _send(self, status, content_type, data):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_frame(self, channel):
+                with server.watching(channel):
+                    _, data = channel.wait(0, timeout=2.0)
+                if data is None:
+                    self.send_error(503, "no frame yet")
+                    return
+                self._send(200, FORMATS[channel.profile.format][2], data)
+
+            def _stream(self, channel):
+                content_type = FORMATS[channel.profile.format][2]
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                sequence = 0
+                with server.watching(channel):
+                    while not channel.closed:
+                        latest, data = channel.wait(sequence, timeout=1.0)
+                        if latest == sequence or data is None:
+                            continue
+                        if sequence:
+                            channel.skipped += latest - sequence - 1
+                        sequence = latest
+                        try:
+                            self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: {content_type}\r\n"
+                                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data + b"\r\n")
+                            self.wfile.flush()
+                        except OSError:
+                            break
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._httpd.server_address[1]
+        self._thread = None
+
+    # Named profile, or an ad-hoc one from ?quality=&width=&format= (created on first use)
+    def channel(self, name=None, query=None):
+        if name is not None:
+            return self._channels[name]
+        query = query or {}
+        try:
+            profile = StreamProfile(int(query.get("quality", ["80"])[0]),
+                                    int(query["width"][0]) if "width" in query else None,
+                                    query.get("format", ["jpeg"])[0])
+        except ValueError:
+            raise ValueError("quality and width must be integers")
+        if profile.format not in FORMATS or not 1 <= profile.quality <= 100 or (profile.width or 1) <= 0:
+            raise ValueError(f"invalid stream profile: {profile}")
+
+        key = f"{profile.format}-q{profile.quality}-w{profile.width or 'full'}"
+        with self._lock:
+            if key not in self._channels:
+                if len(self._channels) >= self.max_profiles:
+                    raise ValueError("too many stream profiles")
+                self._channels[key] = _Channel(profile)
+            return self._channels[key]
+
+    def watching(self, channel):
+        return _Watching(self, channel)
+
+    def start(self):
+        self._encoder = threading.Thread(target=self._encode_loop, name="stream-encoder", daemon=True)
+        self._encoder.start()
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stream-server", daemon=True)
+        self._thread.start()
+        return self
+
+    # Called from the render stage; never waits on encoding or on clients
+    def write(self, frame):
+        self.received += 1
+        if any(channel.viewers for channel in self._channels.values()):
+            self._pending.put(frame.copy())
+        return True
+
+    def _encode_loop(self):
+        while not self._pending.closed:
+            frame = self._pending.get(timeout=0.5)
+            if frame is None:
+                continue
+            with self._lock:
+                channels = [channel for channel in self._channels.values() if channel.viewers]
+            encodes = [(channel, self._pool.submit(encode_frame, frame, channel.profile)) for channel in channels]
+            for channel, encode in encodes:
+                try:
+                    channel.publish(encode.result())
+                except Exception as e:
+                    print(f"Failed to encode stream frame: {e}")
+
+    # Per-profile numbers are keyed by profile name, which becomes a metric label (see metrics.py)
+    def stats(self):
+        with self._lock:
+            channels = list(self._channels.items())
+        return {
+            "received": self.received,
+            "skipped": self._pending.dropped,
+            "profile": {name: {"viewers": channel.viewers, "encoded": channel.encoded,
+                               "viewer_skipped": channel.skipped} for name, channel in channels},
+        }
+
+    def close(self):
+        self._pending.close()
+        for channel in list(self._channels.values()):
+            channel.close()
+        if self._thread is not None:
+            self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._encoder is not None:
+            self._encoder.join(timeout=1.0)
+        self._pool.shutdown(wait=False)
+
+
+class _Watching:
+    def __init__(self, server, channel):
+        self.server = server
+        self.channel = channel
+
+    def __enter__(self):
+        with self.server._lock:
+            self.channel.viewers += 1
+
+    def __exit__(self, *exc):
+        with self.server._lock:
+            self.channel.viewers -= 1
+
+
+# Encodes one frame for a profile, downscaling first if the profile asks for a smaller width
+def encode_frame(frame, profile):
+    height, width = frame.shape[:2]
+    if profile.width and profile.width < width:
+        size = (profile.width, max(1, round(height * profile.width / width)))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    extension, quality_flag, _ = FORMATS[profile.format]
+    ok, encoded = cv2.imencode(extension, frame, (quality_flag, profile.quality))
+    if not ok:
+        raise ValueError(f"could not encode frame as {profile.format}")
+    return encoded.tobytes()
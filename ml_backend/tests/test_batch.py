@@ -0,0 +1,56 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from ml_backend.batch import DEFAULT_MODEL_PATH, _init_worker, plan_work_units, process_unit
+
+
+def write_video(path, frames=12, size=(64, 48)):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, size)
+    for index in range(frames):
+        writer.write(np.full((size[1], size[0], 3), index * 10, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+def test_plan_splits_long_videos(tmp_path):
+    """Videos longer than chunk_frames should be split into frame ranges."""
+    video = write_video(tmp_path / "clip.avi", frames=12)
+
+    units = plan_work_units([video], chunk_frames=5)
+
+    assert [(unit.start_frame, unit.end_frame) for unit in units] == [(0, 5), (5, 10), (10, 12)]
+    assert len({unit.name for unit in units}) == 3, "Unit names should be unique"
+
+
+def test_plan_chunks_image_directories(tmp_path):
+    """Image directories should be chunked and ignore non-image files."""
+    for index in range(5):
+        cv2.imwrite(str(tmp_path / f"{index}.png"), np.zeros((8, 8, 3), dtype=np.uint8))
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    units = plan_work_units([str(tmp_path)], images_per_unit=2)
+
+    assert [len(unit.images) for unit in units] == [2, 2, 1]
+    assert all(unit.kind == "images" for unit in units)
+
+
+def test_plan_rejects_unknown_inputs(tmp_path):
+    """Unsupported files should fail planning instead of being skipped silently."""
+    with pytest.raises(ValueError):
+        plan_work_units([str(tmp_path / "notes.txt")])
+
+
+def test_process_unit_writes_results(tmp_path):
+    """A worker should process its frame range and write one .npz file."""
+    video = write_video(tmp_path / "clip.avi", frames=6)
+    unit = plan_work_units([video], chunk_frames=4)[1]
+
+    _init_worker(DEFAULT_MODEL_PATH, num_faces=1)
+    summary = process_unit(unit, str(tmp_path))
+
+    assert summary["frames"] == 2
+    assert os.path.exists(summary["output"])
+    with np.load(summary["output"]) as results:
+        assert results["frame_index"].tolist() == [4, 5]
+        assert results["landmarks"].shape[1:] == (478, 3)
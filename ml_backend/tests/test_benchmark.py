@@ -0,0 +1,107 @@
+import json
+import threading
+import cv2
+import numpy as np
+from ml_backend.benchmark import (FakeLandmarker, PacedCapture, StageTimer, SyntheticCapture, compare_reports, main,
+                                  run_benchmark)
+
+
+def test_stage_timer_percentiles():
+    """Summaries should be reported in milliseconds per stage."""
+    timer = StageTimer()
+    for value in range(1, 101):
+        timer.record("inference", value / 1000.0)
+
+    summary = timer.summary()["inference"]
+
+    assert summary["count"] == 100
+    assert np.isclose(summary["p50_ms"], 50.5)
+    assert 95 <= summary["p95_ms"] <= 96 and 99 <= summary["p99_ms"] <= 100
+
+
+def test_synthetic_capture_fills_given_buffer():
+    """Synthetic frames should be written into the caller's array and keep moving."""
+    cap = SyntheticCapture(frames=2, width=64, height=48)
+    buffer = np.empty((48, 64, 3), dtype=np.uint8)
+
+    ret, first = cap.read(image=buffer)
+    first = first.copy()
+    ret2, second = cap.read()
+
+    assert ret and ret2 and not np.array_equal(first, second)
+    assert not cap.isOpened()
+
+
+def test_compare_reports_flags_regressions():
+    """Slower stages and lower throughput beyond the tolerance are regressions."""
+    baseline = {"throughput_fps": 30.0, "stages": {"inference": {"p95_ms": 10.0}, "callback": {"p95_ms": 0.01}}}
+    report = {"throughput_fps": 29.0, "stages": {"inference": {"p95_ms": 12.0}, "callback": {"p95_ms": 0.05}}}
+
+    regressions = compare_reports(report, baseline, tolerance=0.1)
+
+    assert len(regressions) == 1 and regressions[0].startswith("inference")
+    assert compare_reports(report, baseline, tolerance=0.25) == []
+
+
+def test_compare_reports_flags_slower_startup():
+    """Startup phases regress like stages, with a floor for tiny differences."""
+    baseline = {"startup": {"import_s": 0.2, "first_frame_s": 1.0}}
+    report = {"startup": {"import_s": 0.22, "first_frame_s": 1.5}}
+
+    regressions = compare_reports(report, baseline, tolerance=0.1)
+
+    assert len(regressions) == 1 and "first_frame_s" in regressions[0]
+
+
+def test_benchmark_runs_headless_with_fake_landmarker(tmp_path):
+    """A short synthetic run should report every pipeline stage and compare against itself."""
+    report = run_benchmark(PacedCapture(SyntheticCapture(frames=30, width=160, height=120), fps=0), fake_delay_ms=1)
+
+    assert report["pipeline"]["captured"] == 30
+    assert report["throughput_fps"] > 0
+    for stage in ("capture", "convert", "inference", "overlay", "display", "render"):
+        assert report["stages"][stage]["count"] > 0, f"{stage} should have samples"
+
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(report))
+    assert main(["--frames", "20", "--size", "160x120", "--fps", "0", "--fake-delay-ms", "1",
+                 "--baseline", str(baseline), "--tolerance", "100"]) == 0
+
+
+def test_benchmark_of_a_video_file_ends_with_the_file(tmp_path):
+    """A video capture stays open after its last frame, the run should still end there."""
+    video = str(tmp_path / "clip.mp4")
+    cap = SyntheticCapture(frames=10, width=160, height=120)
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"mp4v"), 30.0, (160, 120))
+    while cap.isOpened():
+        writer.write(cap.read()[1])
+    writer.release()
+
+    output = tmp_path / "run.json"
+    runner = threading.Thread(target=main, args=(["--video", video, "--fps", "0", "--fake-delay-ms", "1",
+                                                  "-o", str(output)],), daemon=True)
+    runner.start()
+    runner.join(timeout=30.0)
+
+    assert not runner.is_alive(), "The benchmark should stop at the end of the video"
+    assert json.loads(output.read_text())["pipeline"]["captured"] == 10
+
+
+def test_fake_landmarker_answers_with_canned_result():
+    """The fake should call back with the same canned landmarks for every frame."""
+    from types import SimpleNamespace
+    results = []
+    options = SimpleNamespace(result_callback=lambda result, image, timestamp_ms: results.append((result, timestamp_ms)))
+
+    with FakeLandmarker(options, delay_ms=0) as landmarker:
+        landmarker.detect_async("image", 7)
+        for _ in range(100):
+            if results:
+                break
+            import time
+            time.sleep(0.01)
+
+    result, timestamp_ms = results[0]
+    assert timestamp_ms == 7
+    assert result.face_landmarks[0].shape == (478, 3)
+    assert len(result.face_blendshapes[0]) == 52
@@ -0,0 +1,51 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+from ml_backend.blendshape_plot import BlendshapePlot, BlendshapeSparklines
+from ml_backend.blendshape_store import BlendshapeStore
+
+TRACKED = ["mouthSmileLeft", "eyeBlinkRight"]
+
+
+def make_store(rows=30):
+    store = BlendshapeStore(capacity=50)
+    for step in range(rows):
+        scores = np.zeros(52, dtype=np.float32)
+        scores[store.columns["mouthSmileLeft"]] = step / rows
+        store.append(step, step % 2, scores)
+    return store
+
+
+def test_plot_reuses_line_artists():
+    """Refreshing should update the same line artists instead of replotting."""
+    store = make_store()
+    plot = BlendshapePlot(store, TRACKED, window=20)
+    lines = list(plot.lines)
+
+    assert plot.refresh(force=True)
+    assert plot.refresh(force=True)
+
+    assert plot.lines == lines and len(plot.ax.lines) == len(TRACKED)
+    y_data = plot.lines[0].get_ydata()
+    assert np.isnan(y_data[:10]).all(), "Only face 0 rows of the window should be plotted"
+    assert np.allclose(y_data[10:], [step / 30 for step in range(10, 30, 2)])
+
+
+def test_plot_refresh_is_throttled():
+    """refresh() should skip updates inside the refresh interval."""
+    plot = BlendshapePlot(make_store(), TRACKED, interval=60.0)
+
+    assert plot.refresh()
+    assert not plot.refresh()
+
+
+def test_sparklines_draw_into_frame():
+    """Sparklines should draw inside their box and leave the rest of the frame alone."""
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    sparklines = BlendshapeSparklines(make_store(), TRACKED, window=20, origin=(10, 10), size=(100, 50))
+
+    sparklines.draw(frame)
+
+    assert frame[10:61, 10:111].any()
+    assert not frame[100:, :].any()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from ml_backend.blendshape_store import BLENDSHAPE_NAMES, BlendshapeStore
+
+
+def make_result(scores_per_face, names=BLENDSHAPE_NAMES):
+    face_blendshapes = [
+        [SimpleNamespace(category_name=name, score=float(score)) for name, score in zip(names, scores)]
+        for scores in scores_per_face
+    ]
+    matrices = [np.eye(4, dtype=np.float32) * (index + 1) for index in range(len(scores_per_face))]
+    return SimpleNamespace(face_blendshapes=face_blendshapes, facial_transformation_matrixes=matrices)
+
+
+def test_store_has_model_columns():
+    """The store should have one column per model blendshape."""
+    store = BlendshapeStore(capacity=4)
+    assert len(store.names) == 52
+    assert store.columns["eyeBlinkRight"] == 10
+
+
+def test_store_stays_bounded_and_ordered():
+    """Appending past capacity should keep only the newest rows, oldest first."""
+    store = BlendshapeStore(capacity=4)
+    for step in range(10):
+        store.append(step, 0, np.full(52, step / 10, dtype=np.float32))
+
+    window = store.window()
+    assert len(store) == 4 and store.total == 10
+    assert window.timestamps.tolist() == [6, 7, 8, 9]
+    assert np.allclose(store.column("jawOpen"), [0.6, 0.7, 0.8, 0.9])
+    assert store.window(2).timestamps.tolist() == [8, 9]
+
+
+def test_window_is_a_view():
+    """Windows should share memory with the store instead of copying."""
+    store = BlendshapeStore(capacity=8)
+    for step in range(11):
+        store.append(step, 0, np.zeros(52, dtype=np.float32))
+
+    assert np.shares_memory(store.window(5).scores, store._scores)
+
+
+def test_append_result_handles_faces_and_category_order():
+    """Results should be stored per face, with categories mapped by name."""
+    store = BlendshapeStore(capacity=8)
+    scores = np.linspace(0, 1, 52, dtype=np.float32)
+    shuffled = list(reversed(BLENDSHAPE_NAMES))
+
+    store.append_result(make_result([scores[::-1], scores[::-1]], names=shuffled), timestamp_ms=42)
+
+    window = store.window()
+    assert window.faces.tolist() == [0, 1]
+    assert window.timestamps.tolist() == [42, 42]
+    assert np.allclose(window.scores[0], scores)
+    assert np.allclose(window.matrices[1], np.eye(4) * 2)
+
+
+def test_to_dataframe_export():
+    """DataFrame export should include timestamp and face index columns."""
+    store = BlendshapeStore(capacity=4)
+    store.append(7, 1, np.ones(52, dtype=np.float32))
+
+    data = store.to_dataframe()
+    assert data.loc[0, "timestamp_ms"] == 7
+    assert data.loc[0, "face_index"] == 1
+    assert data.loc[0, "mouthSmileLeft"] == pytest.approx(1.0)
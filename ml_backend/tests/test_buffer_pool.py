@@ -0,0 +1,48 @@
+import numpy as np
+from ml_backend.buffer_pool import BufferPool
+
+
+def test_released_buffers_are_reused():
+    """A buffer released by every owner should come back from the next acquire."""
+    pool = BufferPool()
+    first = pool.acquire((4, 4, 3))
+    pool.retain(first)
+
+    pool.release(first)
+    assert pool.stats()["in_use"] == 1, "Buffer is still retained once"
+    pool.release(first)
+
+    assert pool.acquire((4, 4, 3)) is first
+    assert pool.allocations == 1 and pool.reuses == 1
+
+
+def test_shapes_do_not_mix():
+    """Buffers are only reused for the same shape and dtype."""
+    pool = BufferPool()
+    pool.release(pool.acquire((4, 4, 3)))
+
+    other = pool.acquire((8, 8, 3))
+
+    assert other.shape == (8, 8, 3)
+    assert pool.allocations == 2
+
+
+def test_unknown_arrays_are_ignored():
+    """Releasing an array the pool never handed out does nothing."""
+    pool = BufferPool()
+    pool.release(np.zeros(3))
+    pool.release("not an array")
+
+    assert pool.stats()["free"] == 0
+
+
+def test_free_list_is_bounded():
+    """Only max_free idle buffers are kept per shape."""
+    pool = BufferPool(max_free=2)
+    buffers = [pool.acquire((2, 2)) for _ in range(4)]
+    for buffer in buffers:
+        pool.release(buffer)
+
+    stats = pool.stats()
+    assert stats["free"] == 2
+    assert stats["in_use"] == 0
@@ -0,0 +1,110 @@
+import json
+from ml_backend.commands import Command, CommandQueue, UserRegistry, fold_commands, parse_command, parse_commands
+
+
+def message(user_id, request_type, **event):
+    return json.dumps({"userId": user_id, "requestType": request_type, "event": event}).encode()
+
+
+def test_parse_lambda_messages():
+    """Payloads published by the lambda should parse into commands."""
+    command = parse_command(message("u1", "feature-change", feature="color", featureParam="red"))
+
+    assert command == Command("u1", "feature-change", {"feature": "color", "featureParam": "red"})
+    assert parse_command(b'{"color": "blue"}').event == {"feature": "color", "featureParam": "blue"}
+    assert parse_command(message("u1", "unknown")) is None
+
+
+def test_fold_keeps_latest_feature_change():
+    """Repeated changes of one user's feature collapse into the latest value."""
+    commands = [
+        Command("u1", "feature-change", {"feature": "color", "featureParam": "red"}),
+        Command("u2", "feature-change", {"feature": "color", "featureParam": "red"}),
+        Command("u1", "upload-image", {"imageUrl": "a"}),
+        Command("u1", "feature-change", {"feature": "color", "featureParam": "blue"}),
+    ]
+
+    folded = fold_commands(commands)
+
+    assert folded == commands[1:]
+
+
+def test_fold_keeps_face_local_changes_apart():
+    """Changes without a user but with a trackId belong to that face and fold per face."""
+    commands = [
+        Command(None, "feature-change", {"feature": "mask", "featureParam": "tiger", "trackId": 1}),
+        Command(None, "feature-change", {"feature": "mask", "featureParam": "fox", "trackId": 2}),
+        Command(None, "feature-change", {"feature": "mask", "featureParam": "owl", "trackId": 1}),
+    ]
+
+    assert fold_commands(commands) == commands[1:]
+
+
+def test_queue_drains_in_one_batch():
+    """Drain returns everything queued so far and skips malformed payloads."""
+    queue = CommandQueue()
+    for color in ("red", "green", "blue"):
+        queue.on_message("user-requests", message("u1", "feature-change", feature="color", featureParam=color))
+    queue.push(b"not json")
+    queue.push(message("u1", "get-user-data"))
+
+    drained = queue.drain()
+
+    assert [command.request_type for command in drained] == ["feature-change", "get-user-data"]
+    assert drained[0].event["featureParam"] == "blue"
+    assert queue.malformed == 1
+    assert len(queue) == 0 and queue.drain() == []
+
+
+def test_batch_messages_unpack_into_commands():
+    """A batch from POST /v1/batch yields every command, and bad entries count as malformed."""
+    batch = json.dumps({"requestType": "batch", "commands": [
+        json.loads(message("u1", "feature-change", feature="color", featureParam="red")),
+        {"requestType": "nonsense"},
+        json.loads(message("u2", "get-user-data")),
+    ]})
+    assert [command and command.user_id for command in parse_commands(batch)] == ["u1", None, "u2"]
+    assert parse_commands(message("u1", "get-user-data")) == [Command("u1", "get-user-data", {})]
+
+    queue = CommandQueue()
+    queue.push(batch)
+    queue.push(message("u1", "feature-change", feature="color", featureParam="blue"))
+    commands = queue.drain()
+
+    assert [(command.user_id, command.event.get("featureParam")) for command in commands] == [
+        ("u2", None), ("u1", "blue")]
+    assert queue.malformed == 1
+
+
+def test_drain_skips_commands_with_unhashable_fields():
+    """Lists or objects where a user, feature or trackId belongs are malformed, not a crash."""
+    queue = CommandQueue()
+    for bad in ({"userId": ["u1"], "event": {"feature": "color"}},
+                {"userId": "u1", "event": {"feature": {"name": "color"}}},
+                {"userId": None, "event": {"feature": "mask", "trackId": [1]}}):
+        queue.push(json.dumps(dict(bad, requestType="feature-change")))
+    queue.push(message("u1", "feature-change", feature="color", featureParam="red"))
+
+    assert [command.user_id for command in queue.drain()] == ["u1"]
+    assert queue.malformed == 3
+
+
+def test_queue_is_bounded():
+    """A full queue drops its oldest messages."""
+    queue = CommandQueue(max_messages=2)
+    for index in range(5):
+        queue.push(message(f"u{index}", "get-user-data"))
+
+    assert queue.dropped == 3
+    assert [command.user_id for command in queue.drain()] == ["u3", "u4"]
+
+
+def test_registry_tracks_user_state():
+    """Applying commands updates the typed per-user state."""
+    registry = UserRegistry()
+    registry.apply(Command("u1", "feature-change", {"feature": "color", "featureParam": "red"}))
+    state = registry.apply(Command("u1", "upload-image", {"imageUrl": "https://example/img.jpg"}))
+
+    assert state.features == {"color": "red"}
+    assert state.image_url == "https://example/img.jpg"
+    assert state.commands == 2
@@ -0,0 +1,96 @@
+import json
+import numpy as np
+import pytest
+from ml_backend.blendshape_store import BLENDSHAPE_NAMES
+from ml_backend.expressions import DEFAULT_RULES, ExpressionEngine, ExpressionRule, load_rules, parse_rules
+
+SMILE = ExpressionRule("smile", ("mouthSmileLeft", "mouthSmileRight"), on=0.6, off=0.3, hold=2, alpha=1.0,
+                       feature="mask", feature_params=("tiger", "fox"))
+BLINK = ExpressionRule("blink", ("eyeBlinkLeft", "eyeBlinkRight"), combine="min", on=0.5, off=0.2, hold=1, alpha=1.0)
+
+
+def scores(*faces):
+    """(F, 52) scores with the given {blendshape: score} per face, everything else 0."""
+    array = np.zeros((len(faces), len(BLENDSHAPE_NAMES)), dtype=np.float32)
+    for row, values in enumerate(faces):
+        for name, value in values.items():
+            array[row, BLENDSHAPE_NAMES.index(name)] = value
+    return array
+
+
+def smile(value):
+    return {"mouthSmileLeft": value, "mouthSmileRight": value}
+
+
+def test_expression_starts_after_hold_and_ends_below_off():
+    """An expression needs `hold` frames above `on` to start and a drop to `off` to end."""
+    engine = ExpressionEngine([SMILE])
+
+    assert engine.update([1], scores(smile(0.8))) == []
+    (started,) = engine.update([1], scores(smile(0.8)))
+    assert (started.track_id, started.expression, started.phase) == (1, "smile", "start")
+    assert engine.active(1) == ["smile"]
+
+    assert engine.update([1], scores(smile(0.4))) == [], "Between off and on the expression holds"
+    (ended,) = engine.update([1], scores(smile(0.2)))
+    assert ended.phase == "end" and engine.active(1) == []
+
+
+def test_faces_and_rules_are_independent():
+    """Every (face, rule) pair keeps its own state, keyed by track ID not position."""
+    engine = ExpressionEngine([SMILE, BLINK])
+    blink = {"eyeBlinkLeft": 0.9, "eyeBlinkRight": 0.9}
+
+    events = engine.update([7, 9], scores(blink, smile(0.9)))
+    assert [(event.track_id, event.expression) for event in events] == [(7, "blink")]
+
+    # Faces swap positions in the result, the smile streak still belongs to track 9
+    events = engine.update([9, 7], scores(smile(0.9), {}))
+    assert [(event.track_id, event.expression, event.phase) for event in events] == [
+        (9, "smile", "start"), (7, "blink", "end")]
+
+
+def test_min_combine_needs_both_eyes():
+    """A min rule only fires when every listed blendshape is high."""
+    engine = ExpressionEngine([BLINK])
+
+    assert engine.update([1], scores({"eyeBlinkLeft": 0.9, "eyeBlinkRight": 0.1})) == []
+    assert len(engine.update([1], scores({"eyeBlinkLeft": 0.9, "eyeBlinkRight": 0.9}))) == 1
+
+
+def test_ema_smooths_out_single_frame_spikes():
+    """With a small alpha, one high frame does not reach the threshold."""
+    rule = ExpressionRule("jaw", ("jawOpen",), on=0.5, off=0.2, hold=1, alpha=0.3)
+    engine = ExpressionEngine([rule])
+
+    engine.update([1], scores({}))
+    assert engine.update([1], scores({"jawOpen": 1.0})) == []
+    assert engine.update([1], scores({"jawOpen": 1.0})) != []
+
+
+def test_start_events_cycle_feature_params_and_rows_are_reused():
+    """Start events turn into feature changes cycling through the params; stale tracks free their rows."""
+    engine = ExpressionEngine([SMILE], max_missing=1)
+    changes = []
+    for track_id in (1, 2):
+        for _ in range(SMILE.hold):
+            for event in engine.update([track_id], scores(smile(0.9))):
+                changes.append(engine.feature_change(event))
+
+    assert changes == [{"feature": "mask", "featureParam": "tiger"}, {"feature": "mask", "featureParam": "fox"}]
+    assert engine.stats()["faces"] == 1, "Track 1 was not seen for longer than max_missing"
+
+
+def test_rules_are_parsed_and_validated(tmp_path):
+    """JSON rules become ExpressionRules; unknown blendshapes or bad thresholds are rejected."""
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"wink": {"blendshapes": ["eyeBlinkLeft"], "on": 0.7, "off": 0.3,
+                                         "feature": "color", "featureParam": "red"}}))
+
+    (wink,) = load_rules(str(path))
+    assert wink.feature_params == ("red",) and wink.combine == "mean"
+    assert load_rules("default") == list(DEFAULT_RULES)
+    with pytest.raises(ValueError):
+        parse_rules({"typo": {"blendshapes": ["eyeBlinkLefft"]}})
+    with pytest.raises(ValueError):
+        parse_rules({"backwards": {"blendshapes": ["jawOpen"], "on": 0.2, "off": 0.5}})
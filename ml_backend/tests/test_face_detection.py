@@ -55,4 +55,47 @@ def test_run_face_landmark_detection(mock_destroy, mock_waitKey, mock_imshow, mo
         run_face_landmark_detection(cap, options)
 
     assert mock_landmarker_instance.detect_async.called, "Face detection should be called"
-    assert mock_cap.read.called, "Camera read should be called"
\ No newline at end of file
+    assert mock_cap.read.called, "Camera read should be called"
+
+def test_import_leaves_heavy_dependencies_unloaded():
+    """Importing the module must not pull in mediapipe, AWS IoT or matplotlib."""
+    import sys
+    import subprocess
+
+    code = ("import sys, ml_backend.face_detection; "
+            "print(sorted(m for m in ('mediapipe', 'awscrt', 'awsiot', 'matplotlib', 'pandas') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_mediapipe_names_resolve_on_first_use():
+    """The old module-level MediaPipe aliases still work, loaded on access."""
+    from ml_backend import face_detection
+    from mediapipe.tasks.python import vision
+
+    assert face_detection.FaceLandmarker is vision.FaceLandmarker
+    assert face_detection.VisionRunningMode is vision.RunningMode
+
+
+def test_expression_changes_keep_face_ownership():
+    """A claimed face changes its user without pinning; an unclaimed one stays free for the next user."""
+    from ml_backend import face_detection
+    from ml_backend.expressions import ExpressionEngine, ExpressionEvent, ExpressionRule
+    from ml_backend.identity import IdentityTracker
+    from ml_backend.tests.test_identity import face_at
+
+    identities = IdentityTracker()
+    claimed, unclaimed = identities.update([face_at(0.3, 0.5), face_at(0.7, 0.5)])
+    identities.assign_user("alice")
+    engine = ExpressionEngine([ExpressionRule("smile", ("mouthSmileLeft",), feature="mask",
+                                              feature_params=("tiger",))])
+    known_users = set(face_detection.users.users)
+
+    events = [ExpressionEvent(track.track_id, "smile", "start", 0.9) for track in (claimed, unclaimed)]
+    face_detection.queue_expression_commands(engine, events, [claimed, unclaimed])
+    face_detection.apply_commands(identities=identities)
+
+    assert claimed.user_id == "alice" and not claimed.pinned
+    assert unclaimed.user_id is None, "An expression must not claim a face for a made-up user"
+    assert set(face_detection.users.users) - known_users == {"alice"}
+    assert identities.assign_user("bob") is unclaimed
@@ -0,0 +1,120 @@
+import numpy as np
+from ml_backend.identity import IdentityTracker, box_iou, face_boxes, landmark_distance
+
+
+def face_at(x, y, size=0.2, points=478):
+    """Synthetic face: a fixed landmark pattern scaled into a box centred on (x, y)."""
+    pattern = np.random.default_rng(0).random((points, 3)).astype(np.float32)
+    face = pattern.copy()
+    face[:, 0] = x - size / 2 + pattern[:, 0] * size
+    face[:, 1] = y - size / 2 + pattern[:, 1] * size
+    return face
+
+
+def test_box_iou_and_distance_are_pairwise():
+    """IoU and landmark distance come back as (tracks, faces) matrices."""
+    faces = np.stack([face_at(0.3, 0.5), face_at(0.7, 0.5)])
+    boxes = face_boxes(faces)
+
+    iou = box_iou(boxes, boxes[::-1])
+    distance = landmark_distance(faces, faces[::-1], boxes)
+
+    assert iou.shape == distance.shape == (2, 2)
+    assert np.allclose(np.diag(iou[:, ::-1]), 1.0) and iou[0, 0] == 0.0
+    assert np.allclose(np.diag(distance[:, ::-1]), 0.0) and distance[0, 0] > 1.0
+
+
+def test_track_ids_follow_faces_when_result_order_flips():
+    """Swapping the order of faces in the result keeps each person's track ID."""
+    tracker = IdentityTracker()
+    left, right = face_at(0.3, 0.5), face_at(0.7, 0.5)
+    first = tracker.update([left, right])
+
+    moved_left, moved_right = face_at(0.32, 0.5), face_at(0.68, 0.52)
+    second = tracker.update([moved_right, moved_left])
+
+    assert [track.track_id for track in second] == [first[1].track_id, first[0].track_id]
+    assert tracker.stats()["created"] == 2
+
+
+def test_far_jump_starts_a_new_track_and_old_ones_expire():
+    """A face outside both gates is a new person; unmatched tracks are dropped after max_misses."""
+    tracker = IdentityTracker(max_misses=1)
+    (first,) = tracker.update([face_at(0.2, 0.2)])
+    (second,) = tracker.update([face_at(0.8, 0.8)])
+    assert second.track_id != first.track_id
+
+    tracker.update([face_at(0.8, 0.8)])
+    assert [track.track_id for track in tracker.tracks] == [second.track_id]
+    assert tracker.stats()["lost"] == 1
+
+
+def test_users_stay_with_their_face_and_wait_when_it_is_lost():
+    """A user goes to the oldest free face, follows it, and takes the next new face once it is lost."""
+    tracker = IdentityTracker(max_misses=0)
+    left, right = tracker.update([face_at(0.3, 0.5), face_at(0.7, 0.5)])
+
+    assert tracker.assign_user("alice") is left
+    assert tracker.assign_user("bob") is right
+    flipped = tracker.update([face_at(0.7, 0.5), face_at(0.3, 0.5)])
+    assert [track.user_id for track in flipped] == ["bob", "alice"]
+
+    tracker.update([face_at(0.7, 0.5)])
+    assert tracker.track_of("alice") is None and tracker.stats()["waiting_users"] == 1
+    newcomer, _ = tracker.update([face_at(0.2, 0.2), face_at(0.7, 0.5)])
+    assert newcomer.user_id == "alice"
+
+
+def test_assign_user_to_explicit_track_moves_the_previous_user():
+    """Assigning to a taken track hands it over; the previous user waits for a free face."""
+    tracker = IdentityTracker()
+    only, = tracker.update([face_at(0.5, 0.5)])
+    tracker.assign_user("alice")
+
+    assert tracker.assign_user("bob", track_id=only.track_id) is only
+    assert only.user_id == "bob" and tracker.stats()["waiting_users"] == 1
+
+
+def test_pinned_user_leaves_with_their_face():
+    """A user assigned to an explicit track is not moved to the next face once it is lost."""
+    tracker = IdentityTracker(max_misses=0)
+    only, = tracker.update([face_at(0.5, 0.5)])
+    tracker.assign_user("face-1", track_id=only.track_id)
+
+    tracker.update([])
+    newcomer, = tracker.update([face_at(0.2, 0.2)])
+
+    assert newcomer.user_id is None and tracker.stats()["waiting_users"] == 0
+
+
+def test_taking_a_pinned_face_sends_its_user_to_wait():
+    """A pinned user displaced by another explicit assignment is not lost."""
+    tracker = IdentityTracker()
+    only, = tracker.update([face_at(0.5, 0.5)])
+    tracker.assign_user("alice", track_id=only.track_id)
+
+    assert tracker.assign_user("bob", track_id=only.track_id) is only
+    assert tracker.stats()["waiting_users"] == 1
+
+    newcomer, _ = tracker.update([face_at(0.2, 0.2), face_at(0.5, 0.5)])
+    assert newcomer.user_id == "alice" and not newcomer.pinned
+
+
+def test_assigning_to_an_unknown_track_keeps_the_current_face():
+    """An explicit track that does not exist leaves the user on their face."""
+    tracker = IdentityTracker()
+    only, = tracker.update([face_at(0.5, 0.5)])
+    tracker.assign_user("alice")
+
+    assert tracker.assign_user("alice", track_id=99) is only
+    assert tracker.track_of("alice") is only and tracker.stats()["waiting_users"] == 0
+
+
+def test_smoothing_blends_landmarks_of_the_same_face():
+    """With smoothing, a track's landmarks move part of the way towards the new detection."""
+    tracker = IdentityTracker(smoothing=0.5)
+    start, moved = face_at(0.5, 0.5), face_at(0.52, 0.5)
+    tracker.update([start])
+    (track,) = tracker.update([moved])
+
+    assert np.allclose(track.landmarks, (start + moved) / 2)
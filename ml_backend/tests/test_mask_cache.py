@@ -0,0 +1,102 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from ml_backend.mask_cache import LocalMaskSource, MaskCache
+
+
+def write_mask(root, name, value, size=32):
+    directory = os.path.join(root, "masks")
+    os.makedirs(directory, exist_ok=True)
+    image = np.full((size, size, 3), value, dtype=np.uint8)
+    cv2.imwrite(os.path.join(directory, name), image)
+
+
+@pytest.fixture
+def source(tmp_path):
+    root = str(tmp_path / "bucket")
+    write_mask(root, "red.png", (0, 0, 255))
+    write_mask(root, "blue.png", (255, 0, 0))
+    return LocalMaskSource(root)
+
+
+def test_get_returns_prepared_mask(source, tmp_path):
+    """A cache miss should download, decode and resize the mask to the UV layout."""
+    cache = MaskCache(source, str(tmp_path / "cache"), mask_size=64)
+
+    mask = cache.get("masks/red.png")
+
+    assert mask.image.shape == (64, 64, 4)
+    assert tuple(mask.image[10, 10]) == (0, 0, 255, 255)
+    assert cache.get("masks/red.png") is mask, "Second lookup should hit the memory tier"
+
+
+def test_disk_tier_survives_restart_and_tracks_etag(source, tmp_path):
+    """Cached files should be reused across instances and refreshed when the ETag changes."""
+    cache_dir = str(tmp_path / "cache")
+    first = MaskCache(source, cache_dir)
+    red = {mask.key: mask for mask in first.refresh_listing()}["masks/red.png"]
+    path = first.fetch(red)
+
+    second = MaskCache(source, cache_dir)
+    assert second.fetch(red) == path
+
+    write_mask(source.root, "red.png", (0, 255, 0))
+    updated = {mask.key: mask for mask in second.refresh_listing()}["masks/red.png"]
+    assert updated.etag != red.etag
+    assert tuple(second.get("masks/red.png").image[0, 0]) == (0, 255, 0, 255)
+    assert not os.path.exists(path), "Stale file should be removed"
+
+
+def test_disk_tier_evicts_least_recently_used(source, tmp_path):
+    """The disk tier should stay under its size bound."""
+    masks = {mask.key: mask for mask in source.list_masks()}
+    cache = MaskCache(source, str(tmp_path / "cache"), max_disk_bytes=max(mask.size for mask in masks.values()))
+
+    cache.fetch(masks["masks/red.png"])
+    cache.fetch(masks["masks/blue.png"])
+
+    assert cache.disk_usage() <= cache.max_disk_bytes
+    assert list(cache._index) == ["masks/blue.png"]
+
+
+def test_prefetch_loads_listing(source, tmp_path):
+    """Prefetching should make every mask a memory hit."""
+    cache = MaskCache(source, str(tmp_path / "cache"))
+
+    cache.prefetch(background=True).join(timeout=10)
+
+    assert cache.is_loaded("masks/red.png") and cache.is_loaded("masks/blue.png")
+
+
+def test_unknown_mask_raises(source, tmp_path):
+    """Unknown keys should raise KeyError."""
+    with pytest.raises(KeyError):
+        MaskCache(source, str(tmp_path / "cache")).get("masks/missing.png")
+
+
+def test_find_accepts_gallery_names(source, tmp_path):
+    """Masks can be looked up by key, file name or file name without extension."""
+    cache = MaskCache(source, str(tmp_path / "cache"))
+
+    assert cache.find("red") == cache.find("red.png") == cache.find("masks/red.png") == "masks/red.png"
+    with pytest.raises(KeyError):
+        cache.find("green")
+
+
+def test_ingested_assets_are_preferred(source, tmp_path):
+    """The pre-sized RGBA asset and alignment sidecar replace decoding the original."""
+    etag = {mask.key: mask.etag for mask in source.list_masks()}["masks/red.png"]
+    derived = os.path.join(source.root, "masks", "derived", "red.png", etag)
+    os.makedirs(derived)
+    cv2.imwrite(os.path.join(derived, "rgba-256.png"), np.full((256, 256, 4), (0, 255, 0, 128), dtype=np.uint8))
+    np.save(os.path.join(derived, "alignment.npy"), np.array([[0.5, 0, 0.25], [0, 0.5, 0.25]], dtype=np.float32))
+    cache = MaskCache(source, str(tmp_path / "cache"), mask_size=128)
+
+    mask = cache.get("masks/red.png")
+    assert mask.image.shape == (128, 128, 4)
+    assert tuple(mask.image[10, 10]) == (0, 255, 0, 128)
+    assert mask.uv.min() >= 0.25 and mask.uv.max() <= 0.75
+    assert [m.key for m in source.list_masks()] == ["masks/blue.png", "masks/red.png"]
+
+    assert cache.get("masks/blue.png").image[10, 10, 3] == 255, "Masks without assets decode the original"
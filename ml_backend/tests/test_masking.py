@@ -0,0 +1,81 @@
+import zipfile
+import cv2
+import numpy as np
+from ml_backend.masking import DEFAULT_MODEL_PATH, FaceMask, MaskRenderer, batch_triangle_affines, canonical_face_mesh
+
+
+def canonical_face(width=640, height=480, scale=12.0):
+    """Projects the canonical 3D face mesh to normalized landmarks, facing the camera."""
+    from mediapipe.modules.face_geometry.protos import geometry_pipeline_metadata_pb2
+
+    metadata = geometry_pipeline_metadata_pb2.GeometryPipelineMetadata()
+    with zipfile.ZipFile(DEFAULT_MODEL_PATH) as bundle:
+        metadata.ParseFromString(bundle.read("geometry_pipeline_metadata_landmarks.binarypb"))
+    vertices = np.array(metadata.canonical_mesh.vertex_buffer, dtype=np.float32).reshape(-1, 5)
+    x = (width / 2 + scale * vertices[:, 0]) / width
+    y = (height / 2 - scale * vertices[:, 1]) / height
+    z = -scale * vertices[:, 2] / width
+    return np.stack([x, y, z], axis=1)
+
+
+def test_canonical_mesh_is_loaded_from_model():
+    """The canonical UVs and triangles should come from the bundled model."""
+    uv, triangles = canonical_face_mesh()
+
+    assert uv.shape == (468, 2)
+    assert triangles.shape == (898, 3) and triangles.max() == 467
+    assert 0.0 <= uv.min() and uv.max() <= 1.0
+
+
+def test_batch_triangle_affines_match_opencv():
+    """Batched solves should match cv2.getAffineTransform triangle by triangle."""
+    rng = np.random.default_rng(0)
+    src = rng.uniform(0, 100, size=(20, 3, 2)).astype(np.float32)
+    dst = rng.uniform(0, 100, size=(20, 3, 2)).astype(np.float32)
+    src[0] = [[0, 0], [1, 1], [2, 2]]  # degenerate
+
+    affines, valid = batch_triangle_affines(src, dst)
+
+    assert not valid[0] and valid[1:].all()
+    for index in range(1, 20):
+        expected = cv2.getAffineTransform(src[index], dst[index])
+        assert np.allclose(affines[index], expected, atol=1e-3)
+
+
+def test_mask_renderer_covers_face_only():
+    """An opaque mask should paint the face region and leave the background alone."""
+    mask_image = np.zeros((256, 256, 4), dtype=np.uint8)
+    mask_image[...] = (0, 0, 255, 255)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    face = canonical_face()
+
+    MaskRenderer(FaceMask(mask_image)).apply(frame, [face])
+
+    nose_x, nose_y = (face[1, :2] * (640, 480)).astype(int)
+    assert tuple(frame[nose_y, nose_x]) == (0, 0, 255), "Nose should be covered by the mask"
+    assert not frame[:20].any() and not frame[:, :40].any(), "Background should be untouched"
+
+
+def test_transparent_mask_keeps_frame():
+    """Fully transparent mask pixels should keep the original frame."""
+    frame = np.full((480, 640, 3), 80, dtype=np.uint8)
+
+    MaskRenderer(FaceMask(np.zeros((64, 64, 4), dtype=np.uint8))).apply(frame, [canonical_face()])
+
+    assert (frame == 80).all()
+
+
+def test_mask_renderer_uses_per_face_masks():
+    """Each face gets its own mask, faces without one fall back to the renderer's mask."""
+    red = FaceMask(np.full((64, 64, 4), (0, 0, 255, 255), dtype=np.uint8))
+    blue = FaceMask(np.full((64, 64, 4), (255, 0, 0, 255), dtype=np.uint8))
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    left, right = canonical_face(scale=6.0), canonical_face(scale=6.0)
+    left[:, 0] -= 0.25
+    right[:, 0] += 0.25
+
+    MaskRenderer(red).apply(frame, [left, right], masks=[None, blue])
+
+    for face, color in ((left, (0, 0, 255)), (right, (255, 0, 0))):
+        nose_x, nose_y = (face[1, :2] * (640, 480)).astype(int)
+        assert tuple(frame[nose_y, nose_x]) == color
@@ -0,0 +1,105 @@
+import re
+import time
+import threading
+import urllib.request
+from ml_backend.metrics import Histogram, MetricsRegistry, MetricsServer, SamplingProfiler
+
+# One sample line of the Prometheus text format: name, optional labels, value
+SAMPLE = re.compile(r'[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*"'
+                    r'(?:,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*")*\})? \S+')
+
+
+# Samples of a rendered exposition as {name{labels}: value}, failing on any invalid line
+def parse_exposition(text):
+    samples, families = {}, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            families.append(line.split()[2])
+        elif not line.startswith("#"):
+            assert SAMPLE.fullmatch(line), f"invalid sample line: {line!r}"
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    assert len(families) == len(set(families)), "every metric family is declared once"
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    """Rendered buckets should be cumulative and end with +Inf, sum and count."""
+    histogram = Histogram("ml_test_seconds", buckets=(0.001, 0.01))
+    for value in (0.0005, 0.005, 0.005, 2.0):
+        histogram.observe(value)
+
+    lines = histogram.render()
+
+    assert lines[:3] == ['ml_test_seconds_bucket{le="0.001"} 1', 'ml_test_seconds_bucket{le="0.01"} 3',
+                         'ml_test_seconds_bucket{le="+Inf"} 4']
+    assert lines[-1] == "ml_test_seconds_count 4"
+
+
+def test_registry_renders_stages_counters_and_collectors():
+    """Stage spans, counters and collected gauges all show up in the exposition."""
+    registry = MetricsRegistry()
+    with registry.span("inference"):
+        pass
+    registry.record("render", 0.002)
+    registry.counter("frames_total", "Frames seen").inc(3)
+    registry.add_collector("pipeline", lambda: {"in_flight": 2, "label": "ignored"})
+
+    text = registry.render()
+
+    assert 'ml_stage_seconds_count{stage="inference"} 1' in text
+    assert 'ml_stage_seconds_bucket{stage="render",le="0.0025"} 1' in text
+    assert "ml_frames_total 3" in text
+    assert "ml_pipeline_in_flight 2" in text
+    assert "label" not in text
+
+
+def test_collector_names_and_labels_are_valid_prometheus():
+    """Odd collector keys are sanitized and nested entries become labelled gauges."""
+    registry = MetricsRegistry()
+    registry.add_collector("sink0", lambda: {"received": 4, "odd-key": 1,
+                                            "profile": {"jpeg-q60-w320": {"viewers": 2}, 'say "hi"': {"viewers": 1}}})
+
+    samples = parse_exposition(registry.render())
+
+    assert samples["ml_sink0_odd_key"] == 1
+    assert samples['ml_sink0_viewers{profile="jpeg-q60-w320"}'] == 2
+    assert samples['ml_sink0_viewers{profile="say \\"hi\\""}'] == 1
+
+
+def test_metrics_server_serves_prometheus_text():
+    """The endpoint should answer /metrics and the profiler start/stop paths."""
+    registry = MetricsRegistry()
+    registry.record("capture", 0.001)
+    server = MetricsServer(registry, port=0).start()
+    try:
+        base = f"http://127.0.0.1:{server.port}"
+        body = urllib.request.urlopen(f"{base}/metrics", timeout=5).read().decode()
+        assert 'ml_stage_seconds_count{stage="capture"} 1' in body
+
+        urllib.request.urlopen(f"{base}/profile/start", timeout=5).read()
+        time.sleep(0.05)
+        stacks = urllib.request.urlopen(f"{base}/profile/stop", timeout=5).read().decode()
+        assert "metrics-server" in stacks
+    finally:
+        server.stop()
+
+
+def test_sampling_profiler_sees_busy_threads():
+    """Collapsed stacks should include the function a thread is spending time in."""
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_loop, name="busy")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    time.sleep(0.1)
+    stacks = profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert any(line.startswith("busy;") and "busy_loop" in line for line in stacks.splitlines())
@@ -0,0 +1,275 @@
+import time
+import numpy as np
+from unittest.mock import patch, MagicMock
+from ml_backend.buffer_pool import BufferPool
+from ml_backend.pipeline import FramePipeline, LatestSlot, MonotonicTimestamps
+from ml_backend.rendering import LandmarkResult
+from ml_backend.roi import Roi
+
+
+class ListCapture:
+    """Capture stand-in that yields a fixed list of frames."""
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def isOpened(self):
+        return bool(self.frames)
+
+    def read(self, image=None):
+        frame = self.frames.pop(0)
+        # Like cv2.VideoCapture, fill the given array when it matches the frame
+        if isinstance(image, np.ndarray) and image.shape == frame.shape:
+            image[:] = frame
+            return True, image
+        return True, frame
+
+
+class EchoLandmarker:
+    """Landmarker stand-in that answers every frame immediately."""
+
+    def __init__(self, options):
+        self.options = options
+        self.timestamps = []
+
+    def detect_async(self, image, timestamp_ms):
+        self.timestamps.append(timestamp_ms)
+        self.options.result_callback(f"result-{image}", image, timestamp_ms)
+
+
+def test_monotonic_timestamps_never_repeat():
+    """Timestamps keep increasing even when the clock does not move."""
+    timestamps = MonotonicTimestamps()
+    with patch('time.monotonic_ns', return_value=5_000_000):
+        values = [timestamps.next() for _ in range(5)]
+
+    assert values == [5, 6, 7, 8, 9], "Timestamps should be strictly increasing"
+
+
+def test_latest_slot_drops_stale_items():
+    """Putting twice before a get keeps the newest item and counts one drop."""
+    slot = LatestSlot()
+    slot.put("old")
+    slot.put("new")
+
+    assert slot.get(timeout=0) == "new"
+    assert slot.dropped == 1
+    assert slot.get(timeout=0) is None
+
+    slot.close()
+    assert slot.closed, "Empty closed slot should report closed"
+
+
+def test_pipeline_pairs_results_with_frames():
+    """Each rendered result should come with the frame it was computed on."""
+    options = MagicMock()
+    user_callback = MagicMock()
+    options.result_callback = user_callback
+    cap = ListCapture(["f0", "f1", "f2"])
+
+    pipeline = FramePipeline(cap, convert=lambda frame: frame)
+    pipeline.bind(options)
+    landmarker = EchoLandmarker(options)
+
+    rendered = []
+    pipeline.run(landmarker, lambda frame, result, timestamp_ms: rendered.append((frame, result)))
+
+    assert rendered, "At least one frame should be rendered"
+    for frame, result in rendered:
+        assert result == f"result-{frame}", "Result should be paired with its own frame"
+    assert user_callback.called, "Original result callback should still run"
+    assert landmarker.timestamps == sorted(set(landmarker.timestamps))
+
+    stats = pipeline.stats()
+    assert stats["captured"] == 3
+    assert stats["captured"] == len(landmarker.timestamps) + stats["dropped_capture"]
+
+
+def test_pipeline_counts_skipped_inference():
+    """Frames the landmarker never answers are counted as inference drops."""
+    pipeline = FramePipeline(MagicMock(), convert=lambda frame: frame)
+    pipeline._in_flight.update({1: ("a", None), 2: ("b", None), 3: ("c", None)})
+
+    pipeline._on_result("result", 3)
+
+    assert pipeline.dropped_inference == 2
+    assert pipeline.results.get(timeout=0) == ("c", "result", 3)
+
+
+
+def test_late_roi_result_is_mapped_after_its_frame_was_dropped():
+    """A crop result whose frame max_in_flight already dropped still reaches the callback in frame coordinates."""
+    options = MagicMock()
+    received = []
+    options.result_callback = lambda result, image, timestamp_ms: received.append(result)
+    pipeline = FramePipeline(MagicMock(), convert=lambda frame: frame, max_in_flight=1)
+    pipeline.bind(options)
+    roi = Roi(100, 50, 200, 200, 640, 480)
+    pipeline._rois[4] = roi  # submitted on a crop, then evicted from the in-flight map
+
+    face = np.full((478, 3), 0.5, dtype=np.float32)
+    options.result_callback(LandmarkResult([face], [], []), None, 4)
+
+    (mapped,) = received[0].face_landmarks
+    assert np.allclose(mapped[0, :2], ((100 + 0.5 * 200) / 640, (50 + 0.5 * 200) / 480))
+    assert pipeline.results.get(timeout=0) is None, "Nothing to render without the frame"
+
+
+class EndlessVideo(ListCapture):
+    """Like a video file: stays opened after the last frame and keeps failing reads."""
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        if not self.frames:
+            return False, None
+        return super().read(image)
+
+
+def test_pipeline_ends_after_empty_reads():
+    """max_empty_reads ends a run on a source that never closes."""
+    options = MagicMock()
+    options.result_callback = None
+    pipeline = FramePipeline(EndlessVideo(["f0", "f1"]), convert=lambda frame: frame, max_empty_reads=1)
+    pipeline.bind(options)
+
+    rendered = []
+    pipeline.run(EchoLandmarker(options), lambda frame, result, timestamp_ms: rendered.append(frame))
+
+    assert rendered and pipeline.stats()["captured"] == 2
+
+
+def test_pipeline_returns_frames_to_pool():
+    """With a pool, frames are read into reused buffers and all returned at the end."""
+    options = MagicMock()
+    options.result_callback = None
+    frames = [np.full((6, 8, 3), value, dtype=np.uint8) for value in range(10)]
+    pool = BufferPool()
+    converted = []
+
+    def convert(frame, out):
+        out[:] = frame[..., ::-1]
+        converted.append(int(out[0, 0, 0]))
+        return int(frame[0, 0, 0])
+
+    pipeline = FramePipeline(ListCapture(frames), convert=convert, pool=pool)
+    pipeline.bind(options)
+    rendered = []
+    pipeline.run(EchoLandmarker(options), lambda frame, result, timestamp_ms: rendered.append(int(frame[0, 0, 0])))
+
+    assert rendered and converted
+    stats = pipeline.stats()
+    assert stats["pool_in_use"] == 0, "Every frame should be back in the pool"
+    assert stats["pool_allocations"] < 10, "Buffers should be reused"
+    assert stats["pool_reuses"] > 0
+
+
+class EveryOtherTracker:
+    """Tracker stand-in that tracks every second frame."""
+
+    def __init__(self):
+        self.count = 0
+        self.detected = []
+
+    def process(self, frame):
+        self.count += 1
+        return f"tracked-{frame}" if self.count % 2 == 0 else None
+
+    def detection_requested(self):
+        pass
+
+    def detection_dropped(self):
+        pass
+
+    def update_detection(self, frame, result):
+        self.detected.append(frame)
+
+
+class QueueSlot:
+    """Frame slot stand-in that hands out every queued frame in order."""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.dropped = 0
+
+    def get(self, timeout=None):
+        return self.items.pop(0) if self.items else None
+
+    def close(self):
+        pass
+
+    @property
+    def closed(self):
+        return not self.items
+
+
+def test_pipeline_skips_landmarker_for_tracked_frames():
+    """Tracked frames should be rendered without going through the landmarker."""
+    options = MagicMock()
+    options.result_callback = None
+    tracker = EveryOtherTracker()
+
+    pipeline = FramePipeline(MagicMock(), convert=lambda frame: frame, tracker=tracker)
+    pipeline.bind(options)
+    landmarker = EchoLandmarker(options)
+    pipeline.frames = QueueSlot(["f0", "f1", "f2", "f3"])
+
+    pipeline._inference_loop(landmarker)
+
+    assert pipeline.tracked == 2
+    assert len(landmarker.timestamps) == 2
+    assert tracker.detected == ["f0", "f2"]
+    assert pipeline.results.get(timeout=0)[1] == "tracked-f3"
+
+
+class ClosingLandmarker(EchoLandmarker):
+    """EchoLandmarker that remembers being closed."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_pipeline_swaps_in_replacement_landmarker():
+    """A replacement takes over at the next frame and is closed by the pipeline, the original is not."""
+    options = MagicMock()
+    options.result_callback = None
+    original, replacement = ClosingLandmarker(options), ClosingLandmarker(options)
+    pipeline = FramePipeline(ListCapture(["f0", "f1"]), convert=lambda frame: frame)
+    pipeline.bind(options)
+    pipeline.replace_landmarker(replacement)
+
+    pipeline.run(original, lambda frame, result, timestamp_ms: None)
+
+    assert not original.timestamps and replacement.timestamps
+    assert replacement.closed and not original.closed
+    assert pipeline.stats()["landmarker_swaps"] == 1
+
+
+def test_pipeline_scales_input_and_reuses_results_between_strides():
+    """input_scale shrinks what is converted; inference_stride reuses the last result in between."""
+    options = MagicMock()
+    options.result_callback = None
+    sizes = []
+
+    def convert(frame):
+        sizes.append(frame.shape[:2])
+        return "image"
+
+    frames = [np.zeros((40, 60, 3), dtype=np.uint8) for _ in range(6)]
+    pipeline = FramePipeline(ListCapture(frames), convert=convert)
+    pipeline.bind(options)
+    pipeline.input_scale = 0.5
+    pipeline.inference_stride = 3
+    landmarker = EchoLandmarker(options)
+    # One frame at a time so none is dropped between capture and inference
+    pipeline.frames.put = lambda frame: LatestSlot.put(pipeline.frames, frame) or time.sleep(0.02)
+
+    pipeline.run(landmarker, lambda frame, result, timestamp_ms: None)
+
+    assert sizes and set(sizes) == {(20, 30)}
+    assert len(landmarker.timestamps) == 2 and pipeline.stats()["reused"] == 4
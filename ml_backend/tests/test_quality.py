@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+from unittest.mock import MagicMock
+from ml_backend.quality import (QUALITY_LEVELS, LandmarkerRebuilder, QualityController, QualityLevel,
+                                landmarker_options)
+
+
+@dataclass
+class Options:
+    """The FaceLandmarkerOptions fields a quality level can change."""
+    num_faces: int = 1
+    output_face_blendshapes: bool = False
+    output_facial_transformation_matrixes: bool = False
+
+
+# Feeds one window of frames at fps whose slowest stage takes stage_ms, returns the end time
+def run_window(controller, start, stage_ms, fps=10.0, latency_ms=20.0):
+    frames = int(controller.window_s * fps)
+    for i in range(1, frames + 1):
+        now = start + i / fps
+        controller.record("capture", 0.5)
+        controller.record("inference", stage_ms / 1000.0)
+        controller.frame_rendered(now * 1000.0 - latency_ms, now=now)
+    return start + frames / fps
+
+
+def started_controller(**kwargs):
+    controller = QualityController(target_fps=20.0, window_s=1.0, **kwargs)
+    controller.frame_rendered(0.0, now=0.0)
+    return controller
+
+
+def test_controller_degrades_after_consecutive_slow_windows():
+    """A stage slower than the frame budget lowers quality only after degrade_after windows."""
+    changes = []
+    controller = started_controller(degrade_after=2, on_change=lambda level, previous, reason: changes.append(level))
+
+    now = run_window(controller, 0.0, stage_ms=80.0)
+    assert controller.index == 0, "One slow window should not change the level"
+    now = run_window(controller, now, stage_ms=80.0)
+
+    assert controller.level is QUALITY_LEVELS[1] and changes == [QUALITY_LEVELS[1]]
+    stats = controller.stats()
+    assert stats["degrades"] == 1 and stats["load"] > 1.0
+
+
+def test_controller_ignores_capture_and_camera_limited_rate():
+    """A slow camera with cheap stages is not a reason to lower quality."""
+    controller = started_controller(degrade_after=1)
+    now = 0.0
+    for _ in range(4):
+        now = run_window(controller, now, stage_ms=5.0, fps=10.0)
+
+    assert controller.index == 0 and controller.load < 1.0
+
+
+def test_controller_upgrades_only_with_headroom():
+    """Quality comes back after upgrade_after windows with headroom, not when it just fits."""
+    controller = started_controller(degrade_after=1, upgrade_after=2, headroom=1.25)
+    now = run_window(controller, 0.0, stage_ms=80.0)
+    assert controller.index == 1
+
+    # Settling window, then windows that fit the 50 ms budget without headroom
+    for _ in range(4):
+        now = run_window(controller, now, stage_ms=45.0)
+    assert controller.index == 1, "A level that only just fits should not flap"
+
+    for _ in range(2):
+        now = run_window(controller, now, stage_ms=10.0)
+    assert controller.index == 0 and controller.upgrades == 1
+
+
+def test_controller_holds_latency_budget():
+    """Frames reaching the sink too late lower quality even when the frame rate holds."""
+    controller = started_controller(max_latency_ms=100.0, degrade_after=1)
+    run_window(controller, 0.0, stage_ms=5.0, fps=25.0, latency_ms=250.0)
+
+    assert controller.index == 1 and controller.latency_ms > 100.0
+
+
+def test_controller_stops_at_the_last_level_and_forwards_timings():
+    """The controller never walks off the ladder and passes stage timings on to its timer."""
+    timer = MagicMock()
+    levels = (QualityLevel("a"), QualityLevel("b"))
+    controller = started_controller(levels=levels, degrade_after=1, timer=timer)
+    now = 0.0
+    for _ in range(5):
+        now = run_window(controller, now, stage_ms=80.0)
+
+    assert controller.level.name == "b" and controller.degrades == 1
+    timer.record.assert_any_call("inference", 0.08)
+    timer.counter.return_value.inc.assert_called_once()
+
+
+def test_landmarker_options_only_lower_the_configuration():
+    """Levels cap num_faces and switch outputs off, but never turn on what was off."""
+    configured = Options(num_faces=4, output_face_blendshapes=True)
+
+    assert landmarker_options(configured, QUALITY_LEVELS[0], 4) == configured
+    assert landmarker_options(configured, QUALITY_LEVELS[2], 4) == Options(2, True, False)
+    assert landmarker_options(configured, QUALITY_LEVELS[3], 4) == Options(1, False, False)
+
+
+def test_rebuilder_hands_new_landmarkers_to_the_pipeline():
+    """Rebuilds run in the background and end with the newest requested options."""
+    pipeline = MagicMock()
+    rebuilder = LandmarkerRebuilder(lambda options: f"landmarker-{options}", pipeline)
+
+    rebuilder.request("a")
+    rebuilder.join(timeout=1.0)
+    rebuilder.request("b")
+    rebuilder.join(timeout=1.0)
+
+    pipeline.replace_landmarker.assert_called_with("landmarker-b")
+    assert rebuilder.rebuilds == 2
+
+
+def test_controller_backs_off_from_a_level_it_had_to_leave_again():
+    """Re-entering a level that was just left again takes twice as many good windows."""
+    controller = started_controller(degrade_after=1, upgrade_after=1)
+    now = run_window(controller, 0.0, stage_ms=80.0)
+    now = run_window(controller, now, stage_ms=10.0)  # settling
+    now = run_window(controller, now, stage_ms=10.0)
+    assert controller.index == 0, "First upgrade after one good window"
+
+    now = run_window(controller, now, stage_ms=80.0)  # settling
+    now = run_window(controller, now, stage_ms=80.0)
+    assert controller.index == 1
+    for _ in range(2):
+        now = run_window(controller, now, stage_ms=10.0)
+    assert controller.index == 1, "The full level now needs two good windows"
+    now = run_window(controller, now, stage_ms=10.0)
+    assert controller.index == 0
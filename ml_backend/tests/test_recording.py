@@ -0,0 +1,66 @@
+import numpy as np
+from ml_backend.benchmark import canned_result
+from ml_backend.recording import Recorder, RecordingReader
+from ml_backend.rendering import LandmarkResult
+
+
+def test_round_trip_through_memory_map(tmp_path):
+    """Recorded results should read back through the memory-mapped reader."""
+    result = canned_result(num_faces=2)
+    empty = LandmarkResult([], [], [])
+    with Recorder(str(tmp_path), landmarks=True, chunk_frames=4) as recorder:
+        for frame in range(10):
+            recorder.record(result if frame % 3 else empty, 1000 + frame * 33, frame_index=frame)
+
+    reader = RecordingReader(str(tmp_path))
+
+    assert len(reader) == 10
+    assert list(reader.frame_indices) == list(range(10))
+    assert isinstance(reader.landmarks, np.memmap)
+    assert reader.landmarks.shape == (12, 478, 3)
+    assert reader.faces(0) == []
+    faces = reader.faces(1)
+    assert len(faces) == 2
+    assert np.allclose(faces[0], result.face_landmarks[0], atol=1e-3), "float16 keeps landmarks to ~1e-3"
+    assert np.allclose(reader.column("jawOpen")[reader.rows(1)], 0.5)
+    assert np.allclose(reader.matrices[0], np.eye(4))
+
+
+def test_reader_lookups(tmp_path):
+    """Results can be found by timestamp and by video frame index."""
+    with Recorder(str(tmp_path)) as recorder:
+        for frame in (0, 2, 4):
+            recorder.record(canned_result(), frame * 10, frame_index=frame)
+
+    reader = RecordingReader(str(tmp_path))
+
+    assert reader.find(25) == 1
+    assert reader.find(-1) == -1
+    assert reader.find_frame(4) == 2
+    assert reader.find_frame(3) == -1
+
+
+def test_recordings_append_and_skip_landmarks_by_default(tmp_path):
+    """Reopening appends, and by default only the small arrays are kept."""
+    for _ in range(2):
+        with Recorder(str(tmp_path)) as recorder:
+            for timestamp_ms in range(5):
+                recorder.record(canned_result(), timestamp_ms)
+
+    reader = RecordingReader(str(tmp_path))
+
+    assert len(reader) == 10
+    assert list(reader.frame_indices) == list(range(10))
+    assert reader.landmarks is None and reader.faces(0) == []
+    size = sum(path.stat().st_size for path in tmp_path.iterdir() if path.suffix != ".json")
+    assert size / len(reader) < 256, "Without landmarks a frame should take well under 256 bytes"
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    """record() must never block the landmarker callback."""
+    recorder = Recorder(str(tmp_path), max_pending=1)
+    for timestamp_ms in range(200):
+        recorder.record(canned_result(), timestamp_ms)
+    recorder.close()
+
+    assert recorder.recorded + recorder.dropped == 200
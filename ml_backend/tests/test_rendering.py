@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+from types import SimpleNamespace
+from ml_backend.rendering import OverlayRenderer, connection_edges, draw_landmarks, landmarks_to_array
+
+
+def make_face(count=478, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.3, 0.7, size=(count, 3)).astype(np.float32)
+
+
+def test_landmarks_to_array_from_landmark_list():
+    """MediaPipe landmark objects and arrays should give the same pixel coordinates."""
+    face = make_face(10)
+    landmark_list = [SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in face]
+
+    from_list = landmarks_to_array(landmark_list, 640, 480)
+    from_array = landmarks_to_array(face, 640, 480)
+
+    assert from_list.shape == (10, 2) and from_list.dtype == np.int32
+    assert np.array_equal(from_list, from_array)
+
+
+def test_draw_points_matches_cv2_circle():
+    """Batched point drawing should produce the same pixels as the per-point loop."""
+    face = make_face()
+    expected = np.zeros((480, 640, 3), dtype=np.uint8)
+    for x, y in landmarks_to_array(face, 640, 480):
+        cv2.circle(expected, (int(x), int(y)), 1, (0, 255, 0), -1)
+
+    frame = np.zeros_like(expected)
+    draw_landmarks(frame, [face], (0, 255, 0))
+
+    assert np.array_equal(frame, expected)
+
+
+def test_connection_edges_styles():
+    """Contour and mesh styles should map to MediaPipe's connection sets."""
+    assert connection_edges("contours").shape[1] == 2
+    assert len(connection_edges("mesh")) > len(connection_edges("contours"))
+
+
+def test_overlay_renderer_reuses_layer_when_still():
+    """Small landmark jitter should reuse the cached layer, large moves redraw it."""
+    face = make_face()
+    renderer = OverlayRenderer(style="contours", reuse_threshold=1.0)
+
+    first = renderer.draw(np.zeros((480, 640, 3), dtype=np.uint8), [face])
+    second = renderer.draw(np.zeros((480, 640, 3), dtype=np.uint8), [face + 0.0005])
+    assert renderer.redraws == 1 and renderer.reuses == 1
+    assert np.array_equal(first, second), "Reused layer should draw the same overlay"
+
+    renderer.draw(np.zeros((480, 640, 3), dtype=np.uint8), [face + 0.05])
+    assert renderer.redraws == 2
+
+
+def test_overlay_renderer_matches_direct_drawing():
+    """A freshly drawn cached layer should match drawing straight onto the frame."""
+    faces = [make_face(seed=1), make_face(seed=2)]
+    expected = np.zeros((480, 640, 3), dtype=np.uint8)
+    draw_landmarks(expected, faces, (255, 0, 0), style="mesh")
+
+    frame = OverlayRenderer(style="mesh", color=(255, 0, 0)).draw(np.zeros_like(expected), faces)
+
+    assert np.array_equal(frame, expected)
@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+import pytest
+from ml_backend.benchmark import canned_result
+from ml_backend.recording import Recorder, RecordingReader
+from ml_backend.rerender import import_batch_results, main, plan_render_units, render_unit, rerender
+
+
+def write_video(path, frames=30, width=160, height=120):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 30.0, (width, height))
+    for _ in range(frames):
+        writer.write(np.full((height, width, 3), 40, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+def write_recording(path, frames):
+    with Recorder(str(path), landmarks=True) as recorder:
+        for frame_index in frames:
+            recorder.record(canned_result(), frame_index * 33, frame_index=frame_index)
+    return str(path)
+
+
+def write_mask(path):
+    mask = np.zeros((64, 64, 4), dtype=np.uint8)
+    mask[..., 2] = 255
+    mask[..., 3] = 255
+    cv2.imwrite(str(path), mask)
+    return str(path)
+
+
+def test_plan_splits_every_job_into_ranges(tmp_path):
+    """Each mask and the overlay get their own frame ranges."""
+    video = write_video(tmp_path / "clip.mp4", frames=25)
+
+    units = plan_render_units(video, "rec", str(tmp_path), masks=["a.png", "b.png"], overlay="points", chunk_frames=10)
+
+    assert len(units) == 9
+    assert [(unit.start_frame, unit.end_frame) for unit in units[:3]] == [(0, 10), (10, 20), (20, 25)]
+    assert units[-1].overlay == "points" and units[-1].mask is None
+
+
+def test_render_unit_masks_recorded_faces(tmp_path):
+    """A unit should paint the mask where the recording says the face is, holding the last result."""
+    video = write_video(tmp_path / "clip.mp4", frames=12)
+    recording = write_recording(tmp_path / "rec", frames=[0, 5])
+    units = plan_render_units(video, recording, str(tmp_path), masks=[write_mask(tmp_path / "red.png")],
+                              chunk_frames=12)
+
+    output, rendered = render_unit(units[0])
+
+    assert rendered == 12
+    cap = cv2.VideoCapture(output)
+    for _ in range(8):
+        ret, frame = cap.read()
+    cap.release()
+    assert ret
+    center = frame[60, 80]
+    assert center[2] > 150 and center[0] < 100, "Face center should be covered by the red mask"
+
+
+def test_rerender_joins_parts_per_mask(tmp_path):
+    """Parts rendered in worker processes are joined into one video per mask."""
+    video = write_video(tmp_path / "clip.mp4", frames=20)
+    recording = write_recording(tmp_path / "rec", frames=range(20))
+    mask = write_mask(tmp_path / "red.png")
+
+    outputs = rerender(video, recording, str(tmp_path / "out"), masks=[mask], overlay="points", workers=2,
+                       chunk_frames=8)
+
+    assert [path.rsplit("/", 1)[-1] for path in outputs] == ["clip.red.mp4", "clip.points.mp4"]
+    for output in outputs:
+        cap = cv2.VideoCapture(output)
+        assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 20
+        cap.release()
+    assert not list((tmp_path / "out").glob("*.part*"))
+
+
+def test_import_batch_results(tmp_path):
+    """Batch .npz units should become one recording keyed by frame index."""
+    for start in (0, 3):
+        np.savez(tmp_path / f"clip.frames{start:07d}.npz",
+                 frame_index=np.arange(start, start + 3), timestamp_ms=np.arange(start, start + 3) * 33,
+                 face_count=np.array([1, 0, 1], dtype=np.int16),
+                 landmarks=np.full((2, 478, 3), 0.5, dtype=np.float32),
+                 blendshapes=np.zeros((2, 52), dtype=np.float32), matrices=np.zeros((2, 4, 4), dtype=np.float32))
+
+    reader = RecordingReader(import_batch_results(str(tmp_path), "clip.mp4", str(tmp_path / "rec")))
+
+    assert list(reader.frame_indices) == [0, 1, 2, 3, 4, 5] and reader.meta["video_frames"]
+    assert reader.faces(1) == [] and np.allclose(reader.faces(5)[0], 0.5)
+
+
+def test_live_recordings_are_refused(tmp_path):
+    """A live recording counts results, not video frames, so it cannot drive a re-render."""
+    video = write_video(tmp_path / "clip.mp4", frames=5)
+    recording = write_recording(tmp_path / "rec", frames=range(5))
+
+    with pytest.raises(SystemExit):
+        main([video, "--recording", recording, "--overlay", "mesh", "-o", str(tmp_path / "out")])
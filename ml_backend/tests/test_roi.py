@@ -0,0 +1,74 @@
+import numpy as np
+from types import SimpleNamespace
+from ml_backend.roi import Roi, RoiSelector, map_landmarks_to_frame, map_result_to_frame
+from ml_backend.tests.test_masking import canonical_face
+
+
+def test_map_landmarks_round_trip():
+    """Landmarks normalized to a crop should map back to their frame position."""
+    face = canonical_face(640, 480)
+    roi = Roi(200, 100, 240, 240, 640, 480)
+    in_crop = face.copy()
+    in_crop[:, 0] = (face[:, 0] * 640 - roi.x0) / roi.width
+    in_crop[:, 1] = (face[:, 1] * 480 - roi.y0) / roi.height
+    in_crop[:, 2] = face[:, 2] * 640 / roi.width
+
+    assert np.allclose(map_landmarks_to_frame(in_crop, roi), face, atol=1e-5)
+
+
+def test_map_result_keeps_blendshapes():
+    """Mapping a result should only touch the landmarks."""
+    result = SimpleNamespace(face_landmarks=[np.zeros((478, 3), dtype=np.float32)],
+                             face_blendshapes=["scores"], facial_transformation_matrixes=["matrix"])
+
+    mapped = map_result_to_frame(result, Roi(10, 20, 100, 100, 640, 480))
+
+    assert np.allclose(mapped.face_landmarks[0][0], (10 / 640, 20 / 480, 0))
+    assert mapped.face_blendshapes == ["scores"]
+
+
+def test_selector_crops_around_faces():
+    """After a detection the next frames should be cropped around the face."""
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    face = canonical_face(640, 480)
+    selector = RoiSelector(max_side=128)
+
+    assert selector.plan(frame) is None, "Nothing known yet, search the whole frame"
+    selector.update([face], 640, 480)
+    roi = selector.plan(frame)
+
+    points = face[:, :2] * (640, 480)
+    assert roi.x0 <= points[:, 0].min() and points[:, 0].max() <= roi.x0 + roi.width
+    assert roi.y0 <= points[:, 1].min() and points[:, 1].max() <= roi.y0 + roi.height
+    assert max(selector.crop(frame, roi).shape[:2]) <= 128
+
+
+def test_selector_keeps_region_while_face_fits():
+    """Small moves should keep the same region, large moves should re-center it."""
+    face = canonical_face(640, 480)
+    selector = RoiSelector()
+    selector.update([face], 640, 480)
+    first = selector.roi
+
+    nudged = face.copy()
+    nudged[:, 0] += 2 / 640
+    selector.update([nudged], 640, 480)
+    assert selector.roi == first
+
+    moved = face.copy()
+    moved[:, 0] -= 150 / 640
+    selector.update([moved], 640, 480)
+    assert selector.roi != first
+
+
+def test_selector_falls_back_to_full_frame():
+    """Losing the face or reaching full_frame_every should search the whole frame."""
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    selector = RoiSelector(full_frame_every=3)
+    selector.update([canonical_face(640, 480)], 640, 480)
+
+    plans = [selector.plan(frame) for _ in range(3)]
+    assert plans[0] is not None and plans[1] is not None and plans[2] is None
+
+    selector.update([], 640, 480)
+    assert selector.plan(frame) is None
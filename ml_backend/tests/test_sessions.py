@@ -0,0 +1,144 @@
+import socket
+import struct
+import threading
+import time
+import cv2
+import numpy as np
+from ml_backend.rendering import LandmarkResult
+from ml_backend.sessions import LandmarkerPool, SessionManager, SocketSource
+
+
+class FrameCapture:
+    """Capture stand-in yielding frames filled with a session-specific value."""
+
+    def __init__(self, value, count):
+        self.frames = [np.full((4, 4, 3), value, dtype=np.uint8) for _ in range(count)]
+
+    def isOpened(self):
+        return bool(self.frames)
+
+    def read(self):
+        time.sleep(0.001)
+        return True, self.frames.pop(0)
+
+    def release(self):
+        pass
+
+
+class IdleCapture:
+    """Capture stand-in that stays open but never delivers a frame."""
+
+    def __init__(self):
+        self.open = True
+
+    def isOpened(self):
+        return self.open
+
+    def read(self):
+        time.sleep(0.005)
+        return False, None
+
+    def release(self):
+        self.open = False
+
+
+class FileCapture(FrameCapture):
+    """Capture stand-in that stays open after its last frame, like a video file in OpenCV."""
+
+    def __init__(self, value, count):
+        super().__init__(value, count)
+        self.empty_reads = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        if self.frames:
+            return super().read()
+        self.empty_reads += 1
+        return False, None
+
+
+class ValueLandmarker:
+    """Landmarker stand-in whose result records which frame it saw."""
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def detect(self, image):
+        with ValueLandmarker.lock:
+            ValueLandmarker.active += 1
+            ValueLandmarker.peak = max(ValueLandmarker.peak, ValueLandmarker.active)
+        time.sleep(0.002)
+        with ValueLandmarker.lock:
+            ValueLandmarker.active -= 1
+        return LandmarkResult(int(image[0, 0, 0]), None, None)
+
+
+def test_sessions_get_their_own_results():
+    """Every session should only see results computed on its own frames."""
+    pool = LandmarkerPool(size=2, factory=ValueLandmarker)
+    manager = SessionManager(pool, workers=4, convert=lambda frame: frame)
+    for value in (10, 20, 30):
+        manager.add(f"s{value}", FrameCapture(value, 20))
+
+    seen = {}
+
+    def render(session, frame, result):
+        assert result.face_landmarks == frame[0, 0, 0]
+        seen.setdefault(session.session_id, set()).add(result.face_landmarks)
+
+    manager.run(render)
+
+    assert seen == {"s10": {10}, "s20": {20}, "s30": {30}}
+    assert pool.created <= 2, "Pool should never grow past its size"
+    assert ValueLandmarker.peak <= 2
+
+
+def test_idle_sessions_cost_no_inference():
+    """A stream without frames should never be scheduled."""
+    manager = SessionManager(LandmarkerPool(size=1, factory=ValueLandmarker), workers=1, convert=lambda frame: frame)
+    idle_capture = IdleCapture()
+    idle = manager.add("idle", idle_capture)
+    busy = manager.add("busy", FrameCapture(5, 10))
+
+    def render(session, frame, result):
+        if not busy.frames.closed:
+            return None
+        idle_capture.release()
+
+    manager.run(render)
+
+    assert idle.processed == 0
+    assert busy.processed > 0
+
+
+def test_file_session_ends_at_end_of_file():
+    """A finite source with max_empty_reads ends its session, so run() returns."""
+    manager = SessionManager(LandmarkerPool(size=1, factory=ValueLandmarker), workers=1, convert=lambda frame: frame)
+    capture = FileCapture(7, 5)
+    session = manager.add("clip", capture, max_empty_reads=1)
+
+    finished = threading.Event()
+    runner = threading.Thread(target=lambda: (manager.run(lambda *_: None), finished.set()), daemon=True)
+    runner.start()
+
+    assert finished.wait(5.0), "run() should return once the file has ended"
+    assert session.captured == 5 and capture.empty_reads == 1
+
+
+def test_socket_source_reads_pushed_frames():
+    """Length-prefixed images sent to the socket should come out as frames."""
+    source = SocketSource(0)
+    frame = np.full((8, 8, 3), 200, dtype=np.uint8)
+    data = cv2.imencode(".png", frame)[1].tobytes()
+
+    with socket.create_connection(("127.0.0.1", source.port)) as client:
+        client.sendall(struct.pack(">I", len(data)) + data)
+        ret, received = source.read()
+
+    assert ret
+    assert np.array_equal(received, frame)
+    source.release()
+    assert not source.isOpened()
@@ -0,0 +1,101 @@
+import socket
+import time
+import cv2
+import numpy as np
+import pytest
+from ml_backend.sessions import SocketSource
+from ml_backend.sinks import FileSink, NullSink, SocketSink, TeeSink, WindowSink, open_sink
+
+
+def frame(value):
+    return np.full((48, 64, 3), value, dtype=np.uint8)
+
+
+def test_open_sink_parses_specs(tmp_path):
+    """Command line specs map to the matching sink."""
+    assert isinstance(open_sink("null"), NullSink)
+    assert isinstance(open_sink("window"), WindowSink)
+    assert open_sink(f"file:{tmp_path}/a.avi").path == f"{tmp_path}/a.avi"
+    assert isinstance(open_sink(str(tmp_path / "b.mp4")), FileSink)
+    assert open_sink("tcp://127.0.0.1:9000").address == ("127.0.0.1", 9000)
+    with pytest.raises(ValueError):
+        open_sink("tcp://nowhere")
+    with pytest.raises(ValueError):
+        open_sink("screen")
+
+
+def test_file_sink_writes_every_frame(tmp_path):
+    """Frames written to a FileSink come back out of the video file."""
+    path = str(tmp_path / "out.avi")
+    sink = FileSink(path, fourcc="MJPG")
+    for value in (0, 128, 255):
+        assert sink.write(frame(value))
+    sink.close()
+
+    cap = cv2.VideoCapture(path)
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 3
+    cap.release()
+
+
+def test_socket_sink_feeds_a_socket_source():
+    """SocketSink speaks the same framing as sessions.SocketSource."""
+    source = SocketSource(0)
+    sink = SocketSink("127.0.0.1", source.port, quality=95)
+    try:
+        assert sink.write(frame(200))
+        ret, received = source.read()
+        assert ret and received.shape == (48, 64, 3)
+        assert abs(int(received.mean()) - 200) <= 2
+    finally:
+        sink.close()
+        source.release()
+
+
+def test_socket_sink_without_listener_drops_frames():
+    """A missing listener never stops the pipeline."""
+    source = SocketSource(0)
+    port = source.port
+    source.release()
+
+    sink = SocketSink("127.0.0.1", port, retry_interval=60)
+    assert sink.write(frame(0)) and sink.write(frame(0))
+    sink.close()
+    assert sink.dropped == 2 and sink.sent == 0
+
+
+def test_stalled_listener_does_not_block_writes():
+    """A listener that never reads only loses frames; write() returns at once."""
+    server = socket.create_server(("127.0.0.1", 0))
+    server.settimeout(5)
+    sink = SocketSink("127.0.0.1", server.getsockname()[1], send_timeout=0.2)
+    # The sender connects when it picks up its first frame
+    sink.write(frame(0))
+    client, _ = server.accept()
+    noise = np.random.default_rng(0).integers(0, 256, size=(720, 1280, 3), dtype=np.uint8)
+    try:
+        slowest = 0.0
+        for _ in range(50):
+            start = time.perf_counter()
+            assert sink.write(noise)
+            slowest = max(slowest, time.perf_counter() - start)
+            time.sleep(0.005)
+        assert slowest < 0.1, f"write() blocked for {slowest:.3f} s"
+    finally:
+        sink.close()
+        client.close()
+        server.close()
+    assert sink.dropped > 0
+
+
+def test_tee_sink_writes_to_all_and_stops_when_one_asks():
+    """Every sink gets the frame even after one of them asked to stop."""
+    class Stopper(NullSink):
+        def write(self, frame):
+            super().write(frame)
+            return False
+
+    first, stopper, last = NullSink(), Stopper(), NullSink()
+    tee = TeeSink([first, stopper, last])
+
+    assert tee.write(frame(0)) is False
+    assert (first.frames, stopper.frames, last.frames) == (1, 1, 1)
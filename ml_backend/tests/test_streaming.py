@@ -0,0 +1,125 @@
+import json
+import time
+import socket
+import threading
+import urllib.error
+import urllib.request
+import cv2
+import numpy as np
+import pytest
+from ml_backend.metrics import MetricsRegistry
+from ml_backend.streaming import StreamProfile, StreamServer, encode_frame
+from ml_backend.tests.test_metrics import parse_exposition
+
+
+def frame(value, width=1280, height=720):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def server():
+    server = StreamServer(port=0).start()
+    yield server
+    server.close()
+
+
+# Reads the first multipart image of a stream while frames keep being written
+def first_streamed_image(server, path):
+    stop = threading.Event()
+
+    def feed():
+        value = 0
+        while not stop.is_set():
+            server.write(frame(value % 256))
+            value += 1
+            time.sleep(0.01)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("multipart/x-mixed-replace")
+            assert response.readline().strip() == b"--frame"
+            headers = {}
+            while True:
+                line = response.readline().strip()
+                if not line:
+                    break
+                name, _, value = line.decode().partition(": ")
+                headers[name] = value
+            data = response.read(int(headers["Content-Length"]))
+    finally:
+        stop.set()
+        feeder.join()
+    return headers["Content-Type"], cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_encode_frame_downscales_and_keeps_aspect_ratio():
+    """A profile width smaller than the frame scales it down, never up."""
+    image = cv2.imdecode(np.frombuffer(encode_frame(frame(90), StreamProfile(70, width=320)), np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (180, 320, 3)
+
+    image = cv2.imdecode(np.frombuffer(encode_frame(frame(90, 200, 100), StreamProfile(70, width=320, format="webp")),
+                                       np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (100, 200, 3)
+
+
+def test_frames_are_only_encoded_while_someone_watches(server):
+    """Without viewers write() neither copies nor encodes anything."""
+    for _ in range(5):
+        server.write(frame(0))
+    time.sleep(0.1)
+
+    stats = server.stats()
+    assert stats["received"] == 5
+    assert stats["profile"]["full"]["encoded"] == 0 and stats["profile"]["preview"]["encoded"] == 0
+
+
+def test_stream_serves_multipart_frames_per_profile(server):
+    """Each profile streams at its own resolution and format."""
+    content_type, image = first_streamed_image(server, "/stream/preview")
+    assert content_type == "image/jpeg" and image.shape == (360, 640, 3)
+
+    content_type, image = first_streamed_image(server, "/stream?format=webp&width=320&quality=50")
+    assert content_type == "image/webp" and image.shape == (180, 320, 3)
+
+    profiles = json.load(urllib.request.urlopen(f"http://127.0.0.1:{server.port}/profiles"))
+    assert profiles["preview"] == {"quality": 60, "width": 640, "format": "jpeg"}
+
+    # Ad-hoc profiles end up in a label, not in the metric names
+    registry = MetricsRegistry()
+    registry.add_collector("sink0", server.stats)
+    samples = parse_exposition(registry.render())
+    assert 'ml_sink0_encoded{profile="webp-q50-w320"}' in samples
+
+
+def test_bad_requests_are_rejected(server):
+    """Unknown profiles and invalid parameters get HTTP errors."""
+    for path, status in (("/stream/missing", 404), ("/stream?format=gif", 400), ("/stream?quality=abc", 400),
+                         ("/nothing", 404)):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=5)
+        assert error.value.code == status
+
+
+def test_stalled_client_does_not_slow_down_writes(server):
+    """A viewer that never reads only loses frames; write() stays cheap."""
+    client = socket.create_connection(("127.0.0.1", server.port))
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    client.sendall(b"GET /stream/full HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    try:
+        deadline = time.monotonic() + 2
+        while server.stats()["profile"]["full"]["viewers"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        noise = np.random.default_rng(0).integers(0, 256, size=(720, 1280, 3), dtype=np.uint8)
+        slowest = 0.0
+        for _ in range(100):
+            start = time.perf_counter()
+            server.write(noise)
+            slowest = max(slowest, time.perf_counter() - start)
+            time.sleep(0.002)
+        assert slowest < 0.05
+        assert server.stats()["skipped"] > 0
+    finally:
+        client.close()
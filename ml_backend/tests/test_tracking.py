@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+from types import SimpleNamespace
+from ml_backend.tests.test_masking import canonical_face
+from ml_backend.rendering import LandmarkResult
+from ml_backend.tracking import LandmarkTracker
+
+
+def textured_frame(shift=(0.0, 0.0), size=(480, 640)):
+    """Smooth random texture, shifted by a sub-pixel translation."""
+    rng = np.random.default_rng(0)
+    noise = cv2.GaussianBlur(rng.integers(0, 255, size=size).astype(np.uint8), (0, 0), 3)
+    noise = cv2.normalize(noise, None, 0, 255, cv2.NORM_MINMAX)
+    matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+    gray = cv2.warpAffine(noise, matrix, (size[1], size[0]), borderMode=cv2.BORDER_REFLECT)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def detection(face):
+    return SimpleNamespace(face_landmarks=[face], face_blendshapes=["blendshapes"], facial_transformation_matrixes=None)
+
+
+def test_tracker_follows_translation():
+    """Tracked landmarks should move with the image content."""
+    face = canonical_face()
+    tracker = LandmarkTracker(min_interval=3, max_interval=3)
+    tracker.update_detection(textured_frame(), detection(face))
+
+    result = tracker.process(textured_frame(shift=(4.0, -2.0)))
+
+    assert isinstance(result, LandmarkResult)
+    moved = (result.face_landmarks[0][:, :2] - face[:, :2]) * (640, 480)
+    assert np.allclose(moved, (4.0, -2.0), atol=0.5)
+    assert result.face_blendshapes == ["blendshapes"], "Blendshapes come from the last detection"
+
+
+def test_tracker_requests_detection_when_due():
+    """After `interval` tracked frames the next frame should go to the landmarker."""
+    tracker = LandmarkTracker(min_interval=2, max_interval=2)
+    tracker.update_detection(textured_frame(), detection(canonical_face()))
+
+    assert tracker.process(textured_frame()) is not None
+    assert tracker.process(textured_frame()) is not None
+    assert tracker.process(textured_frame()) is None
+
+    tracker.detection_requested()
+    assert tracker.process(textured_frame()) is not None, "Keep tracking while the detection is pending"
+
+
+def test_tracker_gives_up_on_lost_face():
+    """A frame with unrelated content should fail tracking and force a detection."""
+    tracker = LandmarkTracker(min_interval=5, max_interval=5)
+    tracker.update_detection(textured_frame(), detection(canonical_face()))
+
+    assert tracker.process(np.zeros((480, 640, 3), dtype=np.uint8)) is None
+    assert tracker.process(textured_frame()) is None, "Stay lost until the next detection"
+
+
+def test_tracker_adapts_interval_to_motion():
+    """Slow motion should allow longer detection intervals than fast motion."""
+    tracker = LandmarkTracker(min_interval=1, max_interval=6, slow_motion=0.5, fast_motion=6.0)
+
+    tracker.motion = 0.1
+    tracker._adapt_interval()
+    assert tracker.interval == 6
+
+    tracker.motion = 10.0
+    tracker._adapt_interval()
+    assert tracker.interval == 1
+
+
+def test_tracker_without_faces_always_detects():
+    """With no detected face there is nothing to track."""
+    tracker = LandmarkTracker()
+    tracker.update_detection(textured_frame(), SimpleNamespace(face_landmarks=[], face_blendshapes=[], facial_transformation_matrixes=[]))
+
+    assert tracker.process(textured_frame()) is None
@@ -0,0 +1,161 @@
+import threading
+import cv2
+import numpy as np
+from ml_backend.rendering import LandmarkResult, landmarks_to_normalized
+
+# Landmarks that move rigidly with the head: eye corners, nose bridge and tip,
+# brow ends, forehead, cheeks and jaw line. Mouth and eyelids are left out.
+STABLE_LANDMARKS = np.array([
+    33, 133, 362, 263, 168, 6, 197, 195, 5, 4, 1, 98, 327,
+    70, 300, 105, 334, 10, 151, 9, 234, 454, 93, 323,
+    132, 361, 58, 288, 172, 397, 152, 148, 377, 116, 345,
+], dtype=np.intp)
+
+
+class LandmarkTracker:
+    """Propagates the last detected landmarks with optical flow between detections.
+
+    Only STABLE_LANDMARKS are tracked with pyramidal Lucas-Kanade. A similarity
+    transform (or full affine) is fitted to them with RANSAC and applied to all
+    landmarks. The detection interval shrinks when the face moves quickly and grows
+    back when it holds still. A detection is requested right away when the inlier
+    ratio drops below min_confidence.
+    """
+
+    def __init__(self, min_interval=1, max_interval=6, slow_motion=0.5, fast_motion=6.0,
+                 min_confidence=0.6, transform="similarity"):
+        if transform not in ("similarity", "affine"):
+            raise ValueError(f"invalid transform: {transform}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slow_motion = slow_motion
+        self.fast_motion = fast_motion
+        self.min_confidence = min_confidence
+        self.transform = transform
+
+        self.interval = min_interval
+        self.frames_since_detection = 0
+        self.confidence = 0.0
+        self.motion = 0.0
+
+        self._lock = threading.Lock()
+        self._gray = None
+        self._faces = None
+        self._detected = None
+        self._pending = False
+        self._lost = True
+
+        self.detections = 0
+        self.tracked = 0
+
+    def _to_gray(self, frame):
+        return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    # Called with every detection result and the frame it was computed on
+    def update_detection(self, frame, result):
+        faces = [landmarks_to_normalized(face) for face in (result.face_landmarks or [])]
+        gray = self._to_gray(frame) if faces else None
+        with self._lock:
+            self._pending = False
+            self._gray = gray
+            self._faces = faces or None
+            self._detected = result
+            self._lost = not faces
+            self.frames_since_detection = 0
+            self.detections += 1
+
+    # The landmarker was given a frame whose result will arrive later
+    def detection_requested(self):
+        with self._lock:
+            self._pending = True
+
+    def detection_dropped(self):
+        with self._lock:
+            self._pending = False
+
+    # Returns a LandmarkResult for this frame, or None when it should be detected instead.
+    # Blendshapes and matrices are carried over from the last detection.
+    def process(self, frame):
+        with self._lock:
+            if self._faces is None or self._lost:
+                return None
+            due = self.frames_since_detection >= self.interval
+            if due and not self._pending:
+                return None
+            previous_gray, previous_faces, detected = self._gray, self._faces, self._detected
+
+        gray = self._to_gray(frame)
+        height, width = gray.shape[:2]
+        tracked_faces, confidences, motions = [], [], []
+        for face in previous_faces:
+            tracked = self._track_face(previous_gray, gray, face, width, height)
+            if tracked is None:
+                with self._lock:
+                    self._lost = True
+                    self.confidence = 0.0
+                return None
+            landmarks, confidence, motion = tracked
+            tracked_faces.append(landmarks)
+            confidences.append(confidence)
+            motions.append(motion)
+
+        with self._lock:
+            self._gray = gray
+            self._faces = tracked_faces
+            self.frames_since_detection += 1
+            self.confidence = min(confidences)
+            self.motion = max(motions)
+            self._adapt_interval()
+            self.tracked += 1
+
+        return LandmarkResult(tracked_faces, detected.face_blendshapes, detected.facial_transformation_matrixes)
+
+    def _track_face(self, previous_gray, gray, face, width, height):
+        scale = np.array((width, height), dtype=np.float32)
+        stable = face[STABLE_LANDMARKS, :2] * scale
+
+        # Flow only needs the area around the face, which keeps the pyramids small
+        margin = 0.25 * (stable.max(axis=0) - stable.min(axis=0)) + 24
+        x0, y0 = np.maximum(np.floor(stable.min(axis=0) - margin), 0).astype(int)
+        x1, y1 = np.minimum(np.ceil(stable.max(axis=0) + margin), (width, height)).astype(int)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+        offset = np.array((x0, y0), dtype=np.float32)
+
+        previous_points = np.ascontiguousarray(stable - offset, dtype=np.float32).reshape(-1, 1, 2)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            previous_gray[y0:y1, x0:x1], gray[y0:y1, x0:x1], previous_points, None, winSize=(21, 21), maxLevel=3,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+        )
+        found = status.ravel() == 1
+        if found.sum() < 4:
+            return None
+
+        source, target = previous_points[found] + offset, next_points[found] + offset
+        if self.transform == "similarity":
+            matrix, inliers = cv2.estimateAffinePartial2D(source, target, method=cv2.RANSAC, ransacReprojThreshold=2.0)
+        else:
+            matrix, inliers = cv2.estimateAffine2D(source, target, method=cv2.RANSAC, ransacReprojThreshold=2.0)
+        if matrix is None:
+            return None
+
+        confidence = float(inliers.sum()) / len(STABLE_LANDMARKS)
+        if confidence < self.min_confidence:
+            return None
+
+        # Move every landmark with the fitted transform, z scales with the face
+        pixels = face[:, :2] * scale
+        moved = pixels @ matrix[:, :2].T + matrix[:, 2]
+        landmarks = np.empty_like(face)
+        landmarks[:, :2] = moved / scale
+        landmarks[:, 2] = face[:, 2] * np.sqrt(abs(np.linalg.det(matrix[:, :2])))
+
+        motion = float(np.median(np.linalg.norm((target - source).reshape(-1, 2), axis=1)))
+        return landmarks, confidence, motion
+
+    # Fast motion -> detect often, slow motion -> detect rarely
+    def _adapt_interval(self):
+        span = max(self.fast_motion - self.slow_motion, 1e-6)
+        speed = min(max((self.motion - self.slow_motion) / span, 0.0), 1.0)
+        target = self.max_interval - speed * (self.max_interval - self.min_interval)
+        self.interval = int(round(target))
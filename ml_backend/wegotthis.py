@@ -1,4 +1,4 @@
-import json
+import os
 import cv2
 import time
 import numpy as np
@@ -7,8 +7,10 @@ from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 from awscrt import mqtt
 from awsiot import mqtt_connection_builder
+from ml_backend.commands import CommandQueue
+from ml_backend.rendering import draw_landmarks
 
-model_path = "models/face_landmarker.task"
+model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "face_landmarker.task")
 
 BaseOptions = mp.tasks.BaseOptions
 FaceLandmarker = mp.tasks.vision.FaceLandmarker
@@ -34,25 +36,14 @@ CERTIFICATE_PATH = "./certificates/eoh-certificate.pem.crt"
 PRIVATE_KEY_PATH = "./certificates/eoh-private.pem.key"
 ROOT_CA_PATH = "./certificates/AmazonRootCA1.pem"
 mqtt_connection = None
+commands = CommandQueue()
+COLORS = {"red": (0, 0, 255), "blue": (255, 0, 0), "green": (0, 255, 0)}
 
 if MQTT_TOPIC_ENABLED:
     print("TRYING TO CONNECT")
+    # Runs on the awscrt thread, messages are applied between frames in the loop below
     def on_message_received(topic, payload, **kwargs):
-        print("RECEIVED MESSAGE")
-        global color
-        print(f"Message received on topic {topic}: {payload}")
-        try:
-            event = json.loads(payload)
-            if "color" in event:
-                if event["color"] == "red":
-                    color = (0, 0, 255)
-                elif event["color"] == "blue":
-                    color = (255, 0, 0)
-                elif event["color"] == "green":
-                    color = (0, 255, 0)
-                print(f"Updated bounding box color: {color}")
-        except json.JSONDecodeError:
-            print("Error decoding JSON message")
+        commands.on_message(topic, payload, **kwargs)
 
     print("Connecting to AWS IoT...")
     mqtt_connection = mqtt_connection_builder.mtls_from_path(
@@ -110,12 +101,14 @@ with FaceLandmarker.create_from_options(options) as landmarker:
         landmarker.detect_async(mp_image, frame_timestamp_ms)
         time.sleep(0.01)
 
+        for command in commands.drain():
+            if command.request_type == "feature-change" and command.event["feature"] == "color":
+                color = COLORS.get(command.event.get("featureParam"), color)
+                print(f"Updated bounding box color: {color}")
+
         # Draw landmarks if detected
         if landmark_results and landmark_results.face_landmarks:
-            for face_landmarks in landmark_results.face_landmarks:
-                for landmark in face_landmarks:
-                    x, y = int(landmark.x * frame.shape[1]), int(landmark.y * frame.shape[0])
-                    cv2.circle(frame, (x, y), 1, color, -1)  # Draw dots for landmarks
+            draw_landmarks(frame, landmark_results.face_landmarks, color)  # Draw dots for landmarks
 
         cv2.imshow('MediaPipe Face Detection', frame)
 
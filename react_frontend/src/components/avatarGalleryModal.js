@@ -34,6 +34,7 @@ import "../styles/avatarGalleryModal.css";
 export default function AvatarGallery() {
   const navigate = useNavigate();
   const [avatars, setAvatars] = useState([]);
+  const [thumbnails, setThumbnails] = useState({});
   
   // Fetch avatars from API on component mount
   useEffect(() => {
@@ -46,6 +47,15 @@ export default function AvatarGallery() {
         const pngAvatars = data.masksUrls.filter(url => url.endsWith('.png'));
 
         setAvatars(pngAvatars);
+
+        // Show the small thumbnails made at upload time instead of the full-size masks
+        const thumbnailUrls = {};
+        (data.masks || []).forEach(mask => {
+          if (mask.thumbnailUrl) {
+            thumbnailUrls[mask.url] = mask.thumbnailUrl;
+          }
+        });
+        setThumbnails(thumbnailUrls);
       } catch (error) {
         console.error("Error fetching avatars:", error);
       }
@@ -95,7 +105,7 @@ export default function AvatarGallery() {
                 className="avatar-btn"
                 onClick={() => handleImageClick(avatar)} // Attach the click handler
               >
-                <img src={avatar} alt="avatar" className="avatar-image" />
+                <img src={thumbnails[avatar] || avatar} alt="avatar" className="avatar-image" />
               </button>
             ))
           ) : (
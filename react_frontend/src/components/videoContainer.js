@@ -2,11 +2,21 @@ import { useEffect, useRef, useState } from "react";
 import "../styles/videoContainer.css";
 import LiveFeedNavigation from "../components/liveFeedNavigation";
 
+// MJPEG stream of the masked video from ml_backend (--stream-port), e.g. http://localhost:8080/stream/preview
+const STREAM_URL = process.env.REACT_APP_STREAM_URL;
+
 export default function VideoContainer() {
   const videoRef = useRef(null);
   const [errorMessage, setErrorMessage] = useState("");
+  const [streamFailed, setStreamFailed] = useState(false);
+  const showStream = STREAM_URL && !streamFailed;
 
   useEffect(() => {
+    // The processed stream replaces the local camera preview
+    if (showStream) {
+      return;
+    }
+
     let stream;
     async function startCamera() {
       try {
@@ -29,13 +39,15 @@ export default function VideoContainer() {
         stream.getTracks().forEach(track => track.stop());
       }
     };
-  }, []);
+  }, [showStream]);
 
   return (
     <div className="parent">
       <div className="video-container">
         {/* rn its just regular video feed */}
-        {errorMessage ? (
+        {showStream ? (
+          <img src={STREAM_URL} alt="masked live feed" className="camera-feed" onError={() => setStreamFailed(true)} />
+        ) : errorMessage ? (
           <div className="video-placeholder">{errorMessage}</div>
         ) : (
           <video ref={videoRef} autoPlay playsInline className="camera-feed"></video>